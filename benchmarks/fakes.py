@@ -0,0 +1,182 @@
+"""In-process fakes of the Elasticsearch security API and the Kubernetes Secret API."""
+import asyncio
+import copy
+import sys
+import time
+from collections import Counter
+from contextlib import ExitStack, contextmanager
+from typing import Optional
+from unittest import mock
+
+from elasticsearch import NotFoundError
+from kubernetes.client import ApiClient
+from kubernetes.client.exceptions import ApiException
+
+
+class FakeSecurityClient:
+    """Fake of the ``_security/role``, ``_security/user``, ``_security/role_mapping`` and ``_security/api_key``
+    endpoints, which normalises documents as Elasticsearch does.
+    """
+
+    def __init__(self, calls: Counter, latency: float):
+        self.calls = calls
+        self.latency = latency
+        self.roles: dict[str, dict] = {}
+        self.users: dict[str, dict] = {}
+        self.role_mappings: dict[str, dict] = {}
+        self.api_keys: list[dict] = []
+
+    async def _request(self, api: str):
+        self.calls[api] += 1
+        await asyncio.sleep(self.latency)
+
+    async def get_role(self, name: Optional[str] = None, **_):
+        await self._request("security.get_role")
+        return self._get(self.roles, name)
+
+    async def put_role(self, name: str, body: dict, **_):
+        await self._request("security.put_role")
+        created = name not in self.roles
+        self.roles[name] = {**copy.deepcopy(body), "transient_metadata": {"enabled": True}}
+        return {"role": {"created": created}}
+
+    async def delete_role(self, name: str, **_):
+        await self._request("security.delete_role")
+        self._delete(self.roles, name)
+        return {"found": True}
+
+    async def get_user(self, username: Optional[str] = None, **_):
+        await self._request("security.get_user")
+        return self._get(self.users, username)
+
+    async def put_user(self, username: str, body: dict, **_):
+        await self._request("security.put_user")
+        created = username not in self.users
+        secrets = {"password", "password_hash"}
+        document = {key: value for key, value in copy.deepcopy(body).items() if key not in secrets}
+        defaults = {"roles": [], "metadata": {}, "enabled": True, "full_name": None, "email": None}
+        self.users[username] = {**defaults, **document, "username": username}
+        return {"created": created}
+
+    async def delete_user(self, username: str, **_):
+        await self._request("security.delete_user")
+        self._delete(self.users, username)
+        return {"found": True}
+
+    async def get_role_mapping(self, name: Optional[str] = None, **_):
+        await self._request("security.get_role_mapping")
+        return self._get(self.role_mappings, name)
+
+    async def put_role_mapping(self, name: str, body: dict, **_):
+        await self._request("security.put_role_mapping")
+        created = name not in self.role_mappings
+        self.role_mappings[name] = {"metadata": {}, **copy.deepcopy(body)}
+        return {"role_mapping": {"created": created}}
+
+    async def delete_role_mapping(self, name: str, **_):
+        await self._request("security.delete_role_mapping")
+        self._delete(self.role_mappings, name)
+        return {"found": True}
+
+    async def get_api_key(self, name: Optional[str] = None, **_):
+        await self._request("security.get_api_key")
+        keys = [copy.deepcopy(key) for key in self.api_keys if name is None or key["name"] == name]
+        return {"api_keys": keys}
+
+    async def create_api_key(self, body: dict, **_):
+        await self._request("security.create_api_key")
+        key = {
+            "id": f"id-{len(self.api_keys)}",
+            "name": body["name"],
+            "creation": len(self.api_keys),
+            "invalidated": False,
+            "metadata": copy.deepcopy(body.get("metadata", {})),
+        }
+        self.api_keys.append(key)
+        return {"id": key["id"], "name": key["name"], "api_key": f"secret-{key['id']}"}
+
+    async def invalidate_api_key(self, body: dict, **_):
+        await self._request("security.invalidate_api_key")
+        invalidated = []
+        for key in self.api_keys:
+            if not key["invalidated"] and (key["name"] == body.get("name") or key["id"] in body.get("ids", [])):
+                key["invalidated"] = True
+                invalidated.append(key["id"])
+        return {"invalidated_api_keys": invalidated}
+
+    @staticmethod
+    def _get(documents: dict[str, dict], names: Optional[str]) -> dict:
+        if names is None:
+            return copy.deepcopy(documents)
+        found = {name: copy.deepcopy(documents[name]) for name in names.split(",") if name in documents}
+        if not found:
+            raise NotFoundError(404, "resource_not_found_exception", {})
+        return found
+
+    @staticmethod
+    def _delete(documents: dict[str, dict], name: str):
+        if name not in documents:
+            raise NotFoundError(404, "resource_not_found_exception", {})
+        del documents[name]
+
+
+class FakeElasticsearch:
+    def __init__(self, calls: Counter, latency: float):
+        self.security = FakeSecurityClient(calls, latency)
+
+    async def close(self):
+        pass
+
+
+class FakeCoreV1Api:
+    """Fake of the Kubernetes Secret API. It is synchronous, like the real client, and called from threads."""
+
+    def __init__(self, calls: Counter, latency: float):
+        self.calls = calls
+        self.latency = latency
+        self.secrets: dict[tuple[str, str], dict] = {}
+        self.api_client = ApiClient()
+
+    def create_namespaced_secret(self, namespace: str, body: dict, **_):
+        self.calls["create_namespaced_secret"] += 1
+        time.sleep(self.latency)
+        key = (namespace, body["metadata"]["name"])
+        if key in self.secrets:
+            raise ApiException(status=409, reason="AlreadyExists")
+        self.secrets[key] = copy.deepcopy(body)
+        return body
+
+    def patch_namespaced_secret(self, name: str, namespace: str, body: dict, **_):
+        self.calls["patch_namespaced_secret"] += 1
+        time.sleep(self.latency)
+        try:
+            secret = self.secrets[(namespace, name)]
+        except KeyError:
+            raise ApiException(status=404, reason="NotFound")
+        secret["data"] = {**secret.get("data", {}), **body.get("data", {})}
+        return copy.deepcopy(secret)
+
+    def read_namespaced_secret(self, name: str, namespace: str, **_):
+        self.calls["read_namespaced_secret"] += 1
+        time.sleep(self.latency)
+        try:
+            return copy.deepcopy(self.secrets[(namespace, name)])
+        except KeyError:
+            raise ApiException(status=404, reason="NotFound")
+
+
+@contextmanager
+def fake_apis(elasticsearch: FakeElasticsearch, kubernetes: FakeCoreV1Api):
+    """Route every client obtained by the operator's modules to the fakes."""
+    factories = {
+        "async_elasticsearch_client": lambda *args, **kwargs: elasticsearch,
+        "kubernetes_client": lambda *args, **kwargs: kubernetes,
+    }
+    with ExitStack() as stack:
+        for name, module in list(sys.modules.items()):
+            if not name.startswith("elasticsearch_native_realm_operator"):
+                continue
+            for attribute, factory in factories.items():
+                if hasattr(module, attribute):
+                    stack.enter_context(mock.patch.object(module, attribute, factory))
+        yield
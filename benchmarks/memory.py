@@ -0,0 +1,88 @@
+"""Benchmark of the memory held per user by the security cache.
+
+Compares holding each user of a listing as a pydantic model, as the document returned by Elasticsearch, and
+as the compact record which the cache stores.
+
+Run with ``python -m benchmarks.memory``.
+"""
+import argparse
+import gc
+import json
+import tracemalloc
+from typing import Callable
+
+from elasticsearch_native_realm_operator.cache import DocumentCache
+from elasticsearch_native_realm_operator.compact import compact_user
+from elasticsearch_native_realm_operator.constants import MANAGED_BY_KEY
+from elasticsearch_native_realm_operator.resources.user import ElasticsearchNativeRealmUserSpecUser
+
+ROLE_POOL_SIZE = 200
+
+
+def user_listing(size: int, roles_per_user: int) -> bytes:
+    """A ``GET _security/user`` response body for a population of operator-managed users."""
+    users = {
+        f"user-{index}": {
+            "username": f"user-{index}",
+            "roles": [f"role-{(index + offset) % ROLE_POOL_SIZE}" for offset in range(roles_per_user)],
+            "full_name": f"User {index}",
+            "email": f"user-{index}@example.com",
+            "metadata": {MANAGED_BY_KEY: f"namespace-{index % 50}:ElasticsearchNativeRealmUser/user-{index}"},
+            "enabled": True,
+        }
+        for index in range(size)
+    }
+    return json.dumps(users).encode()
+
+
+def measure(build: Callable[[dict], object], listing: bytes) -> int:
+    """Measure the memory retained by the result of ``build``, given a freshly decoded listing."""
+    gc.collect()
+    tracemalloc.start()
+    before, _ = tracemalloc.get_traced_memory()
+    documents = json.loads(listing)
+    result = build(documents)
+    del documents
+    gc.collect()
+    after, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del result
+    return after - before
+
+
+def cache_of(compact: Callable[[dict], object]) -> Callable[[dict], DocumentCache]:
+    def build(documents: dict) -> DocumentCache:
+        cache = DocumentCache(ttl=60, maxsize=len(documents), compact=compact)
+        cache.replace_all(documents)
+        return cache
+
+    return build
+
+
+REPRESENTATIONS = {
+    "pydantic models": cache_of(lambda document: ElasticsearchNativeRealmUserSpecUser(**document)),
+    "documents": cache_of(lambda document: document),
+    "compact records": cache_of(compact_user),
+}
+
+
+def run(size: int, roles_per_user: int):
+    listing = user_listing(size, roles_per_user)
+    print(f"{size} users with {roles_per_user} roles each:")
+    print(f"  {'representation':<20} {'total':>10} {'per user':>10}")
+    for name, build in REPRESENTATIONS.items():
+        retained = measure(build, listing)
+        print(f"  {name:<20} {retained / 2**20:>8.1f}MB {retained / size:>9.0f}B")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--roles", type=int, default=3, help="Number of roles held by each user.")
+    args = parser.parse_args(argv)
+    for size in args.sizes:
+        run(size, args.roles)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+"""Microbenchmark of parsing and serialising large role resources.
+
+Run with ``python -m benchmarks.parsing``.
+"""
+import argparse
+import timeit
+
+from elasticsearch_native_realm_operator.resources.role import ElasticsearchNativeRealmRole
+
+
+def make_role_body(index_entries: int, resource_version: int = 1) -> dict:
+    return {
+        "apiVersion": f"{ElasticsearchNativeRealmRole.group}/v1",
+        "kind": ElasticsearchNativeRealmRole.names.kind,
+        "metadata": {
+            "name": "benchmark",
+            "namespace": "default",
+            "uid": "00000000-0000-0000-0000-000000000000",
+            "resourceVersion": str(resource_version),
+        },
+        "spec": {
+            "role": {
+                "name": "benchmark",
+                "cluster": ["monitor", "manage_ilm"],
+                "indices": [
+                    {
+                        "names": [f"index-{entry}-*", f"alias-{entry}"],
+                        "privileges": ["read", "view_index_metadata"],
+                        "field_security": {"grant": ["*"], "except": [f"secret-{entry}"]},
+                        "query": '{"term": {"public": true}}',
+                    }
+                    for entry in range(index_entries)
+                ],
+                "applications": [
+                    {"application": "kibana-.kibana", "privileges": ["read"], "resources": ["*"]},
+                ],
+            }
+        },
+    }
+
+
+def run(index_entries: int, number: int):
+    body = make_role_body(index_entries)
+    parsed = ElasticsearchNativeRealmRole(**body)
+    versions = iter(range(2, 2 + number * 10))
+
+    def parse_metadata_change():
+        body["metadata"]["resourceVersion"] = str(next(versions))
+        ElasticsearchNativeRealmRole.parse(body)
+
+    benchmarks = {
+        "validate": lambda: ElasticsearchNativeRealmRole(**body),
+        "parse (same version)": lambda: ElasticsearchNativeRealmRole.parse(body),
+        "parse (metadata change)": parse_metadata_change,
+        "serialise": lambda: parsed.spec.role.dict(exclude_none=True),
+    }
+    print(f"Role with {index_entries} index entries, best of 5 x {number} runs:")
+    for name, function in benchmarks.items():
+        best = min(timeit.repeat(function, number=number, repeat=5)) / number
+        print(f"  {name:<25} {best * 1e6:>10.1f} µs")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--index-entries", type=int, nargs="+", default=[10, 100, 500])
+    parser.add_argument("--number", type=int, default=100)
+    args = parser.parse_args(argv)
+    for index_entries in args.index_entries:
+        run(index_entries, args.number)
+
+
+if __name__ == "__main__":
+    main()
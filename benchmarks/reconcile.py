@@ -0,0 +1,212 @@
+"""Benchmark of reconciliation storms, against fake Elasticsearch and Kubernetes APIs.
+
+Drives the handlers registered by the role and user resources through create, resume and delete storms, and
+reports throughput, latency percentiles and the number of API calls made per object.
+
+Run with ``python -m benchmarks.reconcile``.
+"""
+import argparse
+import asyncio
+import logging
+import os
+import time
+from collections import Counter
+from typing import Callable
+
+import kopf
+
+# Settings are read from the environment, but the fakes never connect anywhere:
+os.environ.setdefault("ELASTICSEARCH_HOSTS", '["http://elasticsearch.invalid:9200"]')
+os.environ.setdefault("ELASTICSEARCH_USERNAME", "benchmark")
+os.environ.setdefault("ELASTICSEARCH_PASSWORD", "benchmark")
+
+from benchmarks.fakes import FakeCoreV1Api, FakeElasticsearch, fake_apis  # noqa: E402
+from elasticsearch_native_realm_operator.cache import get_security_cache  # noqa: E402
+from elasticsearch_native_realm_operator.constants import DEFAULT_CLUSTER  # noqa: E402
+from elasticsearch_native_realm_operator.resources import role  # noqa: E402
+from elasticsearch_native_realm_operator.resources.role import ElasticsearchNativeRealmRole  # noqa: E402
+from elasticsearch_native_realm_operator.resources.user import ElasticsearchNativeRealmUser  # noqa: E402
+
+NAMESPACE = "benchmark"
+ROLE_POOL_SIZE = 10
+# Users created shortly before the roles they reference, more than the scheduler admits at once:
+EARLY_USERS = 40
+EARLY_USERS_LEAD = 0.05
+
+_logger = logging.getLogger("benchmark")
+_logger.setLevel(logging.WARNING)
+
+
+def role_body(index: int) -> dict:
+    return {
+        "apiVersion": f"{ElasticsearchNativeRealmRole.group}/v1",
+        "kind": ElasticsearchNativeRealmRole.names.kind,
+        "metadata": {"name": f"role-{index}", "namespace": NAMESPACE, "uid": f"role-{index}", "resourceVersion": "1"},
+        "spec": {
+            "role": {
+                "name": f"role-{index}",
+                "cluster": ["monitor"],
+                "indices": [{"names": [f"logs-{index}-*"], "privileges": ["read", "view_index_metadata"]}],
+            }
+        },
+    }
+
+
+def user_body(index: int, first_role: int = 0) -> dict:
+    return {
+        "apiVersion": f"{ElasticsearchNativeRealmUser.group}/v1",
+        "kind": ElasticsearchNativeRealmUser.names.kind,
+        "metadata": {"name": f"user-{index}", "namespace": NAMESPACE, "uid": f"user-{index}", "resourceVersion": "1"},
+        "spec": {
+            "user": {
+                "username": f"user-{index}",
+                "roles": [
+                    f"role-{first_role + index % ROLE_POOL_SIZE}",
+                    f"role-{first_role + (index + 1) % ROLE_POOL_SIZE}",
+                ],
+            },
+            "secretName": f"user-{index}-credentials",
+        },
+    }
+
+
+class Storm:
+    """Run one handler for many resources concurrently, and record the outcome."""
+
+    def __init__(self, name: str, handler: Callable, bodies: list[dict], calls: Counter):
+        self.name = name
+        self.handler = handler
+        self.bodies = bodies
+        self.calls = calls
+        self.latencies: list[float] = []
+        self.api_calls = 0
+        self.errors = 0
+        self.duration = 0.0
+
+    async def run(self):
+        calls_before = sum(self.calls.values())
+        start = time.perf_counter()
+        await asyncio.gather(*(self._run_one(body) for body in self.bodies))
+        self.duration = time.perf_counter() - start
+        self.api_calls = sum(self.calls.values()) - calls_before
+
+    async def _run_one(self, body: dict):
+        patch = kopf.Patch()
+        start = time.perf_counter()
+        try:
+            await self.handler(
+                body=body, patch=patch, logger=_logger, diff=(), namespace=NAMESPACE, reason=self.name
+            )
+        except Exception:
+            self.errors += 1
+        self.latencies.append(time.perf_counter() - start)
+        # Persist the status written by the handler, as Kubernetes would:
+        if patch.get("status"):
+            body["status"] = {**body.get("status", {}), **patch["status"]}
+
+    def report(self) -> str:
+        latencies = sorted(self.latencies)
+        count = len(self.bodies)
+        return (
+            f"  {self.name:<30} {count / self.duration:>10.0f}/s"
+            f" {_percentile(latencies, 0.50) * 1e3:>9.1f}ms {_percentile(latencies, 0.99) * 1e3:>9.1f}ms"
+            f" {self.api_calls / count:>10.2f} {self.errors:>7}"
+        )
+
+
+def _percentile(values: list[float], quantile: float) -> float:
+    return values[min(int(len(values) * quantile), len(values) - 1)] if values else 0.0
+
+
+async def restart():
+    """Discard all in-memory state, and run the startup refresh, as a restarted operator would."""
+    get_security_cache.cache_clear()
+    role.role_reconciler.known.clear()
+    for resource in (ElasticsearchNativeRealmRole, ElasticsearchNativeRealmUser):
+        resource.index.clear()
+        resource._parsed.clear()
+    await get_security_cache(DEFAULT_CLUSTER).refresh()
+
+
+async def run(size: int, latency: float):
+    calls: Counter = Counter()
+    roles = [role_body(index) for index in range(max(size, ROLE_POOL_SIZE))]
+    users = [user_body(index) for index in range(size)]
+    # Handlers are registered with a registry of their own, so that runs of each size do not accumulate them in kopf's:
+    registry = kopf.OperatorRegistry()
+    role_handlers = ElasticsearchNativeRealmRole.register(registry)
+    user_handlers = ElasticsearchNativeRealmUser.register(registry)
+
+    elasticsearch = FakeElasticsearch(calls, latency)
+    with fake_apis(elasticsearch, FakeCoreV1Api(calls, latency)):
+        await restart()
+        storms = [
+            Storm("create roles", role_handlers["create"], roles, calls),
+            Storm("create users", user_handlers["create"], users, calls),
+        ]
+        for storm in storms:
+            await storm.run()
+
+        await restart()
+        resumed = Storm("resume users (verified)", user_handlers["resume"], users, calls)
+        await resumed.run()
+        storms.append(resumed)
+
+        await restart()
+        for body in users:
+            body.pop("status", None)
+        resumed = Storm("resume users (unverified)", user_handlers["resume"], users, calls)
+        await resumed.run()
+        storms.append(resumed)
+
+        # Users lost from Elasticsearch are re-created on resume, while new roles are created at the same time. The
+        # API calls of either storm are counted by both:
+        elasticsearch.security.users.clear()
+        await restart()
+        for body in users:
+            body.pop("status", None)
+        new_roles = [role_body(index) for index in range(len(roles), len(roles) + max(size // 10, 1))]
+        resumed = Storm("resume users (lost)", user_handlers["resume"], users, calls)
+        created = Storm("create roles (during resume)", role_handlers["create"], new_roles, calls)
+        await asyncio.gather(resumed.run(), created.run())
+        storms += [resumed, created]
+        roles = [*roles, *new_roles]
+
+        # Users wait for the roles created after them without holding slots, which the roles would wait for:
+        early_users = [user_body(index, first_role=len(roles)) for index in range(len(users), len(users) + EARLY_USERS)]
+        late_roles = [role_body(index) for index in range(len(roles), len(roles) + ROLE_POOL_SIZE)]
+        waiting = Storm("create users (before roles)", user_handlers["create"], early_users, calls)
+        created = Storm("create roles (after users)", role_handlers["create"], late_roles, calls)
+
+        async def create_late_roles():
+            await asyncio.sleep(EARLY_USERS_LEAD)
+            await created.run()
+
+        await asyncio.gather(waiting.run(), create_late_roles())
+        storms += [waiting, created]
+        users, roles = [*users, *early_users], [*roles, *late_roles]
+
+        for storm in [
+            Storm("delete users", user_handlers["delete"], users, calls),
+            Storm("delete roles", role_handlers["delete"], roles, calls),
+        ]:
+            await storm.run()
+            storms.append(storm)
+
+    print(f"{size} objects, {latency * 1e3:.1f}ms per API request:")
+    print(f"  {'storm':<30} {'throughput':>12} {'p50':>11} {'p99':>11} {'calls/obj':>10} {'errors':>7}")
+    for storm in storms:
+        print(storm.report())
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 100, 1000, 10000])
+    parser.add_argument("--latency", type=float, default=0.002, help="Seconds of latency per API request.")
+    args = parser.parse_args(argv)
+    for size in args.sizes:
+        asyncio.run(run(size, args.latency))
+
+
+if __name__ == "__main__":
+    main()
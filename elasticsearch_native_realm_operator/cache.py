@@ -0,0 +1,157 @@
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from functools import cache
+from typing import Any, Awaitable, Callable, ClassVar, Optional
+
+from elasticsearch_native_realm_operator.config import get_settings
+from elasticsearch_native_realm_operator.constants import DEFAULT_CLUSTER
+
+logger = logging.getLogger(__name__)
+
+# Lists every object of a kind in a cluster, keyed by name:
+ListAll = Callable[[str], Awaitable[dict[str, dict]]]
+# Converts a document to the representation to store:
+Compact = Callable[[Optional[dict]], Any]
+
+
+class DocumentCache:
+    """Bounded LRU cache of security documents keyed by name, whose entries expire after a TTL.
+
+    An entry of ``None`` records that the document is known not to exist. After a full listing which fits
+    within the cache, names which are not cached are also known not to exist until the listing expires.
+    Documents may be converted to a more compact representation when they are stored.
+
+    Every write advances the cache's generation. A listing records the generation at which it began, so that
+    writes made while it was in flight are not overwritten by the older state it returns.
+    """
+
+    def __init__(self, ttl: float, maxsize: int, compact: Compact = lambda document: document):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self.compact = compact
+        # Entries by name, with when they expire and the generation at which they were written:
+        self._entries: OrderedDict[str, tuple[float, Any, int]] = OrderedDict()
+        self._complete_until: float = 0.0
+        self.generation = 0
+        # Generation at which each name was last discarded, unless it has been written since:
+        self._discarded: dict[str, int] = {}
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, name: str) -> tuple[bool, Any]:
+        """Look up a document.
+
+        :return: whether the cache could answer, and the document (``None`` if it does not exist).
+        """
+        now = time.monotonic()
+        entry = self._entries.get(name)
+        if entry is not None:
+            expires, document, _ = entry
+            if expires > now:
+                self._entries.move_to_end(name)
+                return True, document
+            del self._entries[name]
+        if self._complete_until > now:
+            return True, None
+        return False, None
+
+    def set(self, name: str, document: Optional[dict]) -> Any:
+        """Store a document, and return it as stored."""
+        stored = self.compact(document)
+        self.generation += 1
+        self._discarded.pop(name, None)
+        self._store(name, (time.monotonic() + self.ttl, stored, self.generation))
+        return stored
+
+    def _store(self, name: str, entry: tuple[float, Any, int]):
+        self._entries[name] = entry
+        self._entries.move_to_end(name)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+            # Evicted names can no longer be assumed absent:
+            self._complete_until = 0.0
+
+    def discard(self, name: str):
+        self.generation += 1
+        self._discarded[name] = self.generation
+        self._entries.pop(name, None)
+        self._complete_until = 0.0
+
+    def replace_all(self, documents: dict[str, dict], since: Optional[int] = None):
+        """Replace the contents of the cache with a full listing of documents.
+
+        :param since: the generation at which the listing began. Names written or discarded since then are left
+            as they are, rather than replaced with the listed document.
+        """
+        written, discarded = {}, set()
+        if since is not None:
+            written = {name: entry for name, entry in self._entries.items() if entry[2] > since}
+            discarded = {name for name, generation in self._discarded.items() if generation > since}
+        self._entries.clear()
+        expires = time.monotonic() + self.ttl
+        for name, document in documents.items():
+            if name not in written and name not in discarded:
+                self._store(name, (expires, self.compact(document), self.generation))
+        for name, entry in written.items():
+            self._store(name, entry)
+        # Discarded names are unknown, so cannot be assumed absent:
+        if len(documents.keys() | written.keys()) <= self.maxsize and not discarded:
+            self._complete_until = expires
+        # Discards from before this listing began cannot affect any listing which begins later:
+        self._discarded = {name: generation for name, generation in self._discarded.items() if name in discarded}
+
+
+class SecurityCache:
+    """Process-wide cache of the security objects of one cluster, such as roles and users.
+
+    Handlers read through the cache and write through it when they change Elasticsearch. Entries expire, and
+    the whole cache is periodically refreshed from a bulk listing, so changes made outside the operator are
+    still noticed. Each kind of object is registered with how to list all of them, and how to store each one.
+    """
+
+    kinds: ClassVar[dict[str, tuple[ListAll, Compact]]] = {}
+
+    def __init__(self, ttl: float, maxsize: int, cluster: str = DEFAULT_CLUSTER):
+        self.cluster = cluster
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self._documents: dict[str, DocumentCache] = {}
+
+    @classmethod
+    def register_kind(cls, kind: str, list_all: ListAll, compact: Compact = lambda document: document):
+        cls.kinds[kind] = (list_all, compact)
+
+    def documents(self, kind: str) -> DocumentCache:
+        if kind not in self._documents:
+            _, compact = self.kinds[kind]
+            self._documents[kind] = DocumentCache(ttl=self.ttl, maxsize=self.maxsize, compact=compact)
+        return self._documents[kind]
+
+    async def refresh(self) -> dict[str, dict[str, dict]]:
+        """Refresh the cache from a full listing of each kind of object, and return those listings by kind."""
+        listings = {}
+        for kind, (list_all, _) in self.kinds.items():
+            documents = self.documents(kind)
+            since = documents.generation
+            listings[kind] = await list_all(self.cluster)
+            documents.replace_all(listings[kind], since=since)
+        counts = ", ".join(f"{len(listing)} {kind}s" for kind, listing in listings.items())
+        logger.info(f"Refreshed cache of cluster {self.cluster!r} with {counts}.")
+        return listings
+
+    async def refresh_periodically(self, interval: float):
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self.refresh()
+            except Exception:
+                logger.exception("Failed to refresh cache, will retry at the next interval.")
+
+
+@cache
+def get_security_cache(cluster: str) -> SecurityCache:
+    settings = get_settings()
+    return SecurityCache(ttl=settings.security_cache_ttl, maxsize=settings.security_cache_maxsize, cluster=cluster)
@@ -1,17 +1,119 @@
+import asyncio
 from functools import cache
+from typing import Any, Callable, Optional, TypeVar
 
 import kubernetes
-from elasticsearch import Elasticsearch
+from elasticsearch import AsyncElasticsearch
+from kubernetes.client.exceptions import ApiException
 
-from elasticsearch_native_realm_operator.config import get_settings
+from elasticsearch_native_realm_operator import metrics
+from elasticsearch_native_realm_operator.config import ElasticsearchCluster, Settings, get_settings
+from elasticsearch_native_realm_operator.ratelimit import AdaptiveTokenBucket, RateLimiter
+from elasticsearch_native_realm_operator.transport import KeepAliveAIOHttpConnection, ThrottledAsyncTransport
+
+T = TypeVar("T")
 
 
 @cache
-def elasticsearch_client() -> Elasticsearch:
+def async_elasticsearch_client(cluster: str) -> AsyncElasticsearch:
+    """Return the client used by the handlers, which run on kopf's event loop, for a named cluster."""
     config = get_settings()
-    return Elasticsearch(config.parsed_elasticsearch_hosts)
+    target = config.clusters[cluster]
+    return AsyncElasticsearch(
+        target.parsed_hosts,
+        transport_class=ThrottledAsyncTransport,
+        connection_class=KeepAliveAIOHttpConnection,
+        keepalive_timeout=config.elasticsearch_keepalive_timeout,
+        retry_backoff=config.elasticsearch_retry_backoff,
+        limiter=_rate_limiter(config, cluster),
+        **_transport_options(config, target),
+    )
+
+
+def _rate_limiter(config: Settings, cluster: str) -> RateLimiter:
+    def bucket(rate: float, max_rate: float) -> AdaptiveTokenBucket:
+        return AdaptiveTokenBucket(
+            rate=rate,
+            min_rate=config.elasticsearch_min_rate,
+            max_rate=max_rate,
+            latency_threshold=config.elasticsearch_latency_threshold,
+        )
+
+    return RateLimiter(
+        read=bucket(config.elasticsearch_read_rate, config.elasticsearch_max_read_rate),
+        write=bucket(config.elasticsearch_write_rate, config.elasticsearch_max_write_rate),
+        name=cluster,
+    )
+
+
+def _transport_options(config: Settings, target: ElasticsearchCluster) -> dict:
+    options: dict[str, Any] = {
+        "maxsize": config.elasticsearch_connections_per_node,
+        "timeout": config.elasticsearch_request_timeout,
+        "max_retries": config.elasticsearch_max_retries,
+        "retry_on_timeout": config.elasticsearch_retry_on_timeout,
+        "http_compress": config.elasticsearch_http_compress,
+    }
+    if config.elasticsearch_sniff:
+        options.update(
+            sniff_on_start=True,
+            sniff_on_connection_fail=True,
+            sniffer_timeout=config.elasticsearch_sniff_interval,
+            # Sniffed nodes do not inherit the credentials embedded in the configured hosts:
+            http_auth=(target.username, target.password),
+        )
+    return options
 
 
 @cache
 def kubernetes_client() -> kubernetes.client.CoreV1Api:
-    return kubernetes.client.CoreV1Api()
+    return kubernetes.client.CoreV1Api(_kubernetes_api_client())
+
+
+@cache
+def coordination_client() -> kubernetes.client.CoordinationV1Api:
+    return kubernetes.client.CoordinationV1Api(_kubernetes_api_client())
+
+
+@cache
+def custom_objects_client() -> kubernetes.client.CustomObjectsApi:
+    return kubernetes.client.CustomObjectsApi(_kubernetes_api_client())
+
+
+@cache
+def _kubernetes_api_client() -> kubernetes.client.ApiClient:
+    config = get_settings()
+    configuration = kubernetes.client.Configuration.get_default_copy()
+    if config.kubernetes_connection_pool_maxsize is not None:
+        configuration.connection_pool_maxsize = config.kubernetes_connection_pool_maxsize
+    if config.kubernetes_max_retries is not None:
+        configuration.retries = config.kubernetes_max_retries
+    return kubernetes.client.ApiClient(configuration)
+
+
+async def kubernetes_call(method: Callable[..., T], **kwargs: Any) -> T:
+    """Call a method of a Kubernetes API client, timed under the name of the method.
+
+    The Kubernetes client is synchronous, so the call is made from a worker thread to avoid blocking the event loop.
+    """
+    with metrics.time_api_call(method.__name__):
+        return await asyncio.to_thread(method, **kwargs)
+
+
+async def create_or_read_secret(namespace: str, body: dict) -> Optional[dict]:
+    """Create a secret, or read the existing secret of the same name if creating it conflicts.
+
+    Conflicts are rare, for example after an attempt which failed once it had created the secret, so secrets are
+    only read when they arise rather than watched.
+
+    :return: ``None`` if the secret was created, otherwise the body of the existing secret.
+    """
+    client = kubernetes_client()
+    try:
+        await kubernetes_call(client.create_namespaced_secret, namespace=namespace, body=body)
+        return None
+    except ApiException as exc:
+        if exc.status != 409:
+            raise
+    secret = await kubernetes_call(client.read_namespaced_secret, name=body["metadata"]["name"], namespace=namespace)
+    return client.api_client.sanitize_for_serialization(secret)
@@ -0,0 +1,88 @@
+"""Reconciliation of each resource to several Elasticsearch clusters.
+
+Each resource selects the clusters it is managed in, by name, defaulting to every configured cluster. Handlers
+reconcile the clusters concurrently, and record the outcome for each in the status of the resource.
+"""
+import asyncio
+from typing import Awaitable, Callable, Optional
+
+import kopf
+from pydantic import BaseModel, Field
+
+from elasticsearch_native_realm_operator.config import get_settings
+
+
+class ClusterSelector(BaseModel):
+    clusters: Optional[list[str]] = Field(
+        description="Names of the Elasticsearch clusters to manage this in. Defaults to all configured clusters.",
+        minItems=1,
+    )
+
+    def target_clusters(self) -> list[str]:
+        return self.clusters or list(get_settings().clusters)
+
+
+def check_clusters(clusters: list[str]):
+    unknown = set(clusters) - set(get_settings().clusters)
+    if unknown:
+        raise kopf.PermanentError(f"Unknown Elasticsearch clusters: {sorted(unknown)}")
+
+
+def deselected_clusters(diff) -> list[str]:
+    """Return the clusters which a change to the selected clusters stopped selecting."""
+    all_clusters = list(get_settings().clusters)
+    for _, field, old, new in diff:
+        if tuple(field) == ("spec", "clusters"):
+            # Clusters which are no longer configured cannot be cleaned up:
+            return sorted(set(old or all_clusters) - set(new or all_clusters) & set(all_clusters))
+    return []
+
+
+async def for_each_cluster(clusters: list[str], reconcile: Callable[[str], Awaitable], return_exceptions=False) -> list:
+    """Run a coroutine for each cluster concurrently, like :func:`asyncio.gather`."""
+    if len(clusters) != 1:
+        return await asyncio.gather(*(reconcile(cluster) for cluster in clusters), return_exceptions=return_exceptions)
+    # Most resources target a single cluster, for which scheduling a task would only add overhead:
+    try:
+        return [await reconcile(clusters[0])]
+    except Exception as exc:
+        if not return_exceptions:
+            raise
+        return [exc]
+
+
+async def fan_out(
+    clusters: list[str], reconcile: Callable[[str], Awaitable[dict]], body: kopf.Body, patch: kopf.Patch
+) -> dict:
+    """Reconcile each cluster concurrently, and record the outcome for each in the status.
+
+    Clusters are independent, so a failure in one does not prevent the others from being reconciled. If any
+    failed, the handler fails: permanently if all of the failures were permanent, otherwise to be retried.
+
+    :param reconcile: reconciles one cluster, returning its ``outcome`` and the fields which had ``drift``.
+    :return: the combined outcome and drifted fields of all clusters.
+    """
+    results = await for_each_cluster(clusters, reconcile, return_exceptions=True)
+    # Clusters which are no longer selected are removed from the status:
+    status: dict[str, Optional[dict]] = {
+        cluster: None for cluster in (body.get("status") or {}).get("clusters") or {} if cluster not in clusters
+    }
+    errors: dict[str, Exception] = {}
+    for cluster, result in zip(clusters, results):
+        if isinstance(result, Exception):
+            errors[cluster] = result
+            status[cluster] = {"synced": False, "error": str(result)}
+        elif isinstance(result, BaseException):
+            raise result
+        else:
+            status[cluster] = {"synced": True, **result}
+    patch.status["clusters"] = status
+    if not errors:
+        return {
+            "outcome": "write" if any(result["outcome"] == "write" for result in results) else "noop",
+            "drift": sorted(set().union(*(result.get("drift", ()) for result in results))),
+        }
+    message = "; ".join(f"{cluster}: {error}" for cluster, error in errors.items())
+    if all(isinstance(error, kopf.PermanentError) for error in errors.values()):
+        raise kopf.PermanentError(message)
+    raise kopf.TemporaryError(message)
@@ -0,0 +1,43 @@
+import asyncio
+from typing import Awaitable, Callable, Generic, Hashable, Iterable, Optional, TypeVar
+
+K = TypeVar("K", bound=Hashable)
+V = TypeVar("V")
+
+
+class Coalescer(Generic[K, V]):
+    """Merge lookups which arrive within a short window into one deduplicated batch request.
+
+    The batch function receives the union of all requested keys, and returns the value for each key it found.
+    Each caller receives the subset of results for the keys it asked for, or the error raised by the batch.
+    """
+
+    def __init__(self, fetch: Callable[[set[K]], Awaitable[dict[K, V]]], window: float):
+        self.fetch = fetch
+        self.window = window
+        self._waiters: list[tuple[set[K], asyncio.Future]] = []
+        self._flush: Optional[asyncio.Task] = None
+
+    async def get(self, keys: Iterable[K]) -> dict[K, V]:
+        keys = set(keys)
+        if not keys:
+            return {}
+        future = asyncio.get_running_loop().create_future()
+        self._waiters.append((keys, future))
+        if self._flush is None:
+            self._flush = asyncio.create_task(self._flush_after_window())
+        return await future
+
+    async def _flush_after_window(self):
+        await asyncio.sleep(self.window)
+        waiters, self._waiters, self._flush = self._waiters, [], None
+        try:
+            results = await self.fetch(set().union(*(keys for keys, _ in waiters)))
+        except Exception as exc:
+            for _, future in waiters:
+                if not future.done():
+                    future.set_exception(exc)
+            return
+        for keys, future in waiters:
+            if not future.done():
+                future.set_result({key: results[key] for key in keys if key in results})
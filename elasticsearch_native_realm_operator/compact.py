@@ -0,0 +1,131 @@
+"""Compact in-memory representation of native realm users.
+
+The security cache holds every user in a cluster, which may number in the hundreds of thousands. Each user is
+stored as a slotted record rather than a dictionary: role names are interned in a table and stored as a packed
+array of their indices, and metadata other than the management key is kept only as a content hash, as it is
+only ever compared.
+"""
+import hashlib
+import json
+import sys
+from array import array
+from typing import Optional
+
+from elasticsearch_native_realm_operator.constants import MANAGED_BY_KEY
+
+
+class RoleTable:
+    """Table of interned role names, each identified by a small integer.
+
+    Names are never removed, so the table is bounded by the number of distinct role names seen.
+    """
+
+    def __init__(self):
+        self._names: list[str] = []
+        self._ids: dict[str, int] = {}
+
+    def __len__(self) -> int:
+        return len(self._names)
+
+    def pack(self, names: list[str]) -> bytes:
+        """Pack a list of role names into the sorted, deduplicated array of their ids."""
+        ids = array("I", sorted({self._id(name) for name in names}))
+        return ids.tobytes()
+
+    def unpack(self, packed: bytes) -> list[str]:
+        ids = array("I")
+        ids.frombytes(packed)
+        return [self._names[id_] for id_ in ids]
+
+    def _id(self, name: str) -> int:
+        id_ = self._ids.get(name)
+        if id_ is None:
+            id_ = self._ids[name] = len(self._names)
+            self._names.append(sys.intern(name))
+        return id_
+
+
+# Role names are interned once for the whole process, so records from every cluster share them:
+role_table = RoleTable()
+
+
+class CompactUser:
+    """A native realm user document, as compared by the operator.
+
+    The username is not held, as records are always stored under it.
+    """
+
+    __slots__ = ("full_name", "email", "enabled", "managed_by", "_roles", "_metadata_hash")
+
+    def __init__(
+        self,
+        roles: bytes,
+        full_name: Optional[str],
+        email: Optional[str],
+        enabled: bool,
+        managed_by: Optional[str],
+        metadata_hash: Optional[bytes],
+    ):
+        self._roles = roles
+        self.full_name = full_name
+        self.email = email
+        self.enabled = enabled
+        self.managed_by = managed_by
+        self._metadata_hash = metadata_hash
+
+    @classmethod
+    def from_document(cls, document: dict) -> "CompactUser":
+        """Compact a user document, as returned by Elasticsearch or as put by the operator.
+
+        Fields which the operator does not manage, including passwords, are dropped.
+        """
+        metadata = dict(document.get("metadata") or {})
+        managed_by = metadata.pop(MANAGED_BY_KEY, None)
+        return cls(
+            roles=role_table.pack(document.get("roles") or []),
+            full_name=document.get("full_name"),
+            email=document.get("email"),
+            enabled=document.get("enabled", True) is not False,
+            managed_by=managed_by,
+            metadata_hash=_hash_metadata(metadata),
+        )
+
+    @property
+    def roles(self) -> list[str]:
+        return role_table.unpack(self._roles)
+
+    def differences(self, other: "CompactUser") -> list[str]:
+        """Return the names of the fields which differ from another user.
+
+        Role order and duplicates are not meaningful, and are already removed by packing.
+        """
+        return [
+            field
+            for field, ours, theirs in [
+                ("email", self.email, other.email),
+                ("enabled", self.enabled, other.enabled),
+                ("full_name", self.full_name, other.full_name),
+                ("metadata", (self.managed_by, self._metadata_hash), (other.managed_by, other._metadata_hash)),
+                ("roles", self._roles, other._roles),
+            ]
+            if ours != theirs
+        ]
+
+    def __eq__(self, other) -> bool:
+        if not isinstance(other, CompactUser):
+            return NotImplemented
+        return not self.differences(other)
+
+    def __repr__(self) -> str:
+        return f"CompactUser(roles={self.roles!r}, managed_by={self.managed_by!r})"
+
+
+def compact_user(document: Optional[dict]) -> Optional[CompactUser]:
+    return None if document is None else CompactUser.from_document(document)
+
+
+def _hash_metadata(metadata: dict) -> Optional[bytes]:
+    # Most users have no metadata beyond the management key, which needs no hash at all:
+    if not metadata:
+        return None
+    return hashlib.blake2b(json.dumps(metadata, sort_keys=True).encode(), digest_size=16).digest()
@@ -0,0 +1,89 @@
+"""Semantic comparison of native realm documents.
+
+Elasticsearch normalises documents when they are stored, so a document read back rarely equals the one which
+was written. The comparisons here ignore those differences: lists whose order is meaningless are compared as
+sets, and fields which Elasticsearch fills in with default values are ignored when they hold that default.
+"""
+import json
+from typing import Any, Callable
+
+_ROLE_DEFAULTS: dict[str, Any] = {"applications": [], "cluster": [], "indices": [], "metadata": {}, "run_as": []}
+_ROLE_MAPPING_DEFAULTS: dict[str, Any] = {"enabled": True, "metadata": {}, "role_templates": [], "roles": []}
+
+
+def role_differences(current: dict, desired: dict) -> list[str]:
+    """Return the names of the fields which differ between two role documents."""
+    return _differences(_normalise_role(current), _normalise_role(desired))
+
+
+def role_mapping_differences(current: dict, desired: dict) -> list[str]:
+    """Return the names of the fields which differ between two role mapping documents."""
+    return _differences(_normalise_role_mapping(current), _normalise_role_mapping(desired))
+
+
+def _differences(current: dict, desired: dict) -> list[str]:
+    return sorted(key for key in current.keys() | desired.keys() if current.get(key) != desired.get(key))
+
+
+def _normalise_role(document: dict) -> dict:
+    document = _with_defaults(document, _ROLE_DEFAULTS, ignore={"name", "transient_metadata"})
+    return {
+        **document,
+        "applications": _as_set(document["applications"], _normalise_application_entry),
+        "cluster": _as_set(document["cluster"]),
+        "indices": _as_set(document["indices"], _normalise_indices_entry),
+        "run_as": _as_set(document["run_as"]),
+    }
+
+
+def _normalise_application_entry(entry: dict) -> dict:
+    return {
+        **entry,
+        "privileges": _as_set(entry.get("privileges", [])),
+        "resources": _as_set(entry.get("resources", [])),
+    }
+
+
+def _normalise_indices_entry(entry: dict) -> dict:
+    entry = {key: value for key, value in entry.items() if value is not None}
+    entry["names"] = _as_set(entry.get("names", []))
+    entry["privileges"] = _as_set(entry.get("privileges", []))
+    if not entry.get("allow_restricted_indices", False):
+        entry.pop("allow_restricted_indices", None)
+    field_security = entry.pop("field_security", None)
+    if field_security:
+        grant = _as_set(field_security.get("grant", ["*"]))
+        except_ = _as_set(field_security.get("except", []))
+        # Granting all fields with no exceptions is the default which Elasticsearch fills in:
+        if grant != ["*"] or except_:
+            entry["field_security"] = {**field_security, "grant": grant, "except": except_}
+    return entry
+
+
+def _normalise_role_mapping(document: dict) -> dict:
+    document = _with_defaults(document, _ROLE_MAPPING_DEFAULTS, ignore={"name"})
+    return {
+        **document,
+        "roles": _as_set(document["roles"]),
+        "role_templates": _as_set(document["role_templates"], _normalise_role_template),
+    }
+
+
+def _normalise_role_template(entry: dict) -> dict:
+    template = entry.get("template")
+    # Elasticsearch returns templates serialised as strings:
+    if isinstance(template, str):
+        template = json.loads(template)
+    return {**entry, "template": template, "format": entry.get("format", "string")}
+
+
+def _with_defaults(document: dict, defaults: dict[str, Any], ignore: set[str]) -> dict:
+    normalised = {key: value for key, value in document.items() if key not in ignore and value is not None}
+    return {**defaults, **normalised}
+
+
+def _as_set(items: list, normalise: Callable[[Any], Any] = lambda item: item) -> list:
+    """Canonicalise a list whose order and duplicates are not meaningful."""
+    normalised = [normalise(item) for item in items]
+    canonical = {json.dumps(item, sort_keys=True): item for item in normalised}
+    return [canonical[key] for key in sorted(canonical)]
@@ -1,22 +1,137 @@
-from functools import cache
+from functools import cache, cached_property
+from typing import Optional
 
 from furl import furl
-from pydantic import BaseSettings
+from pydantic import BaseModel, BaseSettings, root_validator
+
+from elasticsearch_native_realm_operator.constants import DEFAULT_CLUSTER
+
+
+class ElasticsearchCluster(BaseModel):
+    hosts: list[str]
+    username: str
+    password: str
+
+    @property
+    def parsed_hosts(self) -> list[str]:
+        hosts_with_auth = []
+        for host in self.hosts:
+            url = furl(host)
+            url.username = self.username
+            url.password = self.password
+            hosts_with_auth.append(url.tostr())
+        return hosts_with_auth
+
 
 class Settings(BaseSettings):
     elasticsearch_hosts: list[str]
     elasticsearch_username: str
     elasticsearch_password: str
+    # Further clusters to manage roles and users in, by name, e.g. '{"eu": {"hosts": [...], "username": ...}}':
+    elasticsearch_clusters: dict[str, ElasticsearchCluster] = {}
+
+    # Maximum number of open connections to each Elasticsearch node:
+    elasticsearch_connections_per_node: int = 10
+    # Seconds to keep idle connections to Elasticsearch open for reuse:
+    elasticsearch_keepalive_timeout: float = 15.0
+    elasticsearch_request_timeout: float = 10.0
+    elasticsearch_max_retries: int = 3
+    elasticsearch_retry_on_timeout: bool = True
+    # Seconds to wait before the first retry, doubling for each subsequent retry:
+    elasticsearch_retry_backoff: float = 0.5
+    elasticsearch_http_compress: bool = False
+    # Discover the other nodes of the cluster, at startup, on connection failure and then at this interval:
+    elasticsearch_sniff: bool = False
+    elasticsearch_sniff_interval: Optional[float] = 300.0
+    # Initial and maximum requests per second to Elasticsearch, adapted to its responses:
+    elasticsearch_read_rate: float = 100.0
+    elasticsearch_max_read_rate: float = 1000.0
+    elasticsearch_write_rate: float = 20.0
+    elasticsearch_max_write_rate: float = 200.0
+    elasticsearch_min_rate: float = 1.0
+    # Seconds after which a response is treated as a sign of overload:
+    elasticsearch_latency_threshold: float = 2.0
+    # Maximum number of pooled connections to the Kubernetes API (defaults to the client's own default):
+    kubernetes_connection_pool_maxsize: Optional[int] = None
+    kubernetes_max_retries: Optional[int] = None
+
+    # Seconds before a cached role or user must be fetched again:
+    security_cache_ttl: float = 60.0
+    # Maximum number of roles and of users to hold in the cache:
+    security_cache_maxsize: int = 10000
+    # Seconds between full refreshes of the cache from Elasticsearch:
+    security_cache_refresh_interval: float = 300.0
+    # Seconds to wait for concurrent role lookups to merge into one request:
+    role_lookup_window: float = 0.05
+    # Seconds for which a user waits for the roles it references to be created, before retrying later:
+    role_dependency_timeout: float = 60.0
+    # Seconds for which a verified spec is trusted, skipping reconciliation when it has not changed:
+    spec_hash_max_age: float = 3600.0
+    # Maximum number of reconciliations to run at once, and of each priority: creation, updates and deletion are
+    # interactive, drift scans are repair, and resuming resources and collecting orphans are background work:
+    scheduler_concurrency: int = 20
+    scheduler_interactive_concurrency: int = 20
+    scheduler_repair_concurrency: int = 5
+    scheduler_background_concurrency: int = 10
+    # Seconds for which kopf waits for further events of a resource before handling the latest of them:
+    event_batch_window: float = 0.1
+    # Seconds for which a created or updated resource must go unchanged before it is reconciled, disabled if 0.
+    # Changes made within the window are reconciled together, but never later than the maximum wait:
+    debounce_window: float = 0.0
+    debounce_max_wait: float = 5.0
+    # Seconds between scans for roles and users which have drifted, plus up to the jitter, disabled if unset:
+    drift_scan_interval: Optional[float] = 300.0
+    drift_scan_jitter: float = 30.0
+    # Seconds between sweeps for roles and users whose managing resource no longer exists, disabled if unset:
+    orphan_collection_interval: Optional[float] = None
+    # Maximum number of orphaned roles and users to delete per second:
+    orphan_collection_rate: float = 10.0
+    # Only log the orphaned roles and users which would be deleted:
+    orphan_collection_dry_run: bool = False
+    # Hash generated passwords in the operator with this algorithm, which must match the cluster's
+    # `xpack.security.authc.password_hashing.algorithm`, e.g. "bcrypt12" or "pbkdf2_50000". Elasticsearch hashes
+    # them if unset:
+    password_hashing_algorithm: Optional[str] = None
+    # Number of processes with which to hash passwords (defaults to the number of CPUs):
+    password_hashing_workers: Optional[int] = None
+    # Run as one of several replicas, of which only the holder of a Lease writes. The others stand by with their
+    # caches warm, paused through kopf's peering, to take over within seconds. Replicas are named by `pod_id`:
+    leader_election_enabled: bool = False
+    # Name of the Lease (suffixed with "-leader") and of the ClusterKopfPeering through which replicas coordinate,
+    # which must be distinct for each group of replicas sharing the same resources:
+    leader_election_name: str = "native-realm-operator"
+    leader_election_namespace: str = "native-realm-operator"
+    # Seconds after which a leader which has not renewed the Lease can be replaced:
+    leader_election_lease_duration: float = 15.0
+    leader_election_renew_interval: float = 5.0
+    # Name of this replica's pod, from which kopf also takes its identity. Required for leader election:
+    pod_id: Optional[str] = None
+    # Port on which to serve Prometheus metrics, disabled if unset:
+    metrics_port: Optional[int] = None
+
+    @root_validator(skip_on_failure=True)
+    def _check_pod_id(cls, values: dict) -> dict:
+        # kopf identifies each replica to its peers by POD_ID, and otherwise makes up an identity at random:
+        if values["leader_election_enabled"] and not values["pod_id"]:
+            raise ValueError("POD_ID must be set to the pod's name for leader election.")
+        return values
 
     @property
     def parsed_elasticsearch_hosts(self) -> list[str]:
-        elasticsearch_hosts_with_auth = []
-        for host in self.elasticsearch_hosts:
-            url = furl(host)
-            url.username = self.elasticsearch_username
-            url.password = self.elasticsearch_password
-            elasticsearch_hosts_with_auth.append(url.tostr())
-        return elasticsearch_hosts_with_auth
+        return self.clusters[DEFAULT_CLUSTER].parsed_hosts
+
+    @cached_property
+    def clusters(self) -> dict[str, ElasticsearchCluster]:
+        """All of the clusters to manage roles and users in, by name."""
+        default = ElasticsearchCluster(
+            hosts=self.elasticsearch_hosts,
+            username=self.elasticsearch_username,
+            password=self.elasticsearch_password,
+        )
+        return {DEFAULT_CLUSTER: default, **self.elasticsearch_clusters}
+
+    class Config:
+        keep_untouched = (cached_property,)
 
 
 @cache
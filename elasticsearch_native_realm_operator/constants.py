@@ -1 +1,3 @@
 MANAGED_BY_KEY = "elasticsearchnativerealm.ckpd.co/managed-by"
+# Name of the cluster configured by the `ELASTICSEARCH_HOSTS`, `ELASTICSEARCH_USERNAME` and `ELASTICSEARCH_PASSWORD`:
+DEFAULT_CLUSTER = "default"
@@ -0,0 +1,21 @@
+import base64
+from typing import NamedTuple, Optional
+
+
+class Credentials(NamedTuple):
+    username: str
+    password: str
+    # UIDs of the resources which own the secret:
+    owners: frozenset[str]
+
+
+def parse_credentials_secret(body: dict) -> Optional[Credentials]:
+    """Decode the credentials held by a secret, if it has the expected keys."""
+    data = body.get("data") or {}
+    try:
+        username = base64.b64decode(data["username"]).decode()
+        password = base64.b64decode(data["password"]).decode()
+    except (KeyError, ValueError):
+        return None
+    owners = frozenset(reference["uid"] for reference in body["metadata"].get("ownerReferences") or ())
+    return Credentials(username=username, password=password, owners=owners)
@@ -0,0 +1,46 @@
+import asyncio
+from typing import Generic, Hashable, Iterable, TypeVar
+
+K = TypeVar("K", bound=Hashable)
+
+
+class DependencyWaiters(Generic[K]):
+    """Park callers until the keys they depend on become available, and wake them as soon as they do.
+
+    This replaces polling with retries: whoever makes a key available notifies it, and every caller waiting on
+    that key is woken straight away.
+    """
+
+    def __init__(self):
+        self._waiters: dict[K, set[asyncio.Future]] = {}
+
+    def __len__(self) -> int:
+        """The number of keys which are waited on."""
+        return len(self._waiters)
+
+    async def wait(self, keys: Iterable[K], timeout: float) -> set[K]:
+        """Wait until all of the keys are notified, or the timeout passes.
+
+        :return: the keys which were notified.
+        """
+        loop = asyncio.get_running_loop()
+        futures = {key: loop.create_future() for key in set(keys)}
+        for key, future in futures.items():
+            self._waiters.setdefault(key, set()).add(future)
+        try:
+            if futures:
+                await asyncio.wait(futures.values(), timeout=timeout)
+        finally:
+            for key, future in futures.items():
+                waiters = self._waiters.get(key)
+                if waiters is not None:
+                    waiters.discard(future)
+                    if not waiters:
+                        del self._waiters[key]
+        return {key for key, future in futures.items() if future.done()}
+
+    def notify(self, keys: Iterable[K]):
+        for key in keys:
+            for future in self._waiters.pop(key, ()):
+                if not future.done():
+                    future.set_result(None)
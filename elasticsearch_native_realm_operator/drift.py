@@ -0,0 +1,74 @@
+import asyncio
+import logging
+import random
+from typing import Callable, Optional
+
+from elasticsearch_native_realm_operator.cache import get_security_cache
+from elasticsearch_native_realm_operator.config import get_settings
+from elasticsearch_native_realm_operator.kopf_ext import CustomResource
+from elasticsearch_native_realm_operator.scheduling import Priority, get_scheduler
+
+logger = logging.getLogger(__name__)
+
+
+class DriftScanner:
+    """Periodically repair roles and users which have been changed outside of the operator.
+
+    Each scan refreshes the security cache of each cluster with one bulk listing of roles and one of users, then
+    reconciles every indexed resource against them. Resources which are in sync are checked from memory, so only
+    drifted objects cause further requests to Elasticsearch.
+    """
+
+    def __init__(
+        self,
+        resources: list[type[CustomResource]],
+        interval: Optional[float],
+        jitter: float,
+        active: Callable[[], bool] = lambda: True,
+    ):
+        self.resources = resources
+        self.interval = interval
+        self.jitter = jitter
+        self.active = active
+
+    async def scan(self) -> None:
+        """Reconcile every indexed resource, unless this replica is not active, such as a standby.
+
+        Repairs run concurrently, bounded by the scheduler's limit for repairs.
+        """
+        if not self.active():
+            return
+        await asyncio.gather(*(get_security_cache(cluster).refresh() for cluster in get_settings().clusters))
+        outcomes = await asyncio.gather(
+            *(
+                self._repair(resource_type, namespace, name)
+                for resource_type in self.resources
+                for (namespace, name), resource in list(resource_type.index.items())
+                if resource is not None
+            )
+        )
+        logger.info(
+            f"Drift scan checked {outcomes.count('checked') + outcomes.count('failed')} resources, "
+            f"{outcomes.count('failed')} of which could not be repaired, and skipped {outcomes.count('skipped')}."
+        )
+
+    async def _repair(self, resource_type: type[CustomResource], namespace: Optional[str], name: str) -> str:
+        resource_logger = logging.getLogger(f"{__name__}.{resource_type.names.kind}")
+        try:
+            async with get_scheduler().slot(Priority.REPAIR, namespace):
+                # The resource may have changed, or be handled by kopf, since the scan started:
+                checked = await resource_type.repair(namespace, name, resource_logger)
+        except Exception as exc:
+            logger.warning(f"Failed to repair drift of {resource_type.names.kind} {namespace}/{name}: {exc}")
+            return "failed"
+        return "checked" if checked else "skipped"
+
+    async def run_periodically(self):
+        if self.interval is None:
+            return
+        while True:
+            await asyncio.sleep(self.interval + random.uniform(0, self.jitter))
+            try:
+                await self.scan()
+            except Exception:
+                logger.exception("Drift scan failed, will retry at the next interval.")
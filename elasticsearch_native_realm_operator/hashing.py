@@ -0,0 +1,74 @@
+"""Password hashing in the formats which Elasticsearch accepts as a user's ``password_hash``.
+
+Elasticsearch only accepts hashes made with the algorithm configured by
+``xpack.security.authc.password_hashing.algorithm``, so algorithms are named as in that setting, with the work
+factor as part of the name: ``bcrypt`` (cost 10) or ``bcrypt4`` to ``bcrypt14``, and ``pbkdf2`` (10000
+iterations) or ``pbkdf2_<iterations>`` for each of the iterations Elasticsearch supports.
+"""
+import asyncio
+import base64
+import hashlib
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+from functools import cache
+from typing import NamedTuple
+
+try:
+    import bcrypt
+except ImportError:  # pragma: no cover
+    bcrypt = None  # type: ignore
+
+from elasticsearch_native_realm_operator.config import get_settings
+
+_ALGORITHM_PATTERN = re.compile(r"^(?:(?P<bcrypt>bcrypt)(?P<rounds>\d+)?|(?P<pbkdf2>pbkdf2)(?:_(?P<iterations>\d+))?)$")
+_PBKDF2_ITERATIONS = {1000, 10000, 50000, 100000, 500000, 1000000}
+
+
+class HashingAlgorithm(NamedTuple):
+    name: str
+    cost: int
+
+
+def parse_algorithm(name: str) -> HashingAlgorithm:
+    """Parse the name of an Elasticsearch password hashing algorithm."""
+    match = _ALGORITHM_PATTERN.match(name.lower())
+    if not match:
+        raise ValueError(f"Unsupported password hashing algorithm {name!r}.")
+    if match["bcrypt"]:
+        rounds = int(match["rounds"] or 10)
+        if not 4 <= rounds <= 14:
+            raise ValueError(f"Unsupported number of bcrypt rounds in {name!r}, must be between 4 and 14.")
+        if bcrypt is None:
+            raise ValueError(f"Hashing with {name!r} requires the 'bcrypt' extra to be installed.")
+        return HashingAlgorithm("bcrypt", rounds)
+    iterations = int(match["iterations"] or 10000)
+    if iterations not in _PBKDF2_ITERATIONS:
+        raise ValueError(
+            f"Unsupported number of PBKDF2 iterations in {name!r}, must be one of {sorted(_PBKDF2_ITERATIONS)}."
+        )
+    return HashingAlgorithm("pbkdf2", iterations)
+
+
+def hash_password(password: str, algorithm: str) -> str:
+    """Hash a password. This is CPU-bound, see :func:`compute_password_hash` for use from the event loop."""
+    name, cost = parse_algorithm(algorithm)
+    if name == "bcrypt":
+        # Elasticsearch verifies hashes with the "2a" prefix:
+        return bcrypt.hashpw(password.encode(), bcrypt.gensalt(rounds=cost, prefix=b"2a")).decode()
+    salt = os.urandom(32)
+    key = hashlib.pbkdf2_hmac("sha512", password.encode(), salt, cost, dklen=32)
+    return f"{{PBKDF2}}{cost}${base64.b64encode(salt).decode()}${base64.b64encode(key).decode()}"
+
+
+async def compute_password_hash(password: str) -> str:
+    """Hash a password with the configured algorithm, in the hashing process pool."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(
+        hashing_pool(), hash_password, password, get_settings().password_hashing_algorithm
+    )
+
+
+@cache
+def hashing_pool() -> ProcessPoolExecutor:
+    return ProcessPoolExecutor(max_workers=get_settings().password_hashing_workers)
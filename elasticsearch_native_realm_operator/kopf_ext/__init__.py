@@ -1,3 +1,4 @@
-from .models import CustomResource
+from .models import SYNC_PRINTER_COLUMNS, CustomResource
+from .reconciler import Reconciler, check_immutable
 
-__all__ = ["CustomResource"]
+__all__ = ["CustomResource", "Reconciler", "SYNC_PRINTER_COLUMNS", "check_immutable"]
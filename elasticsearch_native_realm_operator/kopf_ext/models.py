@@ -1,9 +1,21 @@
-from typing import ClassVar, Literal, Optional, Union
+import asyncio
+import functools
+import hashlib
+import json
+import time
+from datetime import datetime, timedelta, timezone
+from typing import TYPE_CHECKING, Any, Awaitable, Callable, ClassVar, Literal, Optional, Protocol, Union
 
 import kopf
 from jsonpointer import JsonPointer
+from kubernetes.client.exceptions import ApiException
 from pydantic import BaseModel, Field, ValidationError, parse_obj_as
 
+from elasticsearch_native_realm_operator import metrics
+from elasticsearch_native_realm_operator.client import custom_objects_client, kubernetes_call
+from elasticsearch_native_realm_operator.config import get_settings
+from elasticsearch_native_realm_operator.scheduling import Priority, get_scheduler
+
 
 class CustomResourceDefinitionNames(BaseModel):
     kind: str
@@ -17,10 +29,46 @@ class CustomResourceDefinitionNames(BaseModel):
 class CustomResourceDefinitionAdditionalPrinterColumn(BaseModel):
     jsonPath: str
     name: str
-    type: Literal["integer", "number", "string", "boolean"]
-    description: Optional[str]
-    format: Optional[str]
-    priority: Optional[int]
+    type: Literal["integer", "number", "string", "boolean", "date"]
+    description: Optional[str] = None
+    format: Optional[str] = None
+    priority: Optional[int] = None
+
+
+# Columns showing the sync state recorded in the status by the handlers, for use with `kubectl get`:
+SYNC_PRINTER_COLUMNS = [
+    CustomResourceDefinitionAdditionalPrinterColumn(
+        name="State", type="string", jsonPath=".status.sync.state", description="Whether the last sync succeeded."
+    ),
+    CustomResourceDefinitionAdditionalPrinterColumn(
+        name="Synced", type="date", jsonPath=".status.sync.verifiedAt", description="When the spec was last synced."
+    ),
+    CustomResourceDefinitionAdditionalPrinterColumn(
+        name="Round Trip (ms)",
+        type="number",
+        jsonPath=".status.sync.roundTripMs",
+        description="Milliseconds spent waiting on API calls during the last sync.",
+        priority=1,
+    ),
+    CustomResourceDefinitionAdditionalPrinterColumn(
+        name="Drift",
+        type="string",
+        jsonPath=".status.sync.drift",
+        description="Fields which differed from the spec, and were corrected, during the last sync.",
+        priority=1,
+    ),
+    CustomResourceDefinitionAdditionalPrinterColumn(
+        name="Error", type="string", jsonPath=".status.sync.error", description="Why the last sync failed.", priority=1
+    ),
+    CustomResourceDefinitionAdditionalPrinterColumn(name="Age", type="date", jsonPath=".metadata.creationTimestamp"),
+]
+
+
+class ResourceSpec(Protocol):
+    """The model of the spec of a resource, which selects the Elasticsearch clusters it is managed in."""
+
+    def target_clusters(self) -> list[str]:
+        ...
 
 
 class CustomResource(BaseModel):
@@ -28,6 +76,19 @@ class CustomResource(BaseModel):
     group: ClassVar[str]
     names: ClassVar[CustomResourceDefinitionNames]
     additionalPrinterColumns: ClassVar[list[CustomResourceDefinitionAdditionalPrinterColumn]]
+    # Live resources of this kind, keyed by namespace and name, as seen on kopf's watch stream (None if invalid):
+    index: ClassVar[dict[tuple[Optional[str], str], Optional["CustomResource"]]]
+    # The latest parsed model of each resource, keyed by uid, with its resource version and spec hash:
+    _parsed: ClassVar[dict[str, tuple[str, str, "CustomResource"]]]
+    # Resources which kopf is currently handling, keyed by namespace and name:
+    handling: ClassVar[set[tuple[Optional[str], str]]]
+
+    if TYPE_CHECKING:
+        # Declared by each resource, as a field of its own model:
+        spec: ResourceSpec
+
+        # Reconciles the resource, as registered for creation, updates and resumes:
+        update: ClassVar[Callable[..., Awaitable[Optional[dict]]]]
 
     def __init_subclass__(
         cls,
@@ -44,6 +105,9 @@ class CustomResource(BaseModel):
         cls.additionalPrinterColumns = parse_obj_as(
             list[CustomResourceDefinitionAdditionalPrinterColumn], additionalPrinterColumns
         )
+        cls.index = {}
+        cls._parsed = {}
+        cls.handling = set()
 
     apiVersion: str = Field(
         ...,
@@ -75,28 +139,215 @@ More info: https://kubernetes.io/docs/reference/kubernetes-api/common-definition
     )
 
     @classmethod
-    def register(cls):
-        """Register any handlers defined on this resource definition."""
+    def parse(cls, body, spec_hash: Optional[str] = None) -> "CustomResource":
+        """Parse a resource body, reusing the model previously parsed for the same resource where possible.
+
+        The same resource version is never parsed twice. If only the metadata or status has changed since the
+        previous version, the previously validated spec is reused rather than validated again.
+
+        :raises ValidationError: if the body is invalid.
+        """
+        metadata = body["metadata"]
+        uid, resource_version = metadata.get("uid"), metadata.get("resourceVersion")
+        if uid is None:
+            return cls(**body)
+        cached = cls._parsed.get(uid)
+        if cached and cached[0] == resource_version:
+            return cached[2]
+        spec_hash = spec_hash or _hash_spec(body.get("spec"))
+        if cached and cached[1] == spec_hash:
+            parsed = cached[2].copy(update={"metadata": dict(metadata)})
+        else:
+            parsed = cls(**body)
+        cls._parsed[uid] = (resource_version, spec_hash, parsed)
+        return parsed
+
+    @classmethod
+    def register(cls, registry: Optional[kopf.OperatorRegistry] = None) -> dict:
+        """Register any handlers defined on this resource definition, and maintain the index of resources.
+
+        :param registry: the registry to add the handlers to, defaulting to kopf's global registry.
+        :return: the registered handlers, keyed by operation.
+        """
         handlers = {
             operation: cls._make_handler(operation)
             for operation in ("create", "update", "delete", "resume")
             if hasattr(cls, operation)
         }
         for operation, handler in handlers.items():
-            getattr(kopf.on, operation)(cls.names.kind)(handler)
+            getattr(kopf.on, operation)(cls.names.kind, registry=registry)(handler)
+        kopf.on.event(cls.names.kind, registry=registry)(cls._make_indexer())
+        return handlers
+
+    @classmethod
+    def _make_indexer(cls):
+        async def index(event: dict, body, **_):
+            key = (body["metadata"].get("namespace"), body["metadata"]["name"])
+            if event["type"] == "DELETED":
+                cls._parsed.pop(body["metadata"].get("uid"), None)
+            # Resources being deleted are no longer live, even though they are still visible:
+            if event["type"] == "DELETED" or body["metadata"].get("deletionTimestamp"):
+                cls.index.pop(key, None)
+                return
+            try:
+                cls.index[key] = cls.parse(body)
+            except ValidationError:
+                cls.index[key] = None
+
+        index.__name__ = index.__qualname__ = "index"
+        return index
 
     @classmethod
     def _make_handler(cls, operation: str):
+        """Make a kopf handler for an operation.
+
+        Other than for deletion, the outcome is recorded in ``status.sync``: the state, the hash of the spec which
+        was applied, when, and the time spent waiting on API calls, merged with any fields returned by the method.
+        kopf applies this in the same patch as its own progress, so it costs no extra requests. Events which
+        arrive with the same spec, shortly after it was verified, are skipped without calling the method. Every
+        handler is instrumented with metrics.
+
+        If debouncing is enabled, creation and updates wait for the resource to settle, and reconcile its latest
+        spec. The events of the changes made meanwhile then arrive with that spec verified, so are skipped.
+
+        The method runs in a slot from the scheduler: resuming is background work, while other operations are
+        interactive, so take priority. Resources wait for their dependencies before taking a slot, so that they
+        do not hold slots which the work they wait on needs.
+
+        While the handler runs, the resource is in ``handling``, so that drift repairs leave it to the handler.
+        """
         method = getattr(cls, operation)
-        def handle(body, **kwargs):
+        verifies = operation != "delete"
+        debounces = operation in ("create", "update")
+        priority = Priority.BACKGROUND if operation == "resume" else Priority.INTERACTIVE
+
+        @_instrumented(kind=cls.names.kind, operation=operation)
+        async def handle(body, **kwargs):
+            key = (body["metadata"].get("namespace"), body["metadata"]["name"])
+            cls.handling.add(key)
+            try:
+                return await reconcile(body, **kwargs)
+            finally:
+                cls.handling.discard(key)
+
+        async def reconcile(body, patch: kopf.Patch, logger, **kwargs):
+            spec_hash = _hash_spec(body.get("spec"))
+            if verifies and _recently_verified(body, spec_hash):
+                logger.info(f"Spec unchanged since it was last verified, skipping {operation}.")
+                metrics.RECONCILE_OUTCOMES.labels(kind=cls.names.kind, outcome="skipped").inc()
+                return
+            if debounces and get_settings().debounce_window > 0:
+                latest = await cls._settle(body)
+                if latest is None:
+                    logger.info(f"Resource is being deleted, skipping {operation}.")
+                    return
+                latest_hash = _hash_spec(latest.get("spec"))
+                if latest_hash != spec_hash:
+                    logger.info(f"Spec changed while settling, {operation} applies the latest spec.")
+                    old_spec = (kwargs.get("old") or {}).get("spec")
+                    kwargs["diff"] = _diff({"spec": old_spec}, {"spec": latest.get("spec")})
+                body, spec_hash = latest, latest_hash
             try:
-                parsed = cls(**body)
+                parsed = cls.parse(body, spec_hash)
             except ValidationError as exc:
-                raise kopf.PermanentError(f"Got invalid {cls.kind!r}: {exc}")
-            method(parsed, body=body, **kwargs)
+                raise kopf.PermanentError(f"Got invalid {cls.names.kind!r}: {exc}")
+            if verifies:
+                await parsed.wait_for_dependencies()
+            try:
+                async with get_scheduler().slot(priority, body["metadata"].get("namespace")):
+                    with metrics.recording_api_calls() as api_call_durations:
+                        result = await method(parsed, body=body, patch=patch, logger=logger, **kwargs)
+            except Exception as exc:
+                if verifies:
+                    patch.status["sync"] = _failed(exc)
+                raise
+            if verifies:
+                patch.status["sync"] = {**_synced(api_call_durations, result), "specHash": spec_hash}
+
         handle.__name__ = handle.__qualname__ = f"handle_{operation}"
         return handle
 
+    @classmethod
+    async def repair(cls, namespace: Optional[str], name: str, logger) -> bool:
+        """Reconcile an indexed resource outside of kopf, as drift scans do, and record the outcome in its status.
+
+        The resource is taken from the index when called, so its latest spec is applied. Resources which are
+        invalid, gone, or being handled by kopf are skipped, as kopf applies their latest spec itself. The hash of
+        the verified spec is left as it is, as only kopf sees the body it is taken from.
+
+        :return: whether the resource was reconciled.
+        """
+        key = (namespace, name)
+        resource = cls.index.get(key)
+        if resource is None or key in cls.handling:
+            return False
+        patch = kopf.Patch()
+        try:
+            with metrics.recording_api_calls() as api_call_durations:
+                result = await resource.update(
+                    namespace=namespace, logger=logger, diff=(), body=resource.dict(), patch=patch
+                )
+            patch.status["sync"] = _synced(api_call_durations, result)
+        except Exception as exc:
+            patch.status["sync"] = _failed(exc)
+            raise
+        finally:
+            # kopf only applies the patches of its own handlers, and one may have started meanwhile:
+            if cls.index.get(key) is resource and key not in cls.handling:
+                await cls._patch(namespace, name, dict(patch))
+        return True
+
+    async def wait_for_dependencies(self):
+        """Wait for the objects which this resource depends on to be reconciled by their own handlers, if any.
+
+        This runs before the handler takes a slot from the scheduler. Handlers check their dependencies again
+        once they hold a slot, failing if they are still missing.
+        """
+
+    @classmethod
+    async def _settle(cls, body) -> Optional[dict]:
+        """Wait until a resource has gone unchanged for the debounce window, and return its latest body.
+
+        The wait is bounded by the maximum, after which the latest body is returned even if it is still changing.
+
+        :return: the latest body, or ``None`` if the resource is being deleted.
+        """
+        settings = get_settings()
+        deadline = time.monotonic() + settings.debounce_max_wait
+        latest = body
+        while True:
+            await asyncio.sleep(max(0.0, min(settings.debounce_window, deadline - time.monotonic())))
+            current = await cls.read(latest["metadata"].get("namespace"), latest["metadata"]["name"])
+            if current is None or current["metadata"].get("deletionTimestamp"):
+                return None
+            unchanged = current["metadata"].get("resourceVersion") == latest["metadata"].get("resourceVersion")
+            if unchanged or time.monotonic() >= deadline:
+                return current
+            latest = current
+
+    @classmethod
+    async def read(cls, namespace: Optional[str], name: str) -> Optional[dict]:
+        """Read the latest body of a resource from the Kubernetes API, or ``None`` if it does not exist."""
+        client = custom_objects_client()
+        options = {"group": cls.group, "version": "v1", "plural": cls.names.plural, "name": name}
+        try:
+            if cls.scope == "Namespaced":
+                return await kubernetes_call(client.get_namespaced_custom_object, namespace=namespace, **options)
+            return await kubernetes_call(client.get_cluster_custom_object, **options)
+        except ApiException as exc:
+            if exc.status != 404:
+                raise
+        return None
+
+    @classmethod
+    async def _patch(cls, namespace: Optional[str], name: str, body: dict):
+        """Merge a patch into a resource through the Kubernetes API."""
+        client = custom_objects_client()
+        options = {"group": cls.group, "version": "v1", "plural": cls.names.plural, "name": name, "body": body}
+        if cls.scope == "Namespaced":
+            await kubernetes_call(client.patch_namespaced_custom_object, namespace=namespace, **options)
+        else:
+            await kubernetes_call(client.patch_cluster_custom_object, **options)
 
     @classmethod
     def definition(cls):
@@ -119,7 +370,9 @@ More info: https://kubernetes.io/docs/reference/kubernetes-api/common-definition
                         "served": True,
                         "storage": True,
                         "schema": {"openAPIV3Schema": schema},
-                        "additionalPrinterColumns": [col.dict() for col in cls.additionalPrinterColumns],
+                        "additionalPrinterColumns": [
+                            col.dict(exclude_none=True) for col in cls.additionalPrinterColumns
+                        ],
                     }
                 ],
             },
@@ -127,22 +380,103 @@ More info: https://kubernetes.io/docs/reference/kubernetes-api/common-definition
 
     class Config:
         schema_extra = {"x-kubernetes-preserve-unknown-fields": True}
+        # Parsed models are shared between events and the index, so must not be changed by handlers:
+        allow_mutation = False
+
+
+def _instrumented(kind: str, operation: str):
+    """Record the duration and errors of a handler."""
+
+    def decorator(handler):
+        @functools.wraps(handler)
+        async def wrapper(*args, **kwargs):
+            with metrics.HANDLER_DURATION.labels(kind=kind, operation=operation).time():
+                try:
+                    return await handler(*args, **kwargs)
+                except kopf.TemporaryError:
+                    metrics.TEMPORARY_ERRORS.labels(kind=kind, operation=operation).inc()
+                    raise
+                except kopf.PermanentError:
+                    metrics.PERMANENT_ERRORS.labels(kind=kind, operation=operation).inc()
+                    raise
 
+        return wrapper
 
-_sentinel = object()
+    return decorator
 
 
-def _resolve_refs(schema: dict, part=_sentinel):
+def _synced(api_call_durations: list[float], result: Optional[dict]) -> dict:
+    """The sync status of a successful reconciliation, merged with any fields returned by the method."""
+    return {
+        "state": "Synced",
+        "error": None,
+        "verifiedAt": datetime.now(timezone.utc).isoformat(),
+        "roundTripMs": round(sum(api_call_durations) * 1000, 1),
+        **(result or {}),
+    }
+
+
+def _failed(exc: Exception) -> dict:
+    # The spec is no longer verified, so the next event must not be skipped:
+    return {"state": "Error", "error": str(exc), "specHash": None}
+
+
+def _hash_spec(spec: Optional[dict]) -> str:
+    return hashlib.sha256(json.dumps(spec, sort_keys=True).encode()).hexdigest()
+
+
+def _diff(old: Any, new: Any, field: tuple = ()) -> list[tuple]:
+    """Diff two bodies, as kopf does, into ``(operation, field, old, new)`` items for each changed field."""
+    if old == new:
+        return []
+    if isinstance(old, dict) and isinstance(new, dict):
+        keys = sorted(old.keys() | new.keys())
+        return [item for key in keys for item in _diff(old.get(key), new.get(key), (*field, key))]
+    if old is None:
+        return [("add", field, None, new)]
+    if new is None:
+        return [("remove", field, old, None)]
+    return [("change", field, old, new)]
+
+
+def _recently_verified(body, spec_hash: str) -> bool:
+    """Check whether the given spec hash was applied and verified within the configured maximum age."""
+    sync = (body.get("status") or {}).get("sync") or {}
+    if sync.get("specHash") != spec_hash or not sync.get("verifiedAt"):
+        return False
+    try:
+        verified_at = datetime.fromisoformat(sync["verifiedAt"])
+    except (TypeError, ValueError):
+        return False
+    max_age = timedelta(seconds=get_settings().spec_hash_max_age)
+    return datetime.now(timezone.utc) - verified_at < max_age
+
+
+def _resolve_refs(schema: dict) -> dict:
     """Resolve references in schema generated by pydantic.
 
-    Does not support remote or cyclical references.
+    Each reference is resolved once, and the result is shared wherever it appears. Does not support remote
+    references, nor cyclical references, which cannot be expressed in a structural schema.
+
+    :raises ValueError: if the schema references itself.
     """
-    if part is _sentinel:
-        part = schema
-    if not isinstance(part, (dict, list)):
-        return part
-    if isinstance(part, list):
-        return [_resolve_refs(schema, item) for item in part]
-    if "$ref" in part:
-        return _resolve_refs(schema, JsonPointer(part["$ref"].lstrip("#")).resolve(schema))
-    return {key: _resolve_refs(schema, value) for key, value in part.items() if key != "definitions"}
+    resolved: dict[str, Any] = {}
+    resolving: set[str] = set()
+
+    def resolve(part):
+        if isinstance(part, list):
+            return [resolve(item) for item in part]
+        if not isinstance(part, dict):
+            return part
+        if "$ref" in part:
+            ref = part["$ref"]
+            if ref not in resolved:
+                if ref in resolving:
+                    raise ValueError(f"Cannot resolve cyclical reference to {ref!r}.")
+                resolving.add(ref)
+                resolved[ref] = resolve(JsonPointer(ref.lstrip("#")).resolve(schema))
+                resolving.discard(ref)
+            return resolved[ref]
+        return {key: resolve(value) for key, value in part.items() if key != "definitions"}
+
+    return resolve(schema)
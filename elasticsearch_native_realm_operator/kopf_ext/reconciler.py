@@ -0,0 +1,282 @@
+"""Generic reconciliation of Elasticsearch security objects with the resources which manage them.
+
+Each kind of object is declared by subclassing :class:`Reconciler` with the APIs to get, list, put and delete
+objects of that kind, and how to compare them. The reconciler then provides caching, bulk listing, batched
+lookups, no-op detection, ownership checks and metrics for the kind, and reconciles each resource to the
+clusters it selects.
+"""
+import abc
+import logging
+from collections import defaultdict
+from typing import Any, Awaitable, Callable, ClassVar, Iterable, Optional
+
+import kopf
+from elasticsearch import AsyncElasticsearch, NotFoundError
+
+from elasticsearch_native_realm_operator import metrics
+from elasticsearch_native_realm_operator.cache import DocumentCache, SecurityCache, get_security_cache
+from elasticsearch_native_realm_operator.client import async_elasticsearch_client
+from elasticsearch_native_realm_operator.clusters import check_clusters, deselected_clusters, fan_out, for_each_cluster
+from elasticsearch_native_realm_operator.coalesce import Coalescer
+from elasticsearch_native_realm_operator.config import get_settings
+from elasticsearch_native_realm_operator.constants import MANAGED_BY_KEY
+from elasticsearch_native_realm_operator.dependencies import DependencyWaiters
+from elasticsearch_native_realm_operator.kopf_ext.models import CustomResource
+
+# Completes the body of an object before it is put to a cluster, given the cluster and the current object:
+Prepare = Callable[[str, Any, dict], Awaitable[dict]]
+# Called with the cluster and the object as returned by the API, after an object is put to a cluster:
+AfterWrite = Callable[[str, Any], Awaitable]
+
+
+class Reconciler(abc.ABC):
+    """Reconciles one kind of Elasticsearch security object.
+
+    Subclasses declare the kind's APIs by implementing ``_get``, ``_list``, ``_put`` and ``_delete``, and how
+    objects are compared by implementing ``differences``. They may override ``compact`` and ``managed_by`` to
+    change how objects are stored.
+    """
+
+    # Name of the kind in API call metrics, e.g. ``role`` for ``security.put_role``:
+    name: ClassVar[str]
+    # Name of the kind in messages:
+    label: ClassVar[str]
+
+    def __init__(self):
+        # Names of the objects known to exist in each cluster, as put by the operator or found by lookups:
+        self.known: defaultdict[str, set[str]] = defaultdict(set)
+        # Callers waiting for objects to be known to exist, by cluster and name:
+        self.dependencies: DependencyWaiters[tuple[str, str]] = DependencyWaiters()
+        self._lookups: dict[str, Coalescer[str, Any]] = {}
+        SecurityCache.register_kind(self.name, self.list_all, self.compact)
+
+    @abc.abstractmethod
+    async def _get(self, client: AsyncElasticsearch, names: list[str]) -> dict[str, dict]:
+        """Get the objects with the given names, raising :class:`NotFoundError` if there are none."""
+
+    @abc.abstractmethod
+    async def _list(self, client: AsyncElasticsearch) -> dict[str, dict]:
+        """List every object of the kind."""
+
+    @abc.abstractmethod
+    async def _put(self, client: AsyncElasticsearch, name: str, body: dict) -> dict:
+        """Create or update an object, and return it as it would now be read back.
+
+        Secrets in the result, such as generated keys, are passed to ``after_write`` but must not be stored by
+        ``compact``.
+        """
+
+    @abc.abstractmethod
+    async def _delete(self, client: AsyncElasticsearch, name: str):
+        """Delete an object, raising :class:`NotFoundError` if it does not exist."""
+
+    def compact(self, document: Optional[dict]) -> Any:
+        """Convert a document to the representation held in the cache, dropping any secrets."""
+        return document
+
+    @abc.abstractmethod
+    def differences(self, current: Any, desired: dict) -> list[str]:
+        """Return the names of the fields which differ between the stored object and the desired body."""
+
+    def managed_by(self, current: Any) -> Optional[str]:
+        return (current.get("metadata") or {}).get(MANAGED_BY_KEY)
+
+    def cache(self, cluster: str) -> DocumentCache:
+        return get_security_cache(cluster).documents(self.name)
+
+    async def list_all(self, cluster: str) -> dict[str, dict]:
+        known = self.known[cluster]
+        listed_since = set(known)
+        with metrics.time_api_call(f"security.get_{self.name}"):
+            documents = await self._list(async_elasticsearch_client(cluster))
+        # Objects deleted outside of the operator are no longer known, unless put while the listing was in flight:
+        known -= listed_since - documents.keys()
+        return documents
+
+    async def fetch(self, name: str, cluster: str) -> Any:
+        """Fetch an object through the cache, returning it as stored, or ``None`` if it does not exist."""
+        hit, current = self.cache(cluster).get(name)
+        if hit:
+            return current
+        return (await self._fetch({name}, cluster)).get(name)
+
+    async def _fetch(self, names: set[str], cluster: str) -> dict[str, Any]:
+        try:
+            with metrics.time_api_call(f"security.get_{self.name}"):
+                found = await self._get(async_elasticsearch_client(cluster), sorted(names))
+        except NotFoundError:
+            found = {}
+        cache = self.cache(cluster)
+        stored = {name: cache.set(name, found.get(name)) for name in names}
+        self.known[cluster] -= names - found.keys()
+        self._mark_known(found, cluster)
+        return {name: current for name, current in stored.items() if current is not None}
+
+    async def existing(self, names: Iterable[str], cluster: str) -> set[str]:
+        """Return which of the named objects exist.
+
+        Known and cached objects are answered from memory. The remaining objects are looked up together with
+        those of any other concurrent callers, in one request.
+        """
+        cache = self.cache(cluster)
+        known = self.known[cluster]
+        existing, missing = set(), set()
+        for name in names:
+            if name in known:
+                existing.add(name)
+                continue
+            hit, current = cache.get(name)
+            if not hit:
+                missing.add(name)
+            elif current is not None:
+                existing.add(name)
+        if missing:
+            existing |= set(await self._lookup(cluster).get(missing))
+        return existing
+
+    def _lookup(self, cluster: str) -> Coalescer[str, Any]:
+        if cluster not in self._lookups:
+            window = get_settings().role_lookup_window
+            self._lookups[cluster] = Coalescer(lambda names: self._fetch(names, cluster), window=window)
+        return self._lookups[cluster]
+
+    async def wait_for(self, names: set[str], timeout: float, cluster: str) -> set[str]:
+        """Wait until the named objects are put by their handlers, or found by lookups.
+
+        :return: which of the objects are known to exist, once all are or the timeout passes.
+        """
+        known = self.known[cluster]
+        await self.dependencies.wait({(cluster, name) for name in names - known}, timeout=timeout)
+        return names & known
+
+    def _mark_known(self, names: Iterable[str], cluster: str):
+        names = list(names)
+        self.known[cluster].update(names)
+        self.dependencies.notify((cluster, name) for name in names)
+
+    async def put(self, name: str, body: dict, cluster: str) -> dict:
+        """Put an object, writing it through the cache, and return it as returned by ``_put``."""
+        with metrics.time_api_call(f"security.put_{self.name}"):
+            document = await self._put(async_elasticsearch_client(cluster), name, body)
+        self.cache(cluster).set(name, document)
+        self._mark_known([name], cluster)
+        return document
+
+    async def delete(self, name: str, cluster: str):
+        try:
+            with metrics.time_api_call(f"security.delete_{self.name}"):
+                await self._delete(async_elasticsearch_client(cluster), name)
+        except NotFoundError:
+            # Already deleted, for example by another replica handling the same deletion:
+            pass
+        self.cache(cluster).set(name, None)
+        self.known[cluster].discard(name)
+
+    async def apply(
+        self,
+        resource: CustomResource,
+        name: str,
+        desired: dict,
+        *,
+        logger: logging.Logger,
+        diff: list[tuple],
+        body: kopf.Body,
+        patch: kopf.Patch,
+        changed: Iterable[str] = (),
+        prepare: Optional[Prepare] = None,
+        after_write: Optional[AfterWrite] = None,
+    ) -> dict:
+        """Reconcile the object managed by a resource to each cluster it selects, and remove it from each
+        cluster it stopped selecting.
+
+        :param desired: the body of the object, to which the management metadata is added.
+        :param changed: fields which are known to have changed, though they cannot be compared.
+        :param prepare: completes the body before it is put, for example with credentials.
+        :param after_write: called after the object is put, for example to store credentials.
+        :return: the combined outcome and drifted fields of all clusters.
+        """
+        owner = managed_by(resource)
+        desired = {**desired, "metadata": {**(desired.get("metadata") or {}), MANAGED_BY_KEY: owner}}
+        clusters = resource.spec.target_clusters()
+        check_clusters(clusters)
+        await for_each_cluster(deselected_clusters(diff), lambda cluster: self._remove(owner, name, cluster, logger))
+
+        async def reconcile(cluster: str) -> dict:
+            return await self._reconcile(
+                resource.names.kind, owner, name, desired, cluster, logger, list(changed), prepare, after_write
+            )
+
+        return await fan_out(clusters, reconcile, body=body, patch=patch)
+
+    async def _reconcile(
+        self,
+        kind: str,
+        owner: str,
+        name: str,
+        desired: dict,
+        cluster: str,
+        logger: logging.Logger,
+        changed: list[str],
+        prepare: Optional[Prepare],
+        after_write: Optional[AfterWrite],
+    ) -> dict:
+        current = await self.fetch(name, cluster)
+        differences = None
+        if current is not None:
+            differences = self.differences(current, desired)
+            differences += [field for field in changed if field not in differences]
+            if not differences:
+                self._mark_known([name], cluster)
+                logger.info(f"The {self.label} {name!r} is already up-to-date in cluster {cluster!r}.")
+                metrics.RECONCILE_OUTCOMES.labels(kind=kind, outcome="noop").inc()
+                return {"outcome": "noop"}
+            # Ensure the object is managed by this resource (prevents conflicts):
+            if self.managed_by(current) != owner:
+                raise kopf.PermanentError(
+                    f"The {self.label} {name!r} already exists and is not managed by this resource."
+                )
+
+        body = await prepare(cluster, current, dict(desired)) if prepare else dict(desired)
+        document = await self.put(name, body, cluster)
+        if after_write:
+            await after_write(cluster, document)
+        metrics.RECONCILE_OUTCOMES.labels(kind=kind, outcome="write").inc()
+        if differences:
+            logger.info(
+                f"Successfully reconciled the {self.label} {name!r} in cluster {cluster!r}, "
+                f"which differed in: {', '.join(differences)}"
+            )
+        else:
+            logger.info(f"Successfully reconciled the {self.label} {name!r} in cluster {cluster!r}")
+        return {"outcome": "write", "drift": differences or []}
+
+    async def withdraw(self, resource: CustomResource, name: str, logger: logging.Logger):
+        """Remove the object managed by a resource from each cluster it selects."""
+        # Clusters which are no longer configured cannot be cleaned up:
+        clusters = [cluster for cluster in resource.spec.target_clusters() if cluster in get_settings().clusters]
+        owner = managed_by(resource)
+        await for_each_cluster(clusters, lambda cluster: self._remove(owner, name, cluster, logger))
+
+    async def _remove(self, owner: str, name: str, cluster: str, logger: logging.Logger):
+        # The cache may not yet hold an object created by another write, so only the cluster can tell it is gone:
+        current = (await self._fetch({name}, cluster)).get(name)
+        if current is None:
+            logger.info(f"The {self.label} {name!r} does not exist in cluster {cluster!r}, no action needed.")
+            return
+        # Don't delete objects which aren't managed by this resource:
+        if self.managed_by(current) != owner:
+            logger.warning(f"Skipping deletion of the {self.label} {name!r}, as it is not managed by this resource.")
+            return
+        await self.delete(name, cluster)
+        logger.info(f"Successfully removed the {self.label} {name!r} from cluster {cluster!r}")
+
+
+def managed_by(resource: CustomResource) -> str:
+    """The management metadata which marks objects as managed by a resource."""
+    return f"{resource.metadata.get('namespace', 'default')}:{resource.kind}/{resource.metadata['name']}"
+
+
+def check_immutable(diff: list[tuple], field: tuple[str, ...], message: str):
+    """Fail permanently if an update adds, changes or removes a field which cannot be changed once created."""
+    if field in [operation[1] for operation in diff]:
+        raise kopf.PermanentError(message)
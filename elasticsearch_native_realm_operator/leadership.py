@@ -0,0 +1,173 @@
+"""Leader election between operator replicas through a Kubernetes Lease object.
+
+Only the replica holding the Lease reconciles resources. The replicas also peer with each other through kopf, which
+pauses any replica that sees a peer of higher priority: the leader takes the higher priority, so kopf stops watching
+resources on the standbys, and they neither handle events nor write kopf's state to resources. Standbys keep their
+processes, connections and security caches warm. When the leader stops renewing the Lease, a standby takes it over
+and raises its priority, and kopf resumes it, skipping the resources whose spec the previous leader verified.
+"""
+import asyncio
+import logging
+import socket
+import time
+from functools import cache
+from typing import Optional
+
+import kopf
+from kubernetes.client.exceptions import ApiException
+
+from elasticsearch_native_realm_operator import metrics
+from elasticsearch_native_realm_operator.client import custom_objects_client, kubernetes_call
+from elasticsearch_native_realm_operator.config import get_settings
+from elasticsearch_native_realm_operator.leases import delete_lease, is_live, now, read_lease, renew_lease
+
+logger = logging.getLogger(__name__)
+
+# Priorities in kopf's peering: standbys pause while they see the leader, while the leader runs:
+LEADER_PRIORITY = 1
+STANDBY_PRIORITY = 0
+
+
+class Leadership:
+    """Whether this replica is the leader, which it remains for as long as it renews the Lease.
+
+    Whenever leader election is disabled, this replica is always the leader, and kopf runs standalone.
+    """
+
+    def __init__(
+        self,
+        identity: str,
+        namespace: str,
+        name: str = "native-realm-operator",
+        lease_duration: float = 15.0,
+        renew_interval: float = 5.0,
+        enabled: bool = True,
+    ):
+        self.identity = identity
+        self.namespace = namespace
+        self.name = name
+        self.lease_duration = lease_duration
+        self.renew_interval = renew_interval
+        self.enabled = enabled
+        self.is_leader = not enabled
+        # kopf's settings, whose peering priority follows the Lease once attached:
+        self.settings: Optional[kopf.OperatorSettings] = None
+        self._renewed_at = float("-inf")
+        metrics.LEADER.set(self.is_leader)
+
+    @property
+    def lease_name(self) -> str:
+        return f"{self.name}-leader"
+
+    def attach(self, settings: kopf.OperatorSettings):
+        """Configure kopf to peer with the other replicas through the ClusterKopfPeering named after the Lease.
+
+        kopf only starts handling resources once it has seen the peering, and pauses whenever a peer has a higher
+        or the same priority, so two replicas which both claim to lead pause rather than both write.
+        """
+        settings.peering.standalone = not self.enabled
+        if not self.enabled:
+            return
+        settings.peering.name = self.name
+        settings.peering.clusterwide = True
+        settings.peering.mandatory = True
+        # Peers which stop without leaving are ignored once they have not been seen for this long:
+        settings.peering.lifetime = max(1, round(self.lease_duration))
+        settings.peering.priority = LEADER_PRIORITY if self.is_leader else STANDBY_PRIORITY
+        self.settings = settings
+
+    async def campaign(self):
+        """Renew the Lease if this replica holds it, or take it over if its holder has stopped renewing it.
+
+        Updates are conditional on the version of the Lease which was read, so of several replicas campaigning at
+        once, only one succeeds.
+        """
+        lease = await read_lease(self.namespace, self.lease_name)
+        holder = lease.spec.holder_identity if lease and lease.spec else None
+        if lease is not None and holder != self.identity and is_live(lease):
+            await self._set_leader(False, holder)
+            return
+        try:
+            await renew_lease(
+                self.namespace,
+                self.lease_name,
+                identity=self.identity,
+                duration=self.lease_duration,
+                resource_version=lease.metadata.resource_version if lease else None,
+                acquire=holder != self.identity,
+            )
+        except ApiException as exc:
+            if exc.status != 409:
+                raise
+            # Another replica updated the Lease first:
+            await self._set_leader(False, None)
+            return
+        self._renewed_at = time.monotonic()
+        await self._set_leader(True, self.identity)
+
+    async def _set_leader(self, is_leader: bool, holder: Optional[str]):
+        if is_leader == self.is_leader:
+            return
+        self.is_leader = is_leader
+        metrics.LEADER.set(is_leader)
+        if is_leader:
+            logger.info("Elected leader, taking over.")
+        else:
+            logger.warning(f"Lost leadership to {holder or 'another replica'}, standing by.")
+        if self.settings is None:
+            return
+        peering = self.settings.peering
+        peering.priority = LEADER_PRIORITY if is_leader else STANDBY_PRIORITY
+        try:
+            await publish_peer(self.name, self.identity, peering.priority, peering.lifetime)
+        except Exception:
+            # kopf publishes the priority itself at its next keep-alive:
+            logger.exception("Failed to publish the change of leadership to the other replicas.")
+
+    async def campaign_periodically(self):
+        while True:
+            await asyncio.sleep(self.renew_interval)
+            try:
+                await self.campaign()
+            except Exception:
+                logger.exception("Failed to campaign for leadership, will retry at the next interval.")
+                # Another replica may take over once the Lease expires, so stop writing before it can:
+                if self.is_leader and time.monotonic() - self._renewed_at >= self.lease_duration - self.renew_interval:
+                    await self._set_leader(False, None)
+
+    async def resign(self):
+        """Release the Lease, if held, so that a standby can take over without waiting for it to expire."""
+        if self.enabled and self.is_leader:
+            await self._set_leader(False, None)
+            await delete_lease(self.namespace, self.lease_name)
+
+
+async def publish_peer(name: str, identity: str, priority: int, lifetime: int):
+    """Record this replica's priority in its entry of kopf's peering object, as kopf's own keep-alive does.
+
+    The change is seen at once by every peer, rather than at this replica's next keep-alive. The identity must be
+    the one kopf uses, which it reads from ``POD_ID``.
+    """
+    client = custom_objects_client()
+    entry = {"priority": priority, "lifetime": lifetime, "lastseen": now().isoformat()}
+    await kubernetes_call(
+        client.patch_cluster_custom_object,
+        group="kopf.dev",
+        version="v1",
+        plural="clusterkopfpeerings",
+        name=name,
+        body={"status": {identity: entry}},
+    )
+
+
+@cache
+def get_leadership() -> Leadership:
+    settings = get_settings()
+    return Leadership(
+        identity=settings.pod_id or socket.gethostname(),
+        namespace=settings.leader_election_namespace,
+        name=settings.leader_election_name,
+        lease_duration=settings.leader_election_lease_duration,
+        renew_interval=settings.leader_election_renew_interval,
+        enabled=settings.leader_election_enabled,
+    )
@@ -0,0 +1,83 @@
+"""Helpers for coordination between operator replicas through Kubernetes Lease objects."""
+from datetime import datetime, timedelta, timezone
+from typing import Any, Optional
+
+from kubernetes.client.exceptions import ApiException
+
+from elasticsearch_native_realm_operator.client import coordination_client, kubernetes_call
+
+
+def now() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+def format_micro_time(value: datetime) -> str:
+    return value.strftime("%Y-%m-%dT%H:%M:%S.%fZ")
+
+
+def is_live(lease: Any, at: Optional[datetime] = None) -> bool:
+    """Whether a lease has been renewed within its duration."""
+    spec = lease.spec
+    if not (spec and spec.holder_identity and spec.renew_time and spec.lease_duration_seconds):
+        return False
+    return spec.renew_time + timedelta(seconds=spec.lease_duration_seconds) > (at or now())
+
+
+async def read_lease(namespace: str, name: str) -> Optional[Any]:
+    """Read a lease, or return ``None`` if it does not exist."""
+    client = coordination_client()
+    try:
+        return await kubernetes_call(client.read_namespaced_lease, name=name, namespace=namespace)
+    except ApiException as exc:
+        if exc.status != 404:
+            raise
+    return None
+
+
+async def renew_lease(
+    namespace: str,
+    name: str,
+    identity: str,
+    duration: float,
+    resource_version: Optional[str] = None,
+    acquire: bool = False,
+):
+    """Record that the identity holds the lease, creating it if it does not exist.
+
+    :param resource_version: only update the lease if it has not changed since this version was read. Otherwise,
+        or if the lease was created in the meantime, an :class:`ApiException` with status 409 is raised.
+    :param acquire: whether the identity is taking the lease over, rather than renewing it.
+    """
+    client = coordination_client()
+    spec = {
+        "holderIdentity": identity,
+        "leaseDurationSeconds": max(1, round(duration)),
+        "renewTime": format_micro_time(now()),
+    }
+    if acquire:
+        spec["acquireTime"] = spec["renewTime"]
+    body: dict = {"spec": spec}
+    if resource_version:
+        body["metadata"] = {"resourceVersion": resource_version}
+    try:
+        return await kubernetes_call(client.patch_namespaced_lease, name=name, namespace=namespace, body=body)
+    except ApiException as exc:
+        if exc.status != 404:
+            raise
+    body = {
+        "apiVersion": "coordination.k8s.io/v1",
+        "kind": "Lease",
+        "metadata": {"name": name, "namespace": namespace},
+        "spec": {**spec, "acquireTime": spec["renewTime"]},
+    }
+    return await kubernetes_call(client.create_namespaced_lease, namespace=namespace, body=body)
+
+
+async def delete_lease(namespace: str, name: str):
+    """Delete a lease, if it still exists."""
+    client = coordination_client()
+    try:
+        await kubernetes_call(client.delete_namespaced_lease, name=name, namespace=namespace)
+    except ApiException as exc:
+        if exc.status != 404:
+            raise
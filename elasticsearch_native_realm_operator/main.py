@@ -1,8 +1,37 @@
+import asyncio
 import logging
 
 import kopf
-from elasticsearch_native_realm_operator.resources.role import ElasticsearchNativeRealmRole
-from elasticsearch_native_realm_operator.resources.user import ElasticsearchNativeRealmUser
+import prometheus_client
+
+from elasticsearch_native_realm_operator.cache import get_security_cache
+from elasticsearch_native_realm_operator.client import async_elasticsearch_client
+from elasticsearch_native_realm_operator.config import get_settings
+from elasticsearch_native_realm_operator.drift import DriftScanner
+from elasticsearch_native_realm_operator.hashing import hashing_pool, parse_algorithm
+from elasticsearch_native_realm_operator.kopf_ext import CustomResource, Reconciler
+from elasticsearch_native_realm_operator.leadership import get_leadership
+from elasticsearch_native_realm_operator.orphans import OrphanCollector
+from elasticsearch_native_realm_operator.resources.api_key import ElasticsearchNativeRealmApiKey, api_key_reconciler
+from elasticsearch_native_realm_operator.resources.role import ElasticsearchNativeRealmRole, role_reconciler
+from elasticsearch_native_realm_operator.resources.role_mapping import (
+    ElasticsearchNativeRealmRoleMapping,
+    role_mapping_reconciler,
+)
+from elasticsearch_native_realm_operator.resources.user import ElasticsearchNativeRealmUser, user_reconciler
+
+# Each resource, with the reconciler of the objects it manages:
+RESOURCES: dict[type[CustomResource], Reconciler] = {
+    ElasticsearchNativeRealmRole: role_reconciler,
+    ElasticsearchNativeRealmUser: user_reconciler,
+    ElasticsearchNativeRealmRoleMapping: role_mapping_reconciler,
+    ElasticsearchNativeRealmApiKey: api_key_reconciler,
+}
+
+
+def is_leader() -> bool:
+    """Whether this replica runs background tasks: kopf pauses on standbys, but they do not."""
+    return get_leadership().is_leader
 
 
 @kopf.on.startup()
@@ -12,7 +41,84 @@ def configure(settings: kopf.OperatorSettings, **_):
     # Set the finalizer annotation:
     settings.persistence.finalizer = "elasticsearchnativerealm.ckpd.co/finalizer"
     settings.posting.level = logging.WARNING
+    settings.batching.batch_window = get_settings().event_batch_window
+    # Fail fast if passwords cannot be hashed as configured:
+    password_hashing_algorithm = get_settings().password_hashing_algorithm
+    if password_hashing_algorithm:
+        parse_algorithm(password_hashing_algorithm)
+    # Expose metrics, if enabled:
+    metrics_port = get_settings().metrics_port
+    if metrics_port is not None:
+        prometheus_client.start_http_server(metrics_port)
+
+
+@kopf.on.startup()
+async def load_security_cache(memo: kopf.Memo, **_):
+    # Fetch all roles and users up-front, so that resuming each resource does not need its own request:
+    settings = get_settings()
+    security_caches = [get_security_cache(cluster) for cluster in settings.clusters]
+    await asyncio.gather(*(security_cache.refresh() for security_cache in security_caches))
+    memo.security_cache_refresh = [
+        asyncio.create_task(security_cache.refresh_periodically(settings.security_cache_refresh_interval))
+        for security_cache in security_caches
+    ]
+
+
+@kopf.on.startup()
+async def elect_leader(settings: kopf.OperatorSettings, memo: kopf.Memo, **_):
+    # Campaign before kopf starts, so that if there is no leader, this replica starts with the leader's priority:
+    leadership = get_leadership()
+    leadership.attach(settings)
+    memo.leadership = None
+    if leadership.enabled:
+        await leadership.campaign()
+        memo.leadership = asyncio.create_task(leadership.campaign_periodically())
+
+
+@kopf.on.startup()
+async def start_drift_scanner(memo: kopf.Memo, **_):
+    settings = get_settings()
+    memo.drift_scanner = None
+    if settings.drift_scan_interval is not None:
+        scanner = DriftScanner(
+            list(RESOURCES),
+            interval=settings.drift_scan_interval,
+            jitter=settings.drift_scan_jitter,
+            active=is_leader,
+        )
+        memo.drift_scanner = asyncio.create_task(scanner.run_periodically())
+
+
+@kopf.on.startup()
+async def start_orphan_collector(memo: kopf.Memo, **_):
+    settings = get_settings()
+    memo.orphan_collector = None
+    if settings.orphan_collection_interval is not None:
+        collector = OrphanCollector(
+            {resource: reconciler.delete for resource, reconciler in RESOURCES.items()},
+            interval=settings.orphan_collection_interval,
+            rate=settings.orphan_collection_rate,
+            dry_run=settings.orphan_collection_dry_run,
+            active=is_leader,
+        )
+        memo.orphan_collector = asyncio.create_task(collector.run_periodically())
+
+
+@kopf.on.cleanup()
+async def close_clients(memo: kopf.Memo, **_):
+    if memo.leadership:
+        memo.leadership.cancel()
+        await get_leadership().resign()
+    for task in memo.security_cache_refresh:
+        task.cancel()
+    if memo.drift_scanner:
+        memo.drift_scanner.cancel()
+    if memo.orphan_collector:
+        memo.orphan_collector.cancel()
+    for cluster in get_settings().clusters:
+        await async_elasticsearch_client(cluster).close()
+    hashing_pool().shutdown()
 
 
-ElasticsearchNativeRealmRole.register()
-ElasticsearchNativeRealmUser.register()
+for resource in RESOURCES:
+    resource.register()
@@ -0,0 +1,76 @@
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Iterator, Optional
+
+from prometheus_client import Counter, Gauge, Histogram
+
+HANDLER_DURATION = Histogram(
+    "native_realm_operator_handler_duration_seconds",
+    "Time taken by each handler run.",
+    ["kind", "operation"],
+)
+API_CALL_DURATION = Histogram(
+    "native_realm_operator_api_call_duration_seconds",
+    "Time taken by each call to the Elasticsearch or Kubernetes API.",
+    ["api"],
+)
+RECONCILE_OUTCOMES = Counter(
+    "native_realm_operator_reconcile_outcomes_total",
+    "Reconciliations by outcome: 'noop' when already up-to-date, 'write' when changed, 'skipped' when verified.",
+    ["kind", "outcome"],
+)
+TEMPORARY_ERRORS = Counter(
+    "native_realm_operator_temporary_errors_total",
+    "Handler runs which raised a temporary error, and will be retried.",
+    ["kind", "operation"],
+)
+PERMANENT_ERRORS = Counter(
+    "native_realm_operator_permanent_errors_total",
+    "Handler runs which raised a permanent error, and will not be retried.",
+    ["kind", "operation"],
+)
+SCHEDULER_WAIT = Histogram(
+    "native_realm_operator_scheduler_wait_seconds",
+    "Time for which each reconciliation waited for a slot, by priority.",
+    ["priority"],
+)
+
+LEADER = Gauge(
+    "native_realm_operator_leader",
+    "Whether this replica holds the leader Lease, and so makes changes (always 1 without leader election).",
+)
+RATE_LIMIT = Gauge(
+    "native_realm_operator_elasticsearch_rate_limit",
+    "Current adaptive limit on requests per second to each Elasticsearch cluster.",
+    ["cluster", "budget"],
+)
+
+
+# Durations of the API calls made in the current context, if they are being recorded:
+_api_call_durations: ContextVar[Optional[list[float]]] = ContextVar("api_call_durations", default=None)
+
+
+@contextmanager
+def time_api_call(api: str):
+    """Time a call to an external API, for use as a context manager."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        duration = time.perf_counter() - start
+        API_CALL_DURATION.labels(api=api).observe(duration)
+        durations = _api_call_durations.get()
+        if durations is not None:
+            durations.append(duration)
+
+
+@contextmanager
+def recording_api_calls() -> Iterator[list[float]]:
+    """Record the duration of each API call made within the block, including from tasks it starts."""
+    durations: list[float] = []
+    token = _api_call_durations.set(durations)
+    try:
+        yield durations
+    finally:
+        _api_call_durations.reset(token)
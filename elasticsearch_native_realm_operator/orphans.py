@@ -0,0 +1,130 @@
+import asyncio
+import logging
+from itertools import chain
+from typing import Awaitable, Callable, NamedTuple, Optional
+
+from pydantic import ValidationError
+
+from elasticsearch_native_realm_operator.cache import get_security_cache
+from elasticsearch_native_realm_operator.config import get_settings
+from elasticsearch_native_realm_operator.constants import MANAGED_BY_KEY
+from elasticsearch_native_realm_operator.kopf_ext import CustomResource
+from elasticsearch_native_realm_operator.scheduling import Priority, get_scheduler
+
+logger = logging.getLogger(__name__)
+
+
+class Owner(NamedTuple):
+    namespace: str
+    kind: str
+    name: str
+
+
+def parse_managed_by(value: Optional[str]) -> Optional[Owner]:
+    """Parse the owner of a role or user from its ``namespace:kind/name`` management metadata."""
+    if not value:
+        return None
+    namespace, _, kind_and_name = value.partition(":")
+    kind, _, name = kind_and_name.partition("/")
+    if not (namespace and kind and name):
+        return None
+    return Owner(namespace, kind, name)
+
+
+class OrphanCollector:
+    """Periodically delete roles and users whose managing resource no longer exists, or no longer selects the
+    cluster they are in.
+
+    This catches resources which were removed while the operator was not running, or whose finalizer was
+    removed. Objects are only deleted once they have been found orphaned by two consecutive sweeps, so that a
+    resource which has not yet appeared on the watch stream is not mistaken for a deleted one, and once their
+    managing resource has been read from Kubernetes. Resources which exist but never appear on the watch stream
+    are in namespaces which this operator does not watch, but another deployment may: their namespaces are
+    skipped from then on.
+    """
+
+    def __init__(
+        self,
+        deleters: dict[type[CustomResource], Callable[[str, str], Awaitable]],
+        interval: float,
+        rate: float,
+        dry_run: bool = False,
+        active: Callable[[], bool] = lambda: True,
+    ):
+        self.deleters = {resource.names.kind: (resource, delete) for resource, delete in deleters.items()}
+        self.interval = interval
+        self.rate = rate
+        self.dry_run = dry_run
+        self.active = active
+        self._candidates: set[tuple[str, str, Owner]] = set()
+        self._unwatched_namespaces: set[str] = set()
+
+    async def sweep(self) -> None:
+        # Standbys do not watch resources, so would find every object orphaned:
+        if not self.active():
+            self._candidates = set()
+            return
+        candidates = set()
+        for cluster in get_settings().clusters:
+            listings = await get_security_cache(cluster).refresh()
+            for name, document in chain.from_iterable(listing.items() for listing in listings.values()):
+                owner = parse_managed_by((document.get("metadata") or {}).get(MANAGED_BY_KEY))
+                if not owner or owner.kind not in self.deleters or owner.namespace in self._unwatched_namespaces:
+                    continue
+                if self._is_orphaned(owner, cluster):
+                    candidates.add((cluster, name, owner))
+
+        deleted = 0
+        for cluster, name, owner in sorted(candidates & self._candidates):
+            # The resource may have appeared since the previous sweep, or be missing from the watch stream:
+            if not self._is_orphaned(owner, cluster) or not await self._confirm_orphaned(owner, cluster):
+                continue
+            reason = f"{owner.kind} {owner.namespace}/{owner.name} does not exist or does not select {cluster!r}"
+            if self.dry_run:
+                logger.info(f"Would delete {name!r} from cluster {cluster!r}, as {reason}.")
+                continue
+            _, delete = self.deleters[owner.kind]
+            try:
+                async with get_scheduler().slot(Priority.BACKGROUND, owner.namespace):
+                    await delete(name, cluster)
+            except Exception as exc:
+                logger.warning(f"Failed to delete orphaned {name!r} from cluster {cluster!r}: {exc}")
+                continue
+            logger.info(f"Deleted {name!r} from cluster {cluster!r}, as {reason}.")
+            deleted += 1
+            await asyncio.sleep(1 / self.rate)
+        logger.info(f"Orphan sweep found {len(candidates)} candidates, and deleted {deleted}.")
+        self._candidates = candidates
+
+    def _is_orphaned(self, owner: Owner, cluster: str) -> bool:
+        resource_type, _ = self.deleters[owner.kind]
+        key = (owner.namespace, owner.name)
+        if key not in resource_type.index:
+            return True
+        resource = resource_type.index[key]
+        # Resources which are invalid cannot be said to have stopped selecting the cluster:
+        return resource is not None and cluster not in resource.spec.target_clusters()
+
+    async def _confirm_orphaned(self, owner: Owner, cluster: str) -> bool:
+        """Check from Kubernetes, rather than the index, that the resource is gone or does not select the cluster."""
+        resource_type, _ = self.deleters[owner.kind]
+        body = await resource_type.read(owner.namespace, owner.name)
+        if body is None or body["metadata"].get("deletionTimestamp"):
+            return True
+        if (owner.namespace, owner.name) not in resource_type.index:
+            logger.info(f"Skipping orphans in namespace {owner.namespace!r}, whose resources are not watched.")
+            self._unwatched_namespaces.add(owner.namespace)
+            return False
+        try:
+            resource = resource_type.parse(body)
+        except ValidationError:
+            return False
+        return cluster not in resource.spec.target_clusters()
+
+    async def run_periodically(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.sweep()
+            except Exception:
+                logger.exception("Orphan sweep failed, will retry at the next interval.")
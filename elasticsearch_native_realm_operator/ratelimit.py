@@ -0,0 +1,82 @@
+import asyncio
+import time
+from typing import Optional
+
+
+class AdaptiveTokenBucket:
+    """Token bucket whose rate adapts to the capacity of the server, with additive increase and multiplicative
+    decrease (AIMD).
+
+    Each request which succeeds promptly raises the rate by a small amount, while a request which signals
+    overload, or which is slower than the latency threshold, cuts the rate by a factor. Cuts are limited to one
+    per cooldown period, so a burst of concurrent failures only counts once.
+    """
+
+    def __init__(
+        self,
+        rate: float,
+        min_rate: float,
+        max_rate: float,
+        increase: float = 1.0,
+        decrease_factor: float = 0.5,
+        latency_threshold: float = 1.0,
+        cooldown: float = 1.0,
+    ):
+        self.rate = rate
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.increase = increase
+        self.decrease_factor = decrease_factor
+        self.latency_threshold = latency_threshold
+        self.cooldown = cooldown
+        self._tokens = 1.0
+        self._updated = time.monotonic()
+        self._last_decrease = float("-inf")
+        # Created on first use, so that it belongs to the running event loop:
+        self._lock: Optional[asyncio.Lock] = None
+
+    async def acquire(self):
+        """Wait until a request may be sent. Waiters are served in order of arrival."""
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            self._refill()
+            if self._tokens < 1:
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+                self._refill()
+            self._tokens -= 1
+
+    def record_success(self, latency: float):
+        if latency > self.latency_threshold:
+            self.record_overload()
+            return
+        # Additive increase of roughly `increase` requests per second, per second at full utilisation:
+        self.rate = min(self.max_rate, self.rate + self.increase / self.rate)
+
+    def record_overload(self):
+        now = time.monotonic()
+        if now - self._last_decrease < self.cooldown:
+            return
+        self._last_decrease = now
+        self.rate = max(self.min_rate, self.rate * self.decrease_factor)
+
+    def _refill(self):
+        now = time.monotonic()
+        # Allow bursts of up to one second's worth of requests:
+        self._tokens = min(max(self.rate, 1.0), self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+
+class RateLimiter:
+    """Separate adaptive budgets for reads and for writes, so a storm of writes does not starve reads."""
+
+    READ_METHODS = frozenset({"GET", "HEAD"})
+
+    def __init__(self, read: AdaptiveTokenBucket, write: AdaptiveTokenBucket, name: str = "default"):
+        self.read = read
+        self.write = write
+        # Identifies the limiter in metrics:
+        self.name = name
+
+    def bucket(self, method: str) -> AdaptiveTokenBucket:
+        return self.read if method.upper() in self.READ_METHODS else self.write
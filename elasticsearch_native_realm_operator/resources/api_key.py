@@ -0,0 +1,246 @@
+import base64
+import hashlib
+import json
+import logging
+import time
+from typing import Optional
+
+import kopf
+from elasticsearch import AsyncElasticsearch, NotFoundError
+from pydantic import BaseModel, Field
+
+from elasticsearch_native_realm_operator import metrics
+from elasticsearch_native_realm_operator.client import (
+    async_elasticsearch_client,
+    create_or_read_secret,
+    kubernetes_call,
+    kubernetes_client,
+)
+from elasticsearch_native_realm_operator.clusters import ClusterSelector
+from elasticsearch_native_realm_operator.kopf_ext import (
+    SYNC_PRINTER_COLUMNS,
+    CustomResource,
+    Reconciler,
+    check_immutable,
+)
+
+# Metadata key holding a hash of the fields of an API key which Elasticsearch does not return:
+SPEC_HASH_KEY = "elasticsearchnativerealm.ckpd.co/spec-hash"
+
+
+class ElasticsearchNativeRealmApiKeySpecApiKey(BaseModel):
+    name: str = Field(description="The name of the API key.")
+    role_descriptors: dict = Field(
+        default_factory=dict,
+        description=(
+            "The privileges of the API key, as role descriptors keyed by name. If empty, the key has the privileges "
+            "of the operator. For more information, see "
+            "https://www.elastic.co/guide/en/elasticsearch/reference/7.14/security-api-create-api-key.html."
+        ),
+    )
+    expiration: Optional[str] = Field(
+        description=(
+            "How long the API key is valid for after it is created, such as `30d`. By default, it does not expire. "
+            "Expired keys are replaced with new ones."
+        ),
+    )
+    metadata: dict = Field(
+        default_factory=dict,
+        description=(
+            "Optional meta-data. Within the metadata object, keys that begin with _ are reserved for system usage. "
+            "Note that metadata will be used to track management of the API key via the operator."
+        ),
+    )
+
+
+class ElasticsearchNativeRealmApiKeySpec(ClusterSelector):
+    apiKey: ElasticsearchNativeRealmApiKeySpecApiKey
+    secretName: str = Field(
+        description=(
+            "The name of a secret to store the API key in, under the name of each cluster, encoded for use in an "
+            "`Authorization: ApiKey` header."
+        )
+    )
+
+
+class ElasticsearchNativeRealmApiKey(
+    CustomResource,
+    scope="Namespaced",
+    group="elasticsearchnativerealm.ckpd.co",
+    names={
+        "kind": "ElasticsearchNativeRealmApiKey",
+        "plural": "elasticsearchnativerealmapikeys",
+        "singular": "elasticsearchnativerealmapikey",
+    },
+    additionalPrinterColumns=[
+        {"name": "API Key", "type": "string", "jsonPath": ".spec.apiKey.name"},
+        *SYNC_PRINTER_COLUMNS,
+    ],
+):
+    spec: ElasticsearchNativeRealmApiKeySpec
+
+    async def update(
+        self,
+        namespace: str,
+        logger: logging.Logger,
+        diff: list[tuple],
+        body: kopf.Body,
+        patch: kopf.Patch,
+        **kwargs,
+    ) -> dict:
+        api_key = self.spec.apiKey
+        check_immutable(diff, ("spec", "apiKey", "name"), "Cannot change API key name once created.")
+        check_immutable(diff, ("spec", "secretName"), "Cannot change secret name once created.")
+        desired = api_key.dict(exclude_none=True)
+        # API keys cannot be read back in full, so changes to them are detected from a hash in their metadata:
+        unreadable = {key: desired.get(key) for key in ("role_descriptors", "expiration")}
+        spec_hash = hashlib.sha256(json.dumps(unreadable, sort_keys=True).encode()).hexdigest()
+        desired["metadata"] = {**desired["metadata"], SPEC_HASH_KEY: spec_hash}
+
+        async def after_write(cluster: str, document: dict):
+            try:
+                await self._store_api_key(namespace, cluster, document, body)
+            except Exception:
+                try:
+                    await api_key_reconciler.discard_key(api_key.name, document["id"], cluster)
+                except Exception:
+                    logger.exception(f"Failed to invalidate API key {document['id']!r}, which could not be stored.")
+                raise
+            await api_key_reconciler.invalidate_others(api_key.name, document["id"], cluster)
+
+        return await api_key_reconciler.apply(
+            self,
+            api_key.name,
+            desired,
+            logger=logger,
+            diff=diff,
+            body=body,
+            patch=patch,
+            after_write=after_write,
+        )
+
+    create = resume = update
+
+    async def delete(self, logger: logging.Logger, **kwargs):
+        # The secret is owned by this resource, so is removed with it:
+        await api_key_reconciler.withdraw(self, self.spec.apiKey.name, logger)
+
+    async def _store_api_key(self, namespace: str, cluster: str, document: dict, owner: kopf.Body):
+        """Store a new API key in the secret, under the name of the cluster, creating and adopting the secret if
+        it does not exist.
+
+        Each cluster updates only its own entry, so clusters can be reconciled concurrently.
+        """
+        name = self.spec.secretName
+        encoded = base64.b64encode(f"{document['id']}:{document['api_key']}".encode()).decode()
+        data = {cluster: base64.b64encode(encoded.encode()).decode()}
+        body = {
+            "apiVersion": "v1",
+            "kind": "Secret",
+            "metadata": {"name": name, "namespace": namespace},
+            "type": "Opaque",
+            "data": data,
+        }
+        kopf.adopt(body, owner=owner)
+        secret = await create_or_read_secret(namespace, body)
+        if secret is None:
+            return
+        owners = secret["metadata"].get("ownerReferences") or []
+        if self.metadata.get("uid") not in {owner["uid"] for owner in owners}:
+            raise kopf.PermanentError(f"Secret {name!r} already exists and is not owned by this resource.")
+        client = kubernetes_client()
+        await kubernetes_call(client.patch_namespaced_secret, name=name, namespace=namespace, body={"data": data})
+
+
+class ApiKeyReconciler(Reconciler):
+    """Reconciles the API keys owned by the operator's own user.
+
+    API keys cannot be updated, and several may share a name, so the newest valid key of each name stands for
+    the name. Putting a key creates a new one, after which the others of the same name are invalidated.
+    """
+
+    name = "api_key"
+    label = "API key"
+
+    def __init__(self):
+        super().__init__()
+        # Ids of keys which were created but could not be stored in their secret, nor yet invalidated:
+        self.unstored: set[str] = set()
+
+    async def _get(self, client: AsyncElasticsearch, names: list[str]) -> dict[str, dict]:
+        found = {}
+        for name in names:
+            try:
+                response = await client.security.get_api_key(name=name, owner=True)
+            except NotFoundError:
+                continue
+            found.update(_newest_valid_keys(response["api_keys"]))
+        return found
+
+    async def _list(self, client: AsyncElasticsearch) -> dict[str, dict]:
+        try:
+            response = await client.security.get_api_key(owner=True)
+        except NotFoundError:
+            return {}
+        return _newest_valid_keys(response["api_keys"])
+
+    async def _put(self, client: AsyncElasticsearch, name: str, body: dict) -> dict:
+        response = await client.security.create_api_key(body={**body, "name": name})
+        return {"id": response["id"], "name": name, "api_key": response["api_key"], "metadata": body["metadata"]}
+
+    async def _delete(self, client: AsyncElasticsearch, name: str):
+        await client.security.invalidate_api_key(body={"name": name, "owner": True})
+
+    def compact(self, document: Optional[dict]) -> Optional[dict]:
+        if document is None:
+            return None
+        return {key: value for key, value in document.items() if key != "api_key"}
+
+    def differences(self, current: dict, desired: dict) -> list[str]:
+        current_metadata = dict(current.get("metadata") or {})
+        desired_metadata = dict(desired["metadata"])
+        differences = []
+        if current_metadata.pop(SPEC_HASH_KEY, None) != desired_metadata.pop(SPEC_HASH_KEY, None):
+            differences.append("spec")
+        if current_metadata != desired_metadata:
+            differences.append("metadata")
+        if current.get("id") in self.unstored:
+            differences.append("secret")
+        return differences
+
+    async def discard_key(self, name: str, key_id: str, cluster: str):
+        """Invalidate and forget a new key which could not be stored in its secret.
+
+        Otherwise it would stand for the name as the newest valid key, and the next reconciliation would find
+        nothing to do, leaving the secret without it. Until it has been invalidated, it is treated as differing.
+        """
+        self.unstored.add(key_id)
+        self.cache(cluster).discard(name)
+        client = async_elasticsearch_client(cluster)
+        with metrics.time_api_call("security.delete_api_key"):
+            await client.security.invalidate_api_key(body={"ids": [key_id]})
+        self.unstored.discard(key_id)
+
+    async def invalidate_others(self, name: str, keep: str, cluster: str):
+        """Invalidate every valid key with the given name, other than the one to keep."""
+        client = async_elasticsearch_client(cluster)
+        with metrics.time_api_call("security.get_api_key"):
+            response = await client.security.get_api_key(name=name, owner=True)
+        ids = [key["id"] for key in response["api_keys"] if not key.get("invalidated") and key["id"] != keep]
+        if ids:
+            with metrics.time_api_call("security.delete_api_key"):
+                await client.security.invalidate_api_key(body={"ids": ids})
+
+
+def _newest_valid_keys(keys: list[dict]) -> dict[str, dict]:
+    """Select the newest key of each name which has not been invalidated and has not expired."""
+    now = time.time() * 1000
+    newest: dict[str, dict] = {}
+    for key in sorted(keys, key=lambda key: key.get("creation", 0)):
+        if key.get("invalidated") or (key.get("expiration") or float("inf")) <= now:
+            continue
+        newest[key["name"]] = key
+    return newest
+
+
+api_key_reconciler = ApiKeyReconciler()
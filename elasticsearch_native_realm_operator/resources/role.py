@@ -2,12 +2,17 @@ import logging
 from typing import Optional
 
 import kopf
-from elasticsearch import NotFoundError
+from elasticsearch import AsyncElasticsearch
 from pydantic import BaseModel, Field
 
-from elasticsearch_native_realm_operator.client import elasticsearch_client
-from elasticsearch_native_realm_operator.constants import MANAGED_BY_KEY
-from elasticsearch_native_realm_operator.kopf_ext import CustomResource
+from elasticsearch_native_realm_operator.clusters import ClusterSelector
+from elasticsearch_native_realm_operator.comparison import role_differences
+from elasticsearch_native_realm_operator.kopf_ext import (
+    SYNC_PRINTER_COLUMNS,
+    CustomResource,
+    Reconciler,
+    check_immutable,
+)
 
 
 class ElasticsearchNativeRealmRoleApplicationPrivilegeEntry(BaseModel):
@@ -74,15 +79,8 @@ class ElasticsearchNativeRealmRoleSpecRole(BaseModel):
         ),
     )
 
-    @property
-    def managed_by(self) -> Optional[str]:
-        return self.metadata.get(MANAGED_BY_KEY, None)
-
-    def set_managed_by(self, namespace: str, kind: str, name: str):
-        self.metadata[MANAGED_BY_KEY] = f"{namespace}:{kind}/{name}"
 
-
-class ElasticsearchNativeRealmRoleSpec(BaseModel):
+class ElasticsearchNativeRealmRoleSpec(ClusterSelector):
     role: ElasticsearchNativeRealmRoleSpecRole
 
 
@@ -95,72 +93,50 @@ class ElasticsearchNativeRealmRole(
         "plural": "elasticsearchnativerealmroles",
         "singular": "elasticsearchnativerealmrole",
     },
+    additionalPrinterColumns=[
+        {"name": "Role", "type": "string", "jsonPath": ".spec.role.name"},
+        *SYNC_PRINTER_COLUMNS,
+    ],
 ):
     spec: ElasticsearchNativeRealmRoleSpec
 
-    def update(self, logger: logging.Logger, diff: list[tuple], **kwargs):
+    async def update(
+        self, logger: logging.Logger, diff: list[tuple], body: kopf.Body, patch: kopf.Patch, **kwargs
+    ) -> dict:
         role = self.spec.role
-        # Mark role as managed by this resource
-        role.set_managed_by(
-            namespace=self.metadata.get("namespace", "default"),
-            kind=self.kind,
-            name=self.metadata["name"],
+        check_immutable(diff, ("spec", "role", "name"), "Cannot change role name once created.")
+        return await role_reconciler.apply(
+            self, role.name, role.dict(exclude_none=True), logger=logger, diff=diff, body=body, patch=patch
         )
 
-        # Don't allow edits to the role name:
-        field_operations = [operation[:2] for operation in diff]
-        if ("change", ("spec", "role", "name")) in field_operations:
-            raise kopf.PermanentError("Cannot change role name once created.")
-
-        # Check if role already exists (update):
-        current = fetch_role(role.name)
-        if current == role:
-            logger.info(f"Role {role.name!r} already up-to-date.")
-            return
-
-        # Ensure this role is managed by this resource (prevents conflicts):
-        if current and current.managed_by != role.managed_by:
-            raise kopf.PermanentError(
-                f"Role {role.name!r} already exists and is not managed by this resource."
-            )
-
-        # Reconcile with Elasticsearch
-        body = role.dict(exclude_none=True)
-        role_name = body.pop("name")
-        elasticsearch_client().security.put_role(name=role_name, body=body)
-        logger.info(f"Successfully reconciled role {role_name!r}")
-
     create = resume = update
 
-    def delete(self, namespace: str, logger: logging.Logger, **kwargs):
-        role = self.spec.role
-        # Mark staged role as managed by this resource:
-        role.set_managed_by(
-            namespace=self.metadata.get("namespace", "default"),
-            kind=self.kind,
-            name=self.metadata["name"],
-        )
+    async def delete(self, logger: logging.Logger, **kwargs):
+        await role_reconciler.withdraw(self, self.spec.role.name, logger)
+
+
+class RoleReconciler(Reconciler):
+    name = "role"
+    label = "role"
+
+    async def _get(self, client: AsyncElasticsearch, names: list[str]) -> dict[str, dict]:
+        return await client.security.get_role(name=",".join(names))
+
+    async def _list(self, client: AsyncElasticsearch) -> dict[str, dict]:
+        return await client.security.get_role()
+
+    async def _put(self, client: AsyncElasticsearch, name: str, body: dict) -> dict:
+        body = {key: value for key, value in body.items() if key != "name"}
+        await client.security.put_role(name=name, body=body)
+        return body
+
+    async def _delete(self, client: AsyncElasticsearch, name: str):
+        await client.security.delete_role(name=name)
+
+    def differences(self, current: dict, desired: dict) -> list[str]:
+        # Fields which cannot be specified by the resource are not compared:
+        current = ElasticsearchNativeRealmRoleSpecRole(name=desired["name"], **current).dict(exclude_none=True)
+        return role_differences(current, desired)
+
 
-        current = fetch_role(role.name)
-        # Ignore if role is already deleted:
-        if not current:
-            logger.info(f"Role {role.name!r} does not exist, not further action needed.")
-            return
-
-        # Don't delete if the role isn't managed by this resource:
-        if current.managed_by != role.managed_by:
-            logger.warning(f"Skipping deletion of role {role.name!r}, as it is not managed by this resource.")
-            return
-
-        # Delete the role:
-        elasticsearch_client().security.delete_role(name=role.name)
-        logger.info(f"Successfully removed role {role.name!r}")
-
-
-def fetch_role(name: str) -> Optional[ElasticsearchNativeRealmRoleSpecRole]:
-    client = elasticsearch_client()
-    try:
-        result = client.security.get_role(name=name)
-    except NotFoundError:
-        return None
-    return ElasticsearchNativeRealmRoleSpecRole(name=name, **result[name])
+role_reconciler = RoleReconciler()
@@ -0,0 +1,124 @@
+import logging
+from typing import Literal, Optional
+
+import kopf
+from elasticsearch import AsyncElasticsearch
+from pydantic import BaseModel, Field
+
+from elasticsearch_native_realm_operator.clusters import ClusterSelector
+from elasticsearch_native_realm_operator.comparison import role_mapping_differences
+from elasticsearch_native_realm_operator.kopf_ext import (
+    SYNC_PRINTER_COLUMNS,
+    CustomResource,
+    Reconciler,
+    check_immutable,
+)
+
+
+class ElasticsearchNativeRealmRoleMappingRoleTemplate(BaseModel):
+    template: dict = Field(
+        description=(
+            "A mustache template which evaluates to the name of a role, as an object with a `source` script. "
+            "For more information, see "
+            "https://www.elastic.co/guide/en/elasticsearch/reference/7.14/security-api-put-role-mapping.html."
+        )
+    )
+    format: Optional[Literal["string", "json"]] = Field(
+        description="Whether the template evaluates to one role name (`string`), or a JSON array of them (`json`)."
+    )
+
+
+class ElasticsearchNativeRealmRoleMappingSpecRoleMapping(BaseModel):
+    name: str = Field(description="The name of the role mapping.")
+    enabled: bool = Field(
+        True, description="Mappings which are not enabled are ignored. The default value is `true`."
+    )
+    roles: list[str] = Field(
+        default_factory=list,
+        description="A list of roles to grant to users which match the rules. Exclusive with `role_templates`.",
+    )
+    role_templates: list[ElasticsearchNativeRealmRoleMappingRoleTemplate] = Field(
+        default_factory=list,
+        description="A list of templates of roles to grant to users which match the rules. Exclusive with `roles`.",
+    )
+    rules: dict = Field(
+        ...,
+        description=(
+            "The rules which determine the users to map, such as `{\"field\": {\"groups\": \"admins\"}}`. For more "
+            "information, see "
+            "https://www.elastic.co/guide/en/elasticsearch/reference/7.14/role-mapping-resources.html."
+        ),
+    )
+    metadata: dict = Field(
+        default_factory=dict,
+        description=(
+            "Optional meta-data. Within the metadata object, keys that begin with _ are reserved for system usage. "
+            "Note that metadata will be used to track management of the role mapping via the operator."
+        ),
+    )
+
+
+class ElasticsearchNativeRealmRoleMappingSpec(ClusterSelector):
+    roleMapping: ElasticsearchNativeRealmRoleMappingSpecRoleMapping
+
+
+class ElasticsearchNativeRealmRoleMapping(
+    CustomResource,
+    scope="Namespaced",
+    group="elasticsearchnativerealm.ckpd.co",
+    names={
+        "kind": "ElasticsearchNativeRealmRoleMapping",
+        "plural": "elasticsearchnativerealmrolemappings",
+        "singular": "elasticsearchnativerealmrolemapping",
+    },
+    additionalPrinterColumns=[
+        {"name": "Role Mapping", "type": "string", "jsonPath": ".spec.roleMapping.name"},
+        *SYNC_PRINTER_COLUMNS,
+    ],
+):
+    spec: ElasticsearchNativeRealmRoleMappingSpec
+
+    async def update(
+        self, logger: logging.Logger, diff: list[tuple], body: kopf.Body, patch: kopf.Patch, **kwargs
+    ) -> dict:
+        role_mapping = self.spec.roleMapping
+        check_immutable(diff, ("spec", "roleMapping", "name"), "Cannot change role mapping name once created.")
+        return await role_mapping_reconciler.apply(
+            self,
+            role_mapping.name,
+            role_mapping.dict(exclude_none=True),
+            logger=logger,
+            diff=diff,
+            body=body,
+            patch=patch,
+        )
+
+    create = resume = update
+
+    async def delete(self, logger: logging.Logger, **kwargs):
+        await role_mapping_reconciler.withdraw(self, self.spec.roleMapping.name, logger)
+
+
+class RoleMappingReconciler(Reconciler):
+    name = "role_mapping"
+    label = "role mapping"
+
+    async def _get(self, client: AsyncElasticsearch, names: list[str]) -> dict[str, dict]:
+        return await client.security.get_role_mapping(name=",".join(names))
+
+    async def _list(self, client: AsyncElasticsearch) -> dict[str, dict]:
+        return await client.security.get_role_mapping()
+
+    async def _put(self, client: AsyncElasticsearch, name: str, body: dict) -> dict:
+        body = {key: value for key, value in body.items() if key != "name"}
+        await client.security.put_role_mapping(name=name, body=body)
+        return body
+
+    async def _delete(self, client: AsyncElasticsearch, name: str):
+        await client.security.delete_role_mapping(name=name)
+
+    def differences(self, current: dict, desired: dict) -> list[str]:
+        return role_mapping_differences(current, desired)
+
+
+role_mapping_reconciler = RoleMappingReconciler()
@@ -1,15 +1,26 @@
+import asyncio
 import base64
 import logging
 from typing import Optional
 from uuid import uuid4
 
 import kopf
-from elasticsearch import NotFoundError
-from pydantic import BaseModel, Field
-
-from elasticsearch_native_realm_operator.client import elasticsearch_client, kubernetes_client
-from elasticsearch_native_realm_operator.constants import MANAGED_BY_KEY
-from elasticsearch_native_realm_operator.kopf_ext import CustomResource
+from elasticsearch import AsyncElasticsearch
+from pydantic import BaseModel, Field, root_validator
+
+from elasticsearch_native_realm_operator.client import create_or_read_secret
+from elasticsearch_native_realm_operator.clusters import ClusterSelector, for_each_cluster
+from elasticsearch_native_realm_operator.compact import CompactUser, compact_user
+from elasticsearch_native_realm_operator.config import get_settings
+from elasticsearch_native_realm_operator.credentials import Credentials, parse_credentials_secret
+from elasticsearch_native_realm_operator.hashing import compute_password_hash
+from elasticsearch_native_realm_operator.kopf_ext import (
+    SYNC_PRINTER_COLUMNS,
+    CustomResource,
+    Reconciler,
+    check_immutable,
+)
+from elasticsearch_native_realm_operator.resources.role import role_reconciler
 
 
 class ElasticsearchNativeRealmUserSpecUser(BaseModel):
@@ -31,18 +42,25 @@ class ElasticsearchNativeRealmUserSpecUser(BaseModel):
     enabled: bool = Field(True, description="Specifies whether the user is enabled. The default value is `true`.")
     email: Optional[str] = Field(description="The email of the user (optional).")
     full_name: Optional[str] = Field(description="The full name of the user (optional).")
-
-    @property
-    def managed_by(self) -> Optional[str]:
-        return self.metadata.get(MANAGED_BY_KEY, None)
-
-    def set_managed_by(self, namespace: str, kind: str, name: str):
-        self.metadata[MANAGED_BY_KEY] = f"{namespace}:{kind}/{name}"
+    password_hash: Optional[str] = Field(
+        description=(
+            "A hash of the user's password, made with the hashing algorithm configured in Elasticsearch (optional). "
+            "If specified, no credentials secret is created."
+        ),
+    )
 
 
-class ElasticsearchNativeRealmUserSpec(BaseModel):
+class ElasticsearchNativeRealmUserSpec(ClusterSelector):
     user: ElasticsearchNativeRealmUserSpecUser
-    secretName: str
+    secretName: Optional[str] = Field(
+        description="The name of a secret to create with generated credentials, unless a password hash is specified."
+    )
+
+    @root_validator(skip_on_failure=True)
+    def check_credentials(cls, values: dict) -> dict:
+        if (values.get("secretName") is None) == (values["user"].password_hash is None):
+            raise ValueError("Exactly one of 'secretName' and 'user.password_hash' must be specified.")
+        return values
 
 
 class ElasticsearchNativeRealmUser(
@@ -54,121 +72,168 @@ class ElasticsearchNativeRealmUser(
         "plural": "elasticsearchnativerealmusers",
         "singular": "elasticsearchnativerealmuser",
     },
+    additionalPrinterColumns=[
+        {"name": "Username", "type": "string", "jsonPath": ".spec.user.username"},
+        *SYNC_PRINTER_COLUMNS,
+    ],
 ):
     spec: ElasticsearchNativeRealmUserSpec
 
-    def update(self, namespace: str, logger: logging.Logger, diff: list[tuple], **kwargs):
+    async def update(
+        self,
+        namespace: str,
+        logger: logging.Logger,
+        diff: list[tuple],
+        body: kopf.Body,
+        patch: kopf.Patch,
+        **kwargs,
+    ) -> dict:
         user = self.spec.user
-        # Mark staged user as managed by this resource:
-        user.set_managed_by(
-            namespace=self.metadata.get("namespace", "default"),
-            kind=self.kind,
-            name=self.metadata["name"],
-        )
-
-        # Don't allow edits to the username or secret name:
+        check_immutable(diff, ("spec", "user", "username"), "Cannot change username once created.")
+        check_immutable(diff, ("spec", "secretName"), "Cannot change secret name once created.")
+        # Password hashes are never returned by Elasticsearch, so changes are only known from the diff:
         field_operations = [operation[:2] for operation in diff]
-        if ("change", ("spec", "user", "username")) in field_operations:
-            raise kopf.PermanentError("Cannot change username once created.")
-        if ("change", ("spec", "secretName")) in field_operations:
-            raise kopf.PermanentError("Cannot change secret name once created.")
-
-        # Check if user already exists (update):
-        current = fetch_user(user.username)
-        if current == user:
-            logger.info(f"User {user.username!r} already up-to-date.")
-            return
-
-        # Ensure this user is managed by this resource (prevents conflicts):
-        if current and current.managed_by != user.managed_by:
-            raise kopf.PermanentError(
-                f"User {user.username!r} already exists and is not managed by this resource."
-            )
-
-        # Ensure the roles exist:
-        self._validate_roles()
+        hash_field = ("spec", "user", "password_hash")
+        changed = ["password_hash"] if {("add", hash_field), ("change", hash_field)} & set(field_operations) else []
+
+        # The same credentials are used in every cluster, so are only generated once:
+        credentials: Optional[asyncio.Future] = None
+
+        async def prepare(cluster: str, current: Optional[CompactUser], document: dict) -> dict:
+            nonlocal credentials
+            # Ensure the roles exist:
+            await self._validate_roles(cluster)
+            # Create secret if necessary:
+            if current is None and user.password_hash is None:
+                if credentials is None:
+                    credentials = asyncio.ensure_future(self._password_fields(namespace, body))
+                document.update(await credentials)
+            return document
+
+        return await user_reconciler.apply(
+            self,
+            user.username,
+            user.dict(exclude_none=True),
+            logger=logger,
+            diff=diff,
+            body=body,
+            patch=patch,
+            changed=changed,
+            prepare=prepare,
+        )
 
-        # Create secret if necessary:
-        body = user.dict(exclude_none=True)
-        if not current:
-            body["password"] = self._create_credentials_secret(namespace)
+    create = resume = update
 
-        # Reconcile with Elasticsearch
-        username = body.pop("username")
-        elasticsearch_client().security.put_user(username=username, body=body)
-        logger.info(f"Successfully reconciled user {username!r}")
+    async def _password_fields(self, namespace: str, owner: kopf.Body) -> dict:
+        password = await self._ensure_credentials_secret(namespace, owner)
+        if get_settings().password_hashing_algorithm:
+            return {"password_hash": await compute_password_hash(password)}
+        return {"password": password}
 
-    create = resume = update
+    async def delete(self, logger: logging.Logger, **kwargs):
+        await user_reconciler.withdraw(self, self.spec.user.username, logger)
 
-    def delete(self, namespace: str, logger: logging.Logger, **kwargs):
-        user = self.spec.user
-        # Mark staged user as managed by this resource:
-        user.set_managed_by(
-            namespace=self.metadata.get("namespace", "default"),
-            kind=self.kind,
-            name=self.metadata["name"],
-        )
+    async def wait_for_dependencies(self):
+        """Wait for roles which do not exist yet, as they are often being created at the same time.
 
-        current = fetch_user(user.username)
-        # Ignore if user is already deleted:
-        if not current:
-            logger.info(f"User {user.username!r} does not exist, not further action needed.")
+        The user is woken as soon as their handlers have reconciled them, or gives up after the timeout.
+        """
+        roles = set(self.spec.user.roles)
+        if not roles:
             return
+        timeout = get_settings().role_dependency_timeout
 
-        # Don't delete if the user isn't managed by this resource:
-        if current.managed_by != user.managed_by:
-            logger.warning(f"Skipping deletion of user {user.username!r}, as it is not managed by this resource.")
-            return
+        async def wait(cluster: str):
+            missing = roles - await role_reconciler.existing(roles, cluster)
+            if missing:
+                await role_reconciler.wait_for(missing, timeout=timeout, cluster=cluster)
 
-        # Delete the user:
-        elasticsearch_client().security.delete_user(username=user.username)
-        logger.info(f"Successfully removed user {user.username!r}")
+        # Unknown clusters fail once the user is reconciled:
+        clusters = [cluster for cluster in self.spec.target_clusters() if cluster in get_settings().clusters]
+        await for_each_cluster(clusters, wait)
 
-    def _validate_roles(self):
+    async def _validate_roles(self, cluster: str):
         """Validate that each role specified already exists in Elasticsearch."""
         user = self.spec.user
-        client = elasticsearch_client()
         if not user.roles:
             return
-        try:
-            roles = client.security.get_role(name=",".join(user.roles))
-        except NotFoundError:
-            roles = {}
-        invalid_roles = set(user.roles) - set(roles)
+        invalid_roles = set(user.roles) - await role_reconciler.existing(user.roles, cluster)
         if invalid_roles:
             # Temporary error means this will be retried, as the role might have been added at the same time.
-            raise kopf.TemporaryError(f"User {user.username!r} has invalid roles: {invalid_roles}")
+            raise kopf.TemporaryError(
+                f"User {user.username!r} has invalid roles in cluster {cluster!r}: {invalid_roles}"
+            )
 
-    def _create_credentials_secret(self, namespace: str):
-        """Create and adopt a secret containing the credentials.
+    async def _ensure_credentials_secret(self, namespace: str, owner: kopf.Body) -> str:
+        """Create and adopt a secret containing the credentials, or reuse the password of the secret created
+        by a previous attempt.
 
         Adoption ensures that the secret is removed when the user resource is.
         """
+        name = self.spec.secretName
+        if name is None:
+            # Validation of the spec requires a secret name for users without a password hash:
+            raise kopf.PermanentError("Cannot generate credentials without a secret name.")
         user = self.spec.user
-        client = kubernetes_client()
         password = str(uuid4())
         body = {
             "apiVersion": "v1",
             "kind": "Secret",
-            "metadata": {"name": self.spec.secretName, "namespace": namespace},
+            "metadata": {"name": name, "namespace": namespace},
             "type": "Opaque",
             "data": {
                 "username": base64.b64encode(user.username.encode()).decode(),
                 "password": base64.b64encode(password.encode()).decode(),
             },
         }
-        kopf.adopt(body)
-        client.create_namespaced_secret(
-            namespace=namespace,
-            body=body,
-        )
-        return password
+        kopf.adopt(body, owner=owner)
+        secret = await create_or_read_secret(namespace, body)
+        if secret is None:
+            return password
+        existing = parse_credentials_secret(secret)
+        if not existing:
+            raise kopf.PermanentError(f"Secret {name!r} already exists, and does not hold credentials.")
+        return self._reuse_credentials(existing)
+
+    def _reuse_credentials(self, existing: Credentials) -> str:
+        if self.metadata.get("uid") not in existing.owners:
+            raise kopf.PermanentError(
+                f"Secret {self.spec.secretName!r} already exists and is not owned by this resource."
+            )
+        if existing.username != self.spec.user.username:
+            raise kopf.PermanentError(
+                f"Secret {self.spec.secretName!r} already holds credentials for another user."
+            )
+        return existing.password
+
+
+class UserReconciler(Reconciler):
+    name = "user"
+    label = "user"
+
+    async def _get(self, client: AsyncElasticsearch, names: list[str]) -> dict[str, dict]:
+        return await client.security.get_user(username=",".join(names))
+
+    async def _list(self, client: AsyncElasticsearch) -> dict[str, dict]:
+        return await client.security.get_user()
+
+    async def _put(self, client: AsyncElasticsearch, name: str, body: dict) -> dict:
+        body = {key: value for key, value in body.items() if key != "username"}
+        await client.security.put_user(username=name, body=body)
+        # Passwords are never returned by Elasticsearch, and are dropped when the user is compacted:
+        return body
+
+    async def _delete(self, client: AsyncElasticsearch, name: str):
+        await client.security.delete_user(username=name)
+
+    def compact(self, document: Optional[dict]) -> Optional[CompactUser]:
+        return compact_user(document)
+
+    def differences(self, current: CompactUser, desired: dict) -> list[str]:
+        return current.differences(CompactUser.from_document(desired))
+
+    def managed_by(self, current: CompactUser) -> Optional[str]:
+        return current.managed_by
 
 
-def fetch_user(username: str) -> Optional[ElasticsearchNativeRealmUserSpecUser]:
-    client = elasticsearch_client()
-    try:
-        result = client.security.get_user(username=username)
-    except NotFoundError:
-        return None
-    return ElasticsearchNativeRealmUserSpecUser(**result[username])
+user_reconciler = UserReconciler()
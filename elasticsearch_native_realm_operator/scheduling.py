@@ -0,0 +1,98 @@
+"""Scheduling of reconciliations by priority, so that bulk work cannot delay changes made by users.
+
+After a restart, every resource is resumed at once, and drift scans and orphan sweeps may run at the same time.
+Without scheduling, all of these compete equally with a resource which was just created. Instead, each
+reconciliation takes a slot from the scheduler first, which admits waiting work in order of priority.
+"""
+import asyncio
+import time
+from collections import Counter, OrderedDict, deque
+from contextlib import asynccontextmanager
+from enum import IntEnum
+from functools import cache
+from typing import AsyncIterator, Optional
+
+from elasticsearch_native_realm_operator import metrics
+from elasticsearch_native_realm_operator.config import get_settings
+
+
+class Priority(IntEnum):
+    # Creation, updates and deletion of resources, which users are waiting on:
+    INTERACTIVE = 0
+    # Repair of objects which drifted, and reconciliation of resources handed over from another replica:
+    REPAIR = 1
+    # Resuming resources at startup, and collecting orphaned objects:
+    BACKGROUND = 2
+
+
+class Scheduler:
+    """Admits work up to a total concurrency limit, and a limit for each priority.
+
+    Whenever a slot is free, it goes to the waiting work of the highest priority which is within its own limit.
+    Within a priority, namespaces take turns, so that one namespace with many resources cannot hold up the
+    others. Work of the same namespace and priority is admitted in order of arrival.
+    """
+
+    def __init__(self, concurrency: int, limits: dict[Priority, int]):
+        self.concurrency = concurrency
+        self.limits = limits
+        self._running: Counter[Priority] = Counter()
+        # Waiters of each priority, by namespace, with the namespace whose turn is next first:
+        self._waiting: dict[Priority, OrderedDict[str, deque[asyncio.Future]]] = {
+            priority: OrderedDict() for priority in Priority
+        }
+
+    @asynccontextmanager
+    async def slot(self, priority: Priority, namespace: Optional[str]) -> AsyncIterator[None]:
+        """Wait for a slot, and hold it for the duration of the context."""
+        future = asyncio.get_running_loop().create_future()
+        self._waiting[priority].setdefault(namespace or "", deque()).append(future)
+        start = time.perf_counter()
+        self._dispatch()
+        try:
+            await future
+        except asyncio.CancelledError:
+            # The slot may have been granted just as the waiter was cancelled:
+            if future.done() and not future.cancelled():
+                self._release(priority)
+            raise
+        metrics.SCHEDULER_WAIT.labels(priority=priority.name.lower()).observe(time.perf_counter() - start)
+        try:
+            yield
+        finally:
+            self._release(priority)
+
+    def _release(self, priority: Priority):
+        self._running[priority] -= 1
+        self._dispatch()
+
+    def _dispatch(self):
+        for priority in Priority:
+            namespaces = self._waiting[priority]
+            while namespaces and self._has_capacity(priority):
+                namespace, waiters = next(iter(namespaces.items()))
+                future = waiters.popleft()
+                if waiters:
+                    namespaces.move_to_end(namespace)
+                else:
+                    del namespaces[namespace]
+                # Waiters which were cancelled no longer need their slot:
+                if not future.done():
+                    future.set_result(None)
+                    self._running[priority] += 1
+
+    def _has_capacity(self, priority: Priority) -> bool:
+        return sum(self._running.values()) < self.concurrency and self._running[priority] < self.limits[priority]
+
+
+@cache
+def get_scheduler() -> Scheduler:
+    settings = get_settings()
+    return Scheduler(
+        concurrency=settings.scheduler_concurrency,
+        limits={
+            Priority.INTERACTIVE: settings.scheduler_interactive_concurrency,
+            Priority.REPAIR: settings.scheduler_repair_concurrency,
+            Priority.BACKGROUND: settings.scheduler_background_concurrency,
+        },
+    )
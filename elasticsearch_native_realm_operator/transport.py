@@ -0,0 +1,102 @@
+import asyncio
+import time
+from typing import Optional
+
+import aiohttp
+from elasticsearch import AIOHttpConnection, AsyncTransport, ConnectionError, ConnectionTimeout, TransportError
+# Not declared by the type stubs of the client:
+from elasticsearch._async.http_aiohttp import ESClientResponse  # type: ignore[attr-defined]
+
+from elasticsearch_native_realm_operator import metrics
+from elasticsearch_native_realm_operator.ratelimit import RateLimiter
+
+# Statuses with which Elasticsearch signals that it is overloaded, for example by rejecting from its thread pools:
+OVERLOAD_STATUSES = frozenset({429, 503})
+
+
+class KeepAliveAIOHttpConnection(AIOHttpConnection):
+    """Connection which keeps idle sockets open for a configurable time, so they are reused between bursts."""
+
+    def __init__(self, *args, keepalive_timeout: float = 15.0, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.keepalive_timeout = keepalive_timeout
+
+    async def _create_aiohttp_session(self):
+        # Mirrors the parent implementation, adding the keep-alive timeout to the connector:
+        if self.loop is None:
+            self.loop = asyncio.get_running_loop()
+        self.session = aiohttp.ClientSession(
+            headers=self.headers,
+            skip_auto_headers=("accept", "accept-encoding"),
+            auto_decompress=True,
+            cookie_jar=aiohttp.DummyCookieJar(),
+            response_class=ESClientResponse,
+            connector=aiohttp.TCPConnector(
+                limit=self._limit,
+                use_dns_cache=True,
+                ssl=self._ssl_context,
+                keepalive_timeout=self.keepalive_timeout,
+            ),
+        )
+
+
+class ThrottledAsyncTransport(AsyncTransport):
+    """Transport which rate limits requests, and waits with exponential backoff between retries rather than
+    retrying immediately.
+
+    The rate limiter adapts to responses: overload statuses and slow responses reduce the rate of the budget
+    (reads or writes) the request was made from, and are retried after backing off.
+    """
+
+    def __init__(
+        self,
+        hosts,
+        *,
+        max_retries: int = 3,
+        retry_backoff: float = 0.5,
+        limiter: Optional[RateLimiter] = None,
+        retry_on_status=(429, 502, 503, 504),
+        **kwargs,
+    ):
+        # Each attempt made by the parent transport is a single try, retries are made here:
+        super().__init__(hosts, max_retries=0, retry_on_status=retry_on_status, **kwargs)
+        self.retries = max_retries
+        self.retry_backoff = retry_backoff
+        self.limiter = limiter
+
+    async def perform_request(self, method, url, headers=None, params=None, body=None):
+        attempt = 0
+        while True:
+            try:
+                return await self._perform_throttled_request(method, url, headers=headers, params=params, body=body)
+            except TransportError as exc:
+                if attempt >= self.retries or not self._is_retryable(exc):
+                    raise
+            await asyncio.sleep(self.retry_backoff * 2 ** attempt)
+            attempt += 1
+
+    async def _perform_throttled_request(self, method, url, **kwargs):
+        if self.limiter is None:
+            return await super().perform_request(method, url, **kwargs)
+        bucket = self.limiter.bucket(method)
+        await bucket.acquire()
+        start = time.monotonic()
+        try:
+            result = await super().perform_request(method, url, **kwargs)
+        except TransportError as exc:
+            if exc.status_code in OVERLOAD_STATUSES:
+                bucket.record_overload()
+            raise
+        else:
+            bucket.record_success(time.monotonic() - start)
+            return result
+        finally:
+            metrics.RATE_LIMIT.labels(cluster=self.limiter.name, budget="read").set(self.limiter.read.rate)
+            metrics.RATE_LIMIT.labels(cluster=self.limiter.name, budget="write").set(self.limiter.write.rate)
+
+    def _is_retryable(self, exc: TransportError) -> bool:
+        if isinstance(exc, ConnectionTimeout):
+            return self.retry_on_timeout
+        if isinstance(exc, ConnectionError):
+            return True
+        return exc.status_code in self.retry_on_status
@@ -1,16 +1,77 @@
+"""Generate the CustomResourceDefinitions of the operator's resources.
+
+The output begins with a hash of the package source it was generated from. With ``--check``, an existing output
+file whose hash is still current is left as it is, without importing the models.
+"""
+import argparse
+import hashlib
 import sys
+from pathlib import Path
+from typing import Optional
 
 import yaml
 
-from elasticsearch_native_realm_operator import main
-from elasticsearch_native_realm_operator.kopf_ext import CustomResource
+_ROOT = Path(__file__).resolve().parent.parent
+_PACKAGE = _ROOT / "elasticsearch_native_realm_operator"
+_HEADER = "# Generated by scripts/generate_crds.py from source hash {}, do not edit.\n"
 
 
-_RESOURCE_DEFINITIONS = [
-    model for model in vars(main).values() if isinstance(model, type) and issubclass(model, CustomResource)
-]
+class _Dumper(yaml.SafeDumper):
+    # Resolved schemas share the definitions of sub-models, which should be written out in full each time:
+    def ignore_aliases(self, data) -> bool:
+        return True
 
-if __name__ == "__main__":
-    sys.stdout.write(
-        yaml.dump_all([resource.definition() for resource in _RESOURCE_DEFINITIONS])
+
+def source_hash() -> str:
+    """Hash the source of the package, and of this script, from which the definitions are generated."""
+    digest = hashlib.sha256()
+    for path in sorted([*_PACKAGE.rglob("*.py"), Path(__file__).resolve()]):
+        digest.update(str(path.relative_to(_ROOT)).encode())
+        digest.update(path.read_bytes())
+    return digest.hexdigest()
+
+
+def generate(hash_: str) -> str:
+    from elasticsearch_native_realm_operator.main import RESOURCES
+
+    return _HEADER.format(hash_) + yaml.dump_all(
+        [resource.definition() for resource in RESOURCES], Dumper=_Dumper, sort_keys=True
     )
+
+
+def read_hash(path: Path) -> Optional[str]:
+    try:
+        with path.open() as file:
+            header = file.readline()
+    except FileNotFoundError:
+        return None
+    prefix, _, suffix = _HEADER.partition("{}")
+    if not (header.startswith(prefix) and header.endswith(suffix)):
+        return None
+    return header[len(prefix) : -len(suffix)]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--output", type=Path, help="File to write the definitions to, instead of stdout.")
+    parser.add_argument(
+        "--check", action="store_true", help="Only regenerate the output file if the source has changed since."
+    )
+    args = parser.parse_args(argv)
+    if args.check and not args.output:
+        parser.error("--check requires --output")
+
+    hash_ = source_hash()
+    if args.check and read_hash(args.output) == hash_:
+        print(f"{args.output} is up to date.", file=sys.stderr)
+        return
+    definitions = generate(hash_)
+    if args.output:
+        args.output.write_text(definitions)
+        print(f"Generated {args.output}.", file=sys.stderr)
+    else:
+        sys.stdout.write(definitions)
+
+
+if __name__ == "__main__":
+    main()
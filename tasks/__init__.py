@@ -1,5 +1,6 @@
 from invoke import Collection
 
+from tasks.bench import bench
 from tasks.changelog_check import changelog_check
 from tasks.lint import lint
 from tasks.local import local
@@ -10,6 +11,7 @@ from tasks.typecheck import typecheck
 from tasks.verify import verify
 
 namespace = Collection(
+    bench,
     build,
     push,
     changelog_check,
@@ -0,0 +1,19 @@
+from invoke import task
+
+from tasks.helpers import print_header
+
+
+@task(optional=["sizes", "latency"])
+def bench(ctx, sizes="10,100,1000,10000", latency=0.002):
+    """Run benchmarks of model parsing, of reconciliation storms against fake APIs, and of cache memory.
+
+    :param sizes: comma-separated numbers of objects to reconcile in each storm, and of users to cache.
+    :param latency: seconds of latency of each fake API request.
+    """
+    print_header("RUNNING BENCHMARKS")
+    print_header("Parsing", level=2)
+    ctx.run("python -m benchmarks.parsing", pty=True)
+    print_header("Reconciliation", level=2)
+    ctx.run(f"python -m benchmarks.reconcile --sizes {sizes.replace(',', ' ')} --latency {float(latency)}", pty=True)
+    print_header("Memory", level=2)
+    ctx.run(f"python -m benchmarks.memory --sizes {sizes.replace(',', ' ')}", pty=True)
@@ -0,0 +1,80 @@
+import asyncio
+import time
+from contextlib import ExitStack
+from types import SimpleNamespace
+from unittest import mock
+
+import kopf
+import pytest
+from kubernetes.client.exceptions import ApiException
+
+from elasticsearch_native_realm_operator import clusters
+from elasticsearch_native_realm_operator.cache import DocumentCache
+from elasticsearch_native_realm_operator.constants import MANAGED_BY_KEY
+from elasticsearch_native_realm_operator.kopf_ext import reconciler
+from elasticsearch_native_realm_operator.resources import api_key
+from elasticsearch_native_realm_operator.resources.api_key import (
+    SPEC_HASH_KEY,
+    ElasticsearchNativeRealmApiKey,
+    _newest_valid_keys,
+    api_key_reconciler,
+)
+
+
+def test_newest_valid_keys_skip_invalidated_and_expired_keys() -> None:
+    now = time.time() * 1000
+    keys = [
+        {"id": "a", "name": "ingest", "creation": 1},
+        {"id": "b", "name": "ingest", "creation": 2},
+        {"id": "c", "name": "ingest", "creation": 3, "invalidated": True},
+        {"id": "d", "name": "search", "creation": 1, "expiration": now - 1000},
+    ]
+    assert {name: key["id"] for name, key in _newest_valid_keys(keys).items()} == {"ingest": "b"}
+
+
+def test_api_key_differences_compare_spec_hash_and_metadata() -> None:
+    current = api_key_reconciler.compact(
+        {"id": "a", "api_key": "secret", "metadata": {MANAGED_BY_KEY: "default:ApiKey/a", SPEC_HASH_KEY: "1"}}
+    )
+    assert current is not None and "api_key" not in current
+    assert api_key_reconciler.differences(current, {"metadata": dict(current["metadata"])}) == []
+    desired = {"metadata": {MANAGED_BY_KEY: "default:ApiKey/a", SPEC_HASH_KEY: "2", "team": "ingest"}}
+    assert api_key_reconciler.differences(current, desired) == ["spec", "metadata"]
+
+
+@pytest.mark.parametrize("invalidation_fails", [False, True])
+def test_api_key_which_cannot_be_stored_is_invalidated(invalidation_fails: bool) -> None:
+    client = mock.Mock()
+    client.security.get_api_key = mock.AsyncMock(return_value={"api_keys": []})
+    client.security.create_api_key = mock.AsyncMock(return_value={"id": "new", "api_key": "secret"})
+    client.security.invalidate_api_key = mock.AsyncMock(side_effect=RuntimeError if invalidation_fails else None)
+    cache = DocumentCache(ttl=60, maxsize=10, compact=api_key_reconciler.compact)
+    resource = ElasticsearchNativeRealmApiKey.parse_obj(
+        {
+            "apiVersion": f"{ElasticsearchNativeRealmApiKey.group}/v1",
+            "kind": ElasticsearchNativeRealmApiKey.names.kind,
+            "metadata": {"namespace": "default", "name": "ingest", "uid": "1"},
+            "spec": {"apiKey": {"name": "ingest"}, "secretName": "ingest", "clusters": ["default"]},
+        }
+    )
+    store = mock.AsyncMock(side_effect=ApiException(status=500))
+    settings = SimpleNamespace(clusters={"default": None})
+
+    with ExitStack() as stack:
+        stack.enter_context(mock.patch.object(clusters, "get_settings", lambda: settings))
+        stack.enter_context(mock.patch.object(reconciler, "async_elasticsearch_client", lambda cluster: client))
+        stack.enter_context(mock.patch.object(api_key, "async_elasticsearch_client", lambda cluster: client))
+        stack.enter_context(mock.patch.object(api_key_reconciler, "cache", lambda cluster: cache))
+        stack.enter_context(mock.patch.object(api_key_reconciler, "unstored", set()))
+        stack.enter_context(mock.patch.object(ElasticsearchNativeRealmApiKey, "_store_api_key", store))
+        with pytest.raises(kopf.TemporaryError):
+            update = resource.update(
+                namespace="default", logger=mock.Mock(), diff=[], body=kopf.Body({}), patch=kopf.Patch()
+            )
+            asyncio.run(update)
+        client.security.invalidate_api_key.assert_awaited_once_with(body={"ids": ["new"]})
+        assert cache.get("ingest") == (False, None)
+        # A key which may still be valid is replaced by the next reconciliation:
+        current = api_key_reconciler.compact({**client.security.create_api_key.return_value, "metadata": {}})
+        assert current is not None
+        assert ("secret" in api_key_reconciler.differences(current, {"metadata": {}})) is invalidation_fails
@@ -0,0 +1,102 @@
+import asyncio
+from unittest import mock
+
+from elasticsearch_native_realm_operator.cache import DocumentCache, SecurityCache
+from elasticsearch_native_realm_operator.kopf_ext import reconciler
+from elasticsearch_native_realm_operator.resources.role import role_reconciler
+from elasticsearch_native_realm_operator.resources.user import user_reconciler
+
+
+def test_document_cache_answers_hits_and_known_absences() -> None:
+    cache = DocumentCache(ttl=60, maxsize=10)
+    cache.set("present", {"cluster": []})
+    cache.set("absent", None)
+    assert cache.get("present") == (True, {"cluster": []})
+    assert cache.get("absent") == (True, None)
+    assert cache.get("unknown") == (False, None)
+
+
+def test_document_cache_entries_expire() -> None:
+    cache = DocumentCache(ttl=60, maxsize=10)
+    with mock.patch("time.monotonic", return_value=0.0):
+        cache.set("role", {})
+    with mock.patch("time.monotonic", return_value=61.0):
+        assert cache.get("role") == (False, None)
+    assert len(cache) == 0
+
+
+def test_document_cache_evicts_least_recently_used() -> None:
+    cache = DocumentCache(ttl=60, maxsize=2)
+    cache.set("a", {})
+    cache.set("b", {})
+    cache.get("a")
+    cache.set("c", {})
+    assert cache.get("b") == (False, None)
+    assert cache.get("a")[0] and cache.get("c")[0]
+
+
+def test_document_cache_complete_listing_answers_misses() -> None:
+    cache = DocumentCache(ttl=60, maxsize=10)
+    cache.replace_all({"a": {}})
+    assert cache.get("b") == (True, None)
+    cache.discard("a")
+    assert cache.get("b") == (False, None)
+
+
+def test_document_cache_truncated_listing_does_not_answer_misses() -> None:
+    cache = DocumentCache(ttl=60, maxsize=1)
+    cache.replace_all({"a": {}, "b": {}})
+    assert cache.get("a") == (False, None)
+    assert cache.get("b") == (True, {})
+
+
+def test_document_cache_listing_keeps_writes_made_while_it_was_in_flight() -> None:
+    cache = DocumentCache(ttl=60, maxsize=10)
+    cache.set("updated", {"version": 1})
+    since = cache.generation
+    cache.set("updated", {"version": 2})
+    cache.set("deleted", None)
+    cache.discard("unknown")
+    cache.replace_all({"updated": {"version": 1}, "deleted": {}, "unknown": {}, "listed": {}}, since=since)
+    assert cache.get("updated") == (True, {"version": 2})
+    assert cache.get("deleted") == (True, None)
+    assert cache.get("listed") == (True, {})
+    assert cache.get("unknown") == (False, None)
+
+
+def test_security_cache_refresh_answers_lookups_without_further_requests() -> None:
+    client = mock.Mock()
+    client.security.get_role = mock.AsyncMock(return_value={"reader": {"cluster": ["monitor"]}})
+    client.security.get_user = mock.AsyncMock(return_value={})
+    client.security.get_role_mapping = mock.AsyncMock(return_value={})
+    client.security.get_api_key = mock.AsyncMock(return_value={"api_keys": []})
+    security_cache = SecurityCache(ttl=60, maxsize=10, cluster="default")
+
+    async def main():
+        # As at startup, everything is listed up-front:
+        await security_cache.refresh()
+        assert await role_reconciler.fetch("reader", "default") == {"cluster": ["monitor"]}
+        assert await role_reconciler.fetch("writer", "default") is None
+        assert await user_reconciler.fetch("jane", "default") is None
+
+    with mock.patch.object(reconciler, "async_elasticsearch_client", lambda cluster: client), mock.patch.object(
+        reconciler, "get_security_cache", lambda cluster: security_cache
+    ):
+        asyncio.run(main())
+    # Only the listings were requested:
+    client.security.get_role.assert_awaited_once_with()
+    client.security.get_user.assert_awaited_once_with()
+
+
+def test_document_cache_forgets_discards_once_a_later_listing_has_begun() -> None:
+    cache = DocumentCache(ttl=60, maxsize=10)
+    cache.discard("old")
+    since = cache.generation
+    cache.discard("new")
+    cache.replace_all({"old": {}, "new": {}}, since=since)
+    assert cache.get("old") == (True, {})
+    assert cache.get("new") == (False, None)
+    # Only discards made while the listing was in flight are kept, for overlapping listings:
+    assert cache._discarded.keys() == {"new"}
+    cache.replace_all({"new": {}}, since=cache.generation)
+    assert cache._discarded == {}
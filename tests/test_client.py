@@ -0,0 +1,59 @@
+import asyncio
+from typing import Any
+from unittest import mock
+
+from elasticsearch import AsyncElasticsearch
+
+from elasticsearch_native_realm_operator import client
+from elasticsearch_native_realm_operator.client import async_elasticsearch_client
+from elasticsearch_native_realm_operator.config import Settings
+from elasticsearch_native_realm_operator.transport import KeepAliveAIOHttpConnection
+
+
+def _client(**options: Any) -> AsyncElasticsearch:
+    """Return the client of the default cluster, configured with the given settings."""
+    settings = Settings(
+        elasticsearch_hosts=["http://es:9200"],
+        elasticsearch_username="elastic",
+        elasticsearch_password="secret",
+        **options,
+    )
+    async_elasticsearch_client.cache_clear()
+    try:
+        with mock.patch.object(client, "get_settings", lambda: settings):
+            return async_elasticsearch_client("default")
+    finally:
+        async_elasticsearch_client.cache_clear()
+
+
+def test_client_connections_are_configured() -> None:
+    elasticsearch = _client(
+        elasticsearch_connections_per_node=5, elasticsearch_keepalive_timeout=30.0, elasticsearch_http_compress=True
+    )
+
+    async def main():
+        # Connections are made once the client is used on an event loop:
+        async with elasticsearch:
+            [connection] = elasticsearch.transport.connection_pool.connections
+            assert isinstance(connection, KeepAliveAIOHttpConnection)
+            assert connection.http_compress
+            await connection._create_aiohttp_session()
+            # Idle sockets are kept open as configured, in a pool of the configured size:
+            assert connection.session.connector._keepalive_timeout == 30.0
+            assert connection.session.connector.limit == 5
+
+    asyncio.run(main())
+
+
+def test_client_sniffs_nodes_with_the_configured_credentials() -> None:
+    transport = _client(elasticsearch_sniff=True, elasticsearch_sniff_interval=60.0).transport
+    assert transport.sniff_on_start and transport.sniff_on_connection_fail
+    assert transport.sniffer_timeout == 60.0
+    # Connections to sniffed nodes are made with the transport's arguments, which must include the credentials:
+    assert transport.kwargs["http_auth"] == ("elastic", "secret")
+
+
+def test_client_does_not_sniff_by_default() -> None:
+    transport = _client().transport
+    assert not transport.sniff_on_start and not transport.sniff_on_connection_fail
+    assert "http_auth" not in transport.kwargs
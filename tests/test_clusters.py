@@ -0,0 +1,115 @@
+import asyncio
+from contextlib import ExitStack
+from types import SimpleNamespace
+from typing import Optional
+from unittest import mock
+
+import kopf
+import pytest
+
+from elasticsearch_native_realm_operator import clusters
+from elasticsearch_native_realm_operator.cache import DocumentCache
+from elasticsearch_native_realm_operator.clusters import deselected_clusters, fan_out
+from elasticsearch_native_realm_operator.constants import MANAGED_BY_KEY
+from elasticsearch_native_realm_operator.kopf_ext import reconciler
+from elasticsearch_native_realm_operator.resources.role import ElasticsearchNativeRealmRole, role_reconciler
+
+
+def test_fan_out_records_the_outcome_for_each_cluster() -> None:
+    async def reconcile(cluster: str):
+        if cluster == "eu":
+            raise RuntimeError("unavailable")
+        return {"outcome": "noop"}
+
+    patch = kopf.Patch()
+    body = kopf.Body({"status": {"clusters": {"us": {"synced": True}}}})
+    with pytest.raises(kopf.TemporaryError, match="eu: unavailable"):
+        asyncio.run(fan_out(["default", "eu"], reconcile, body=body, patch=patch))
+    assert patch["status"]["clusters"] == {
+        "default": {"synced": True, "outcome": "noop"},
+        "eu": {"synced": False, "error": "unavailable"},
+        "us": None,
+    }
+
+
+def test_fan_out_combines_the_results_of_each_cluster() -> None:
+    async def reconcile(cluster: str):
+        if cluster == "eu":
+            return {"outcome": "write", "drift": ["roles", "enabled"]}
+        return {"outcome": "write", "drift": ["roles"]}
+
+    result = asyncio.run(fan_out(["default", "eu"], reconcile, body=kopf.Body({}), patch=kopf.Patch()))
+    assert result == {"outcome": "write", "drift": ["enabled", "roles"]}
+
+
+def test_fan_out_fails_permanently_if_all_failures_are_permanent() -> None:
+    async def reconcile(cluster: str):
+        raise kopf.PermanentError("conflict")
+
+    with pytest.raises(kopf.PermanentError):
+        asyncio.run(fan_out(["default", "eu"], reconcile, body=kopf.Body({}), patch=kopf.Patch()))
+
+
+@pytest.mark.parametrize(
+    "old, new, expected",
+    [
+        (["default", "eu"], ["default"], ["eu"]),
+        # No selection means every configured cluster:
+        (None, ["default"], ["eu", "us"]),
+        (["eu"], None, []),
+        (["default"], ["default", "eu"], []),
+        # Clusters which are no longer configured cannot be cleaned up:
+        (["default", "gone"], ["default"], []),
+    ],
+)
+def test_deselected_clusters(old: Optional[list[str]], new: Optional[list[str]], expected: list[str]) -> None:
+    settings = SimpleNamespace(clusters={"default": None, "eu": None, "us": None})
+    diff = [("change", ("spec", "role", "cluster"), ["all"], ["monitor"]), ("change", ("spec", "clusters"), old, new)]
+    with mock.patch.object(clusters, "get_settings", lambda: settings):
+        assert deselected_clusters(diff) == expected
+        assert deselected_clusters(diff[:1]) == []
+
+
+def _narrow(configured: list[str], old: list[str], new: list[str]) -> dict[str, mock.Mock]:
+    """Update a role to select fewer clusters, and return the Elasticsearch client of each configured cluster."""
+    role = {"cluster": ["monitor"], "metadata": {MANAGED_BY_KEY: "default:ElasticsearchNativeRealmRole/reader"}}
+    clients = {cluster: mock.Mock() for cluster in configured}
+    for client in clients.values():
+        client.security.get_role = mock.AsyncMock(return_value={"reader": role})
+        client.security.put_role = mock.AsyncMock()
+        client.security.delete_role = mock.AsyncMock()
+    caches = {cluster: DocumentCache(ttl=60, maxsize=10) for cluster in configured}
+    settings = SimpleNamespace(clusters=dict.fromkeys(configured))
+    resource = ElasticsearchNativeRealmRole.parse_obj(
+        {
+            "apiVersion": f"{ElasticsearchNativeRealmRole.group}/v1",
+            "kind": ElasticsearchNativeRealmRole.names.kind,
+            "metadata": {"namespace": "default", "name": "reader"},
+            "spec": {"role": {"name": "reader", "cluster": ["monitor"]}, "clusters": new},
+        }
+    )
+    with ExitStack() as stack:
+        stack.enter_context(mock.patch.object(clusters, "get_settings", lambda: settings))
+        stack.enter_context(mock.patch.object(reconciler, "async_elasticsearch_client", clients.__getitem__))
+        stack.enter_context(mock.patch.object(role_reconciler, "cache", caches.__getitem__))
+        update = resource.update(
+            namespace="default",
+            logger=mock.Mock(),
+            diff=[("change", ("spec", "clusters"), old, new)],
+            body=kopf.Body({}),
+            patch=kopf.Patch(),
+        )
+        asyncio.run(update)
+    return clients
+
+
+def test_update_removes_the_object_from_deselected_clusters() -> None:
+    clients = _narrow(["default", "eu"], old=["default", "eu"], new=["default"])
+    clients["eu"].security.delete_role.assert_awaited_once_with(name="reader")
+    clients["default"].security.delete_role.assert_not_awaited()
+
+
+def test_update_skips_deselected_clusters_which_are_no_longer_configured() -> None:
+    # The client of a cluster which is no longer configured cannot be made, so would fail the update:
+    clients = _narrow(["default"], old=["default", "gone"], new=["default"])
+    clients["default"].security.delete_role.assert_not_awaited()
@@ -0,0 +1,34 @@
+import asyncio
+
+from elasticsearch_native_realm_operator.coalesce import Coalescer
+
+
+def test_coalescer_merges_concurrent_lookups() -> None:
+    batches: list[set[str]] = []
+
+    async def fetch(keys: set[str]) -> dict[str, int]:
+        batches.append(keys)
+        return {key: len(key) for key in keys if key != "missing"}
+
+    async def main():
+        coalescer = Coalescer(fetch, window=0.01)
+        return await asyncio.gather(
+            coalescer.get(["a", "bb"]),
+            coalescer.get(["bb", "missing"]),
+            coalescer.get([]),
+        )
+
+    assert asyncio.run(main()) == [{"a": 1, "bb": 2}, {"bb": 2}, {}]
+    assert batches == [{"a", "bb", "missing"}]
+
+
+def test_coalescer_fans_out_errors() -> None:
+    async def fetch(keys: set[str]) -> dict[str, int]:
+        raise RuntimeError("unavailable")
+
+    async def main():
+        coalescer = Coalescer(fetch, window=0.01)
+        return await asyncio.gather(coalescer.get(["a"]), coalescer.get(["b"]), return_exceptions=True)
+
+    results = asyncio.run(main())
+    assert all(isinstance(result, RuntimeError) for result in results)
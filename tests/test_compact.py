@@ -0,0 +1,29 @@
+from elasticsearch_native_realm_operator.compact import CompactUser, role_table
+from elasticsearch_native_realm_operator.constants import MANAGED_BY_KEY
+
+
+def test_compact_user_ignores_role_order_and_defaults() -> None:
+    stored = CompactUser.from_document(
+        {"username": "jane", "roles": ["b", "a", "a"], "metadata": {MANAGED_BY_KEY: "default:User/jane"}}
+    )
+    desired = CompactUser.from_document(
+        {"username": "jane", "roles": ["a", "b"], "enabled": True, "metadata": {MANAGED_BY_KEY: "default:User/jane"}}
+    )
+    assert stored.differences(desired) == []
+    assert sorted(stored.roles) == ["a", "b"]
+    assert stored.managed_by == "default:User/jane"
+
+
+def test_compact_user_differences() -> None:
+    stored = CompactUser.from_document({"username": "jane", "roles": ["a"], "metadata": {"team": "search"}})
+    desired = CompactUser.from_document(
+        {"username": "jane", "roles": ["a", "b"], "enabled": False, "metadata": {"team": "ingest"}, "password": "x"}
+    )
+    assert stored.differences(desired) == ["enabled", "metadata", "roles"]
+
+
+def test_role_names_are_interned_once() -> None:
+    size = len(role_table)
+    role_table.pack(["interned-role", "interned-role"])
+    role_table.pack(["interned-role"])
+    assert len(role_table) == size + 1
@@ -0,0 +1,64 @@
+from elasticsearch_native_realm_operator.comparison import role_differences, role_mapping_differences
+
+_DESIRED_ROLE: dict = {
+    "name": "reader",
+    "cluster": ["monitor", "manage_ilm"],
+    "indices": [
+        {"names": ["logs-*", "metrics-*"], "privileges": ["read", "view_index_metadata"]},
+        {"names": ["secret"], "privileges": ["read"], "field_security": {"grant": ["public.*"]}},
+    ],
+    "metadata": {"owner": "me"},
+}
+
+
+def test_role_differences_ignores_server_normalisation() -> None:
+    stored = {
+        "cluster": ["manage_ilm", "monitor"],
+        "indices": [
+            {
+                "names": ["secret"],
+                "privileges": ["read"],
+                "field_security": {"grant": ["public.*"], "except": []},
+                "allow_restricted_indices": False,
+            },
+            {
+                "names": ["metrics-*", "logs-*"],
+                "privileges": ["view_index_metadata", "read"],
+                "field_security": {"grant": ["*"], "except": []},
+                "allow_restricted_indices": False,
+            },
+        ],
+        "applications": [],
+        "run_as": [],
+        "metadata": {"owner": "me"},
+        "transient_metadata": {"enabled": True},
+    }
+    assert role_differences(stored, _DESIRED_ROLE) == []
+
+
+def test_role_differences_reports_changed_fields() -> None:
+    stored = {
+        **_DESIRED_ROLE,
+        "cluster": ["monitor"],
+        "indices": [{**_DESIRED_ROLE["indices"][0], "allow_restricted_indices": True}, _DESIRED_ROLE["indices"][1]],
+    }
+    assert role_differences(stored, _DESIRED_ROLE) == ["cluster", "indices"]
+
+
+def test_role_mapping_differences() -> None:
+    desired = {
+        "name": "admins",
+        "roles": ["a", "b"],
+        "role_templates": [{"template": {"source": "{{username}}"}}],
+        "rules": {"field": {"groups": "admins"}},
+        "metadata": {},
+    }
+    stored = {
+        "enabled": True,
+        "roles": ["b", "a"],
+        "role_templates": [{"template": '{"source":"{{username}}"}', "format": "string"}],
+        "rules": {"field": {"groups": "admins"}},
+        "metadata": {},
+    }
+    assert role_mapping_differences(stored, desired) == []
+    assert role_mapping_differences({**stored, "rules": {"field": {"groups": "users"}}}, desired) == ["rules"]
@@ -0,0 +1,13 @@
+from elasticsearch_native_realm_operator.credentials import Credentials, parse_credentials_secret
+
+
+def test_parse_credentials_secret() -> None:
+    body = {
+        "metadata": {"name": "credentials", "ownerReferences": [{"uid": "abc"}]},
+        "data": {"username": "dXNlcg==", "password": "c2VjcmV0"},
+    }
+    assert parse_credentials_secret(body) == Credentials(username="user", password="secret", owners=frozenset({"abc"}))
+
+
+def test_parse_credentials_secret_without_credentials() -> None:
+    assert parse_credentials_secret({"metadata": {"name": "other"}, "data": {"token": "dG9rZW4="}}) is None
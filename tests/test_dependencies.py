@@ -0,0 +1,29 @@
+import asyncio
+
+from elasticsearch_native_realm_operator.dependencies import DependencyWaiters
+
+
+def test_waiters_are_woken_when_notified() -> None:
+    async def main():
+        waiters: DependencyWaiters[str] = DependencyWaiters()
+        waiting = asyncio.create_task(waiters.wait({"a", "b"}, timeout=5))
+        await asyncio.sleep(0)
+        waiters.notify(["a"])
+        await asyncio.sleep(0)
+        assert not waiting.done()
+        waiters.notify(["b", "c"])
+        notified = await asyncio.wait_for(waiting, timeout=1)
+        return notified, len(waiters)
+
+    assert asyncio.run(main()) == ({"a", "b"}, 0)
+
+
+def test_waiters_time_out() -> None:
+    async def main():
+        waiters: DependencyWaiters[str] = DependencyWaiters()
+        waiting = asyncio.create_task(waiters.wait({"a", "b"}, timeout=0.01))
+        await asyncio.sleep(0)
+        waiters.notify(["a"])
+        return await waiting, len(waiters)
+
+    assert asyncio.run(main()) == ({"a"}, 0)
@@ -0,0 +1,117 @@
+import asyncio
+from contextlib import ExitStack, asynccontextmanager
+from types import SimpleNamespace
+from typing import Callable, Optional
+from unittest import mock
+
+from elasticsearch_native_realm_operator import clusters, drift
+from elasticsearch_native_realm_operator.cache import SecurityCache
+from elasticsearch_native_realm_operator.constants import MANAGED_BY_KEY
+from elasticsearch_native_realm_operator.drift import DriftScanner
+from elasticsearch_native_realm_operator.kopf_ext import reconciler
+from elasticsearch_native_realm_operator.resources.role import ElasticsearchNativeRealmRole
+from elasticsearch_native_realm_operator.scheduling import Priority, Scheduler
+
+
+def _role(name: str, cluster: list[str]) -> ElasticsearchNativeRealmRole:
+    return ElasticsearchNativeRealmRole.parse_obj(
+        {
+            "apiVersion": f"{ElasticsearchNativeRealmRole.group}/v1",
+            "kind": ElasticsearchNativeRealmRole.names.kind,
+            "metadata": {"namespace": "team-a", "name": name},
+            "spec": {"role": {"name": name, "cluster": cluster}},
+        }
+    )
+
+
+def _scan(
+    active: bool = True,
+    handling: frozenset = frozenset(),
+    on_slot: Optional[Callable[[], None]] = None,
+) -> tuple[mock.Mock, mock.AsyncMock]:
+    """Scan a role which is in sync and one which drifted, and return the Elasticsearch client and the patches of
+    the resources.
+
+    :param handling: resources which kopf is handling.
+    :param on_slot: called as each repair is admitted by the scheduler.
+    """
+    roles = {
+        name: {
+            "cluster": ["monitor"],
+            "indices": [],
+            "applications": [],
+            "run_as": [],
+            "metadata": {MANAGED_BY_KEY: f"team-a:ElasticsearchNativeRealmRole/{name}"},
+            "transient_metadata": {"enabled": True},
+        }
+        for name in ("reader", "writer")
+    }
+    client = mock.Mock()
+    client.security.get_role = mock.AsyncMock(return_value=roles)
+    client.security.get_user = mock.AsyncMock(return_value={})
+    client.security.get_role_mapping = mock.AsyncMock(return_value={})
+    client.security.get_api_key = mock.AsyncMock(return_value={"api_keys": []})
+    client.security.put_role = mock.AsyncMock()
+    security_cache = SecurityCache(ttl=60, maxsize=100)
+    settings = SimpleNamespace(clusters={"default": None})
+    scheduler = Scheduler(1, {priority: 1 for priority in Priority})
+
+    @asynccontextmanager
+    async def slot(priority: Priority, namespace: str):
+        async with Scheduler.slot(scheduler, priority, namespace):
+            if on_slot:
+                on_slot()
+            yield
+
+    patch = mock.AsyncMock()
+    index = {("team-a", "reader"): _role("reader", ["monitor"]), ("team-a", "writer"): _role("writer", ["all"])}
+    with ExitStack() as stack:
+        stack.enter_context(mock.patch.object(drift, "get_settings", lambda: settings))
+        stack.enter_context(mock.patch.object(clusters, "get_settings", lambda: settings))
+        stack.enter_context(mock.patch.object(drift, "get_security_cache", lambda cluster: security_cache))
+        stack.enter_context(mock.patch.object(scheduler, "slot", slot))
+        stack.enter_context(mock.patch.object(drift, "get_scheduler", lambda: scheduler))
+        stack.enter_context(mock.patch.object(reconciler, "get_security_cache", lambda cluster: security_cache))
+        stack.enter_context(mock.patch.object(reconciler, "async_elasticsearch_client", lambda cluster: client))
+        stack.enter_context(mock.patch.dict(ElasticsearchNativeRealmRole.index, index, clear=True))
+        stack.enter_context(mock.patch.object(ElasticsearchNativeRealmRole, "handling", set(handling)))
+        stack.enter_context(mock.patch.object(ElasticsearchNativeRealmRole, "_patch", patch))
+        scanner = DriftScanner([ElasticsearchNativeRealmRole], interval=60, jitter=0, active=lambda: active)
+        asyncio.run(scanner.scan())
+    return client, patch
+
+
+def test_scan_repairs_drifted_roles_without_requests_for_those_in_sync() -> None:
+    client, patch = _scan()
+    # The bulk listing is the only request made for roles which are in sync:
+    client.security.get_role.assert_awaited_once_with()
+    client.security.put_role.assert_awaited_once()
+    assert client.security.put_role.await_args.kwargs["name"] == "writer"
+    # The outcome is recorded in the status of each resource, as kopf's handlers do:
+    statuses = {call.args[1]: call.args[2]["status"] for call in patch.await_args_list}
+    assert statuses["writer"]["sync"]["state"] == "Synced"
+    assert statuses["writer"]["sync"]["outcome"] == "write"
+    assert statuses["writer"]["clusters"]["default"]["synced"] is True
+    assert statuses["reader"]["sync"]["outcome"] == "noop"
+
+
+def test_scan_makes_no_requests_unless_active() -> None:
+    client, patch = _scan(active=False)
+    client.security.get_role.assert_not_awaited()
+    client.security.put_role.assert_not_awaited()
+    patch.assert_not_awaited()
+
+
+def test_scan_leaves_resources_being_handled_to_kopf() -> None:
+    client, patch = _scan(handling=frozenset({("team-a", "writer")}))
+    client.security.put_role.assert_not_awaited()
+    assert [call.args[1] for call in patch.await_args_list] == ["reader"]
+
+
+def test_scan_applies_the_latest_spec_of_resources_changed_while_it_waited() -> None:
+    def edit():
+        # kopf sees the writer edited back to the stored cluster privileges while the scan waits for a slot:
+        ElasticsearchNativeRealmRole.index[("team-a", "writer")] = _role("writer", ["monitor"])
+
+    client, _ = _scan(on_slot=edit)
+    client.security.put_role.assert_not_awaited()
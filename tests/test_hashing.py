@@ -0,0 +1,41 @@
+import base64
+import hashlib
+
+import pytest
+
+from elasticsearch_native_realm_operator.hashing import HashingAlgorithm, hash_password, parse_algorithm
+
+
+@pytest.mark.parametrize(
+    "name,expected",
+    [
+        ("pbkdf2", HashingAlgorithm("pbkdf2", 10000)),
+        ("PBKDF2_50000", HashingAlgorithm("pbkdf2", 50000)),
+        ("bcrypt", HashingAlgorithm("bcrypt", 10)),
+        ("bcrypt12", HashingAlgorithm("bcrypt", 12)),
+    ],
+)
+def test_parse_algorithm(name: str, expected: HashingAlgorithm) -> None:
+    if expected.name == "bcrypt":
+        pytest.importorskip("bcrypt")
+    assert parse_algorithm(name) == expected
+
+
+@pytest.mark.parametrize("name", ["sha256", "bcrypt3", "pbkdf2_12345"])
+def test_parse_algorithm_unsupported(name: str) -> None:
+    with pytest.raises(ValueError):
+        parse_algorithm(name)
+
+
+def test_hash_password_pbkdf2() -> None:
+    prefix, salt, key = hash_password("secret", "pbkdf2_1000").split("$")
+    assert prefix == "{PBKDF2}1000"
+    expected = hashlib.pbkdf2_hmac("sha512", b"secret", base64.b64decode(salt), 1000, dklen=32)
+    assert base64.b64decode(key) == expected
+
+
+def test_hash_password_bcrypt() -> None:
+    bcrypt = pytest.importorskip("bcrypt")
+    hashed = hash_password("secret", "bcrypt4")
+    assert hashed.startswith("$2a$04$")
+    assert bcrypt.checkpw(b"secret", hashed.encode())
@@ -0,0 +1,131 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+from unittest import mock
+
+import kopf
+from kubernetes.client import V1Lease, V1LeaseSpec, V1ObjectMeta
+from kubernetes.client.exceptions import ApiException
+
+from elasticsearch_native_realm_operator import leadership, leases
+from elasticsearch_native_realm_operator.leadership import Leadership
+
+
+class FakeCoordinationApi:
+    """Lease API which, like Kubernetes, rejects updates conditional on a stale resource version."""
+
+    def __init__(self):
+        self.lease = None
+        self.version = 0
+
+    def read_namespaced_lease(self, name, namespace):
+        if self.lease is None:
+            raise ApiException(status=404)
+        return self.lease
+
+    def create_namespaced_lease(self, namespace, body):
+        if self.lease is not None:
+            raise ApiException(status=409)
+        return self._store(body)
+
+    def patch_namespaced_lease(self, name, namespace, body):
+        if self.lease is None:
+            raise ApiException(status=404)
+        expected = body.get("metadata", {}).get("resourceVersion")
+        if expected and expected != self.lease.metadata.resource_version:
+            raise ApiException(status=409)
+        return self._store(body)
+
+    def _store(self, body):
+        spec = body["spec"]
+        renew_time = datetime.strptime(spec["renewTime"], "%Y-%m-%dT%H:%M:%S.%fZ").replace(tzinfo=timezone.utc)
+        self.version += 1
+        self.lease = V1Lease(
+            metadata=V1ObjectMeta(resource_version=str(self.version)),
+            spec=V1LeaseSpec(
+                holder_identity=spec["holderIdentity"],
+                lease_duration_seconds=spec["leaseDurationSeconds"],
+                renew_time=renew_time,
+            ),
+        )
+        return self.lease
+
+
+class FakePeering:
+    """kopf's peering object, which replicas publish their entries to, and which decides which of them kopf pauses."""
+
+    def __init__(self):
+        self.status: dict = {}
+
+    async def publish(self, name: str, identity: str, priority: int, lifetime: int):
+        self.status[identity] = {"priority": priority, "lifetime": lifetime, "lastseen": leases.now().isoformat()}
+
+    async def paused(self, replica: Leadership) -> bool:
+        """Whether kopf pauses a replica, which it does while any other peer has the same or a higher priority."""
+        settings = replica.settings
+        assert settings is not None
+        peering = settings.peering
+        # Each replica publishes its entry at its first keep-alive:
+        if replica.identity not in self.status:
+            await self.publish(peering.name, replica.identity, peering.priority, peering.lifetime)
+        assert self.status[replica.identity]["priority"] == peering.priority
+        return any(
+            entry["priority"] >= peering.priority
+            for identity, entry in self.status.items()
+            if identity != replica.identity
+        )
+
+
+def _replica(identity: str) -> Leadership:
+    replica = Leadership(identity=identity, namespace="operator")
+    settings = kopf.OperatorSettings()
+    replica.attach(settings)
+    # kopf only handles resources once it has seen its peers, through the peering object named after the Lease:
+    assert settings.peering.mandatory and not settings.peering.standalone
+    assert (settings.peering.name, settings.peering.clusterwide) == ("native-realm-operator", True)
+    return replica
+
+
+def test_only_the_leader_runs_kopf() -> None:
+    api, peering = FakeCoordinationApi(), FakePeering()
+    leader, standby = _replica("a"), _replica("b")
+
+    async def main():
+        with mock.patch.object(leases, "coordination_client", lambda: api), mock.patch.object(
+            leadership, "publish_peer", peering.publish
+        ):
+            await leader.campaign()
+            await standby.campaign()
+            yield await peering.paused(leader), await peering.paused(standby)
+            # The leader stops renewing, and the standby takes over:
+            api.lease.spec.renew_time -= timedelta(seconds=60)
+            await standby.campaign()
+            yield await peering.paused(leader), await peering.paused(standby)
+            await leader.campaign()
+            yield await peering.paused(leader), await peering.paused(standby)
+
+    async def run():
+        return [states async for states in main()]
+
+    # Before the previous leader notices, both claim to lead, so both pause rather than both write:
+    assert asyncio.run(run()) == [(False, True), (True, True), (True, False)]
+    assert (leader.is_leader, standby.is_leader) == (False, True)
+
+
+def test_only_one_replica_takes_over_with_the_same_lease_version() -> None:
+    api = FakeCoordinationApi()
+    first, second = Leadership(identity="a", namespace="operator"), Leadership(identity="b", namespace="operator")
+
+    async def main():
+        with mock.patch.object(leases, "coordination_client", lambda: api):
+            await first.campaign()
+            api.lease.spec.renew_time -= timedelta(seconds=60)
+            stale = api.lease
+            await second.campaign()
+            # A third replica which read the Lease before the takeover loses the race:
+            third = Leadership(identity="c", namespace="operator")
+            with mock.patch.object(leadership, "read_lease", mock.AsyncMock(return_value=stale)):
+                await third.campaign()
+            return third.is_leader
+
+    assert asyncio.run(main()) is False
+    assert second.is_leader
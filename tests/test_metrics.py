@@ -0,0 +1,47 @@
+import asyncio
+from types import SimpleNamespace
+from typing import Optional
+from unittest import mock
+
+import kopf
+import pytest
+from prometheus_client import REGISTRY
+
+from elasticsearch_native_realm_operator import main, metrics
+
+
+def _api_calls(api: str) -> float:
+    return REGISTRY.get_sample_value("native_realm_operator_api_call_duration_seconds_count", {"api": api}) or 0.0
+
+
+def test_api_calls_are_timed_and_recorded_within_the_block() -> None:
+    async def call(api: str):
+        with metrics.time_api_call(api):
+            await asyncio.sleep(0)
+
+    async def reconcile() -> list[float]:
+        with metrics.recording_api_calls() as durations:
+            await call("security.get_role")
+            # Calls made from tasks started within the block are recorded too:
+            await asyncio.gather(call("security.put_role"), call("security.put_role"))
+        await call("security.put_role")
+        return durations
+
+    before = _api_calls("security.get_role"), _api_calls("security.put_role")
+    durations = asyncio.run(reconcile())
+    assert len(durations) == 3
+    assert (_api_calls("security.get_role"), _api_calls("security.put_role")) == (before[0] + 1, before[1] + 3)
+
+
+@pytest.mark.parametrize("port", [9090, None])
+def test_metrics_are_served_on_the_configured_port(port: Optional[int]) -> None:
+    settings = SimpleNamespace(event_batch_window=0.1, password_hashing_algorithm=None, metrics_port=port)
+    with mock.patch.object(main, "get_settings", lambda: settings), mock.patch.object(
+        main.prometheus_client, "start_http_server"
+    ) as start_http_server:
+        # Handlers are typed as kopf calls them, with every keyword argument:
+        main.configure(settings=kopf.OperatorSettings())  # type: ignore[call-arg]
+    if port is None:
+        start_http_server.assert_not_called()
+    else:
+        start_http_server.assert_called_once_with(port)
@@ -0,0 +1,244 @@
+import asyncio
+import itertools
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+from unittest import mock
+
+import kopf
+import pytest
+
+from elasticsearch_native_realm_operator.clusters import ClusterSelector
+from elasticsearch_native_realm_operator.kopf_ext import models
+from elasticsearch_native_realm_operator.kopf_ext.models import (
+    CustomResource,
+    _diff,
+    _hash_spec,
+    _recently_verified,
+    _resolve_refs,
+)
+from elasticsearch_native_realm_operator.resources.role import ElasticsearchNativeRealmRole
+from elasticsearch_native_realm_operator.scheduling import Priority, Scheduler
+
+SETTINGS = SimpleNamespace(spec_hash_max_age=3600.0, debounce_window=0.0)
+
+
+class WidgetSpec(ClusterSelector):
+    a: int
+
+
+class Widget(CustomResource, scope="Namespaced", group="example.com", names={"kind": "Widget", "plural": "widgets"}):
+    spec: WidgetSpec
+
+    async def update(self, **_):
+        pass
+
+
+def _body(spec: dict, sync: dict) -> dict:
+    return {
+        "apiVersion": "example.com/v1",
+        "kind": "Widget",
+        "metadata": {"namespace": "default", "name": "widget"},
+        "spec": spec,
+        "status": {"sync": sync},
+    }
+
+
+def _verified_at(age: timedelta) -> str:
+    return (datetime.now(timezone.utc) - age).isoformat()
+
+
+def test_resolve_refs_resolves_each_reference_once() -> None:
+    schema = {
+        "properties": {
+            "a": {"$ref": "#/definitions/Entry"},
+            "b": {"type": "array", "items": {"$ref": "#/definitions/Entry"}},
+        },
+        "definitions": {"Entry": {"properties": {"name": {"type": "string"}}}},
+    }
+    resolved = _resolve_refs(schema)
+    assert resolved == {
+        "properties": {
+            "a": {"properties": {"name": {"type": "string"}}},
+            "b": {"type": "array", "items": {"properties": {"name": {"type": "string"}}}},
+        },
+    }
+    assert resolved["properties"]["a"] is resolved["properties"]["b"]["items"]
+
+
+def test_resolve_refs_rejects_cycles() -> None:
+    schema = {
+        "properties": {"a": {"$ref": "#/definitions/Node"}},
+        "definitions": {"Node": {"properties": {"child": {"$ref": "#/definitions/Node"}}}},
+    }
+    with pytest.raises(ValueError, match="cyclical"):
+        _resolve_refs(schema)
+
+
+def _versions(*versions: str) -> list[dict]:
+    return [{"metadata": {"name": "reader", "resourceVersion": version}} for version in versions]
+
+
+@pytest.mark.parametrize(
+    "reads, max_wait, expected",
+    [
+        # Changes stop after the second read, so the third finds it unchanged:
+        (_versions("2", "3", "3", "4"), 5.0, "3"),
+        # Changes never stop, so the latest is reconciled once the maximum wait passes:
+        ((_versions(str(version))[0] for version in itertools.count(2)), 0.05, None),
+    ],
+)
+def test_settle_waits_for_changes_to_stop(reads, max_wait, expected) -> None:
+    settings = SimpleNamespace(debounce_window=0.01, debounce_max_wait=max_wait)
+    read = mock.AsyncMock(side_effect=reads)
+    with mock.patch.object(models, "get_settings", lambda: settings), mock.patch.object(
+        ElasticsearchNativeRealmRole, "read", read
+    ):
+        latest = asyncio.run(ElasticsearchNativeRealmRole._settle(_versions("1")[0]))
+    if expected:
+        assert latest is not None and latest["metadata"]["resourceVersion"] == expected
+        assert read.await_count == 3
+    else:
+        assert 3 <= read.await_count < 20
+
+
+def test_diff_matches_kopf() -> None:
+    old = {"spec": {"role": {"name": "reader", "cluster": ["monitor"]}, "clusters": ["default"]}}
+    new = {"spec": {"role": {"name": "reader", "cluster": ["all"], "run_as": ["jane"]}}}
+    assert _diff(old, new) == [
+        ("remove", ("spec", "clusters"), ["default"], None),
+        ("change", ("spec", "role", "cluster"), ["monitor"], ["all"]),
+        ("add", ("spec", "role", "run_as"), None, ["jane"]),
+    ]
+
+
+@pytest.mark.parametrize(
+    "sync, expected",
+    [
+        ({"specHash": _hash_spec({"a": 1}), "verifiedAt": _verified_at(timedelta(minutes=1))}, True),
+        ({"specHash": _hash_spec({"a": 1}), "verifiedAt": _verified_at(timedelta(hours=2))}, False),
+        ({"specHash": _hash_spec({"a": 2}), "verifiedAt": _verified_at(timedelta(minutes=1))}, False),
+        ({"specHash": _hash_spec({"a": 1}), "verifiedAt": "yesterday"}, False),
+        ({"specHash": _hash_spec({"a": 1}), "verifiedAt": None}, False),
+        ({"specHash": _hash_spec({"a": 1})}, False),
+    ],
+)
+def test_recently_verified(sync, expected) -> None:
+    with mock.patch.object(models, "get_settings", lambda: SETTINGS):
+        assert _recently_verified(_body({"a": 1}, sync), _hash_spec({"a": 1})) is expected
+
+
+def _handle(body: dict, update: mock.AsyncMock, patch: kopf.Patch):
+    scheduler = Scheduler(1, {priority: 1 for priority in Priority})
+    with mock.patch.object(models, "get_settings", lambda: SETTINGS), mock.patch.object(
+        models, "get_scheduler", lambda: scheduler
+    ), mock.patch.object(Widget, "update", update):
+        asyncio.run(Widget._make_handler("update")(body=body, patch=patch, logger=mock.Mock()))
+
+
+def test_handler_skips_spec_verified_recently() -> None:
+    update = mock.AsyncMock()
+    sync = {"specHash": _hash_spec({"a": 1}), "verifiedAt": _verified_at(timedelta(minutes=1))}
+    patch = kopf.Patch()
+    _handle(_body({"a": 1}, sync), update, patch)
+    update.assert_not_awaited()
+    assert "sync" not in patch.status
+
+
+@pytest.mark.parametrize(
+    "sync",
+    [
+        {"specHash": _hash_spec({"a": 1}), "verifiedAt": _verified_at(timedelta(hours=2))},
+        {"specHash": _hash_spec({"a": 2}), "verifiedAt": _verified_at(timedelta(minutes=1))},
+        {"specHash": _hash_spec({"a": 1}), "verifiedAt": "not a time"},
+    ],
+)
+def test_handler_reconciles_spec_not_verified_recently(sync) -> None:
+    update = mock.AsyncMock(return_value={"drift": None})
+    patch = kopf.Patch()
+    _handle(_body({"a": 1}, sync), update, patch)
+    update.assert_awaited_once()
+    assert patch.status["sync"]["state"] == "Synced"
+    assert patch.status["sync"]["specHash"] == _hash_spec({"a": 1})
+
+
+def test_handler_error_clears_spec_hash() -> None:
+    update = mock.AsyncMock(side_effect=kopf.TemporaryError("Elasticsearch is unavailable."))
+    patch = kopf.Patch()
+    with pytest.raises(kopf.TemporaryError):
+        _handle(_body({"a": 1}, {"specHash": _hash_spec({"a": 2})}), update, patch)
+    # kopf applies the patch even though the handler failed, so the next event is not skipped:
+    assert patch.status["sync"] == {"state": "Error", "error": "Elasticsearch is unavailable.", "specHash": None}
+
+
+def test_handler_marks_the_resource_as_handled_while_it_runs() -> None:
+    handling = []
+    update = mock.AsyncMock(side_effect=lambda *args, **kwargs: handling.append(set(Widget.handling)))
+    _handle(_body({"a": 1}, {}), update, kopf.Patch())
+    assert handling == [{("default", "widget")}]
+    assert Widget.handling == set()
+
+
+def test_handler_waits_for_dependencies_without_a_slot() -> None:
+    scheduler = Scheduler(1, {priority: 1 for priority in Priority})
+
+    async def main():
+        reconciled = asyncio.Event()
+
+        async def wait_for_dependencies(self):
+            if self.metadata["name"] == "dependent":
+                await reconciled.wait()
+
+        async def update(self, **_):
+            if self.metadata["name"] == "dependency":
+                reconciled.set()
+
+        bodies = [
+            {**_body({"a": 1}, {}), "metadata": {"namespace": "default", "name": name}}
+            for name in ("dependent", "dependency")
+        ]
+        with mock.patch.object(models, "get_settings", lambda: SETTINGS), mock.patch.object(
+            models, "get_scheduler", lambda: scheduler
+        ), mock.patch.object(Widget, "update", update), mock.patch.object(
+            Widget, "wait_for_dependencies", wait_for_dependencies
+        ):
+            handler = Widget._make_handler("update")
+            # The only slot would otherwise be held by the dependent, while the dependency queued for it:
+            await asyncio.wait_for(
+                asyncio.gather(*(handler(body=body, patch=kopf.Patch(), logger=mock.Mock()) for body in bodies)),
+                timeout=1,
+            )
+
+    asyncio.run(main())
+
+
+def _versioned(version: str, spec: dict, labels: dict) -> dict:
+    body = _body(spec, {})
+    body["metadata"] = {**body["metadata"], "uid": "1", "resourceVersion": version, "labels": labels}
+    return body
+
+
+def test_parse_reuses_the_model_of_the_same_version() -> None:
+    Widget._parsed.clear()
+    parsed = Widget.parse(_versioned("1", {"a": 1}, {}))
+    with mock.patch.object(Widget, "__init__", side_effect=AssertionError("parsed again")):
+        assert Widget.parse(_versioned("1", {"a": 1}, {})) is parsed
+
+
+def test_parse_reuses_the_spec_when_only_the_metadata_changed() -> None:
+    Widget._parsed.clear()
+    parsed = Widget.parse(_versioned("1", {"a": 1}, {"team": "a"}))
+    with mock.patch.object(Widget, "__init__", side_effect=AssertionError("parsed again")):
+        relabelled = Widget.parse(_versioned("2", {"a": 1}, {"team": "b"}))
+    assert relabelled is not parsed and relabelled.spec is parsed.spec
+    # The previous model, which may still be in use, is unchanged:
+    assert parsed.metadata["labels"] == {"team": "a"}
+    assert relabelled.metadata["labels"] == {"team": "b"}
+    assert relabelled.metadata is not parsed.metadata
+    respecified = Widget.parse(_versioned("3", {"a": 2}, {"team": "b"}))
+    assert isinstance(respecified.spec, WidgetSpec) and respecified.spec.a == 2
+
+
+def test_parsed_models_cannot_be_changed() -> None:
+    parsed = Widget.parse(_body({"a": 1}, {}))
+    with pytest.raises(TypeError):
+        parsed.metadata = {}
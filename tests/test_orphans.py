@@ -0,0 +1,46 @@
+import asyncio
+from types import SimpleNamespace
+from unittest import mock
+
+from elasticsearch_native_realm_operator import orphans
+from elasticsearch_native_realm_operator.constants import MANAGED_BY_KEY
+from elasticsearch_native_realm_operator.orphans import OrphanCollector, Owner, parse_managed_by
+from elasticsearch_native_realm_operator.resources.role import ElasticsearchNativeRealmRole
+from elasticsearch_native_realm_operator.scheduling import Priority, Scheduler
+
+
+def test_parse_managed_by() -> None:
+    assert parse_managed_by("team-a:ElasticsearchNativeRealmUser/jane") == Owner(
+        namespace="team-a", kind="ElasticsearchNativeRealmUser", name="jane"
+    )
+    assert parse_managed_by(None) is None
+    assert parse_managed_by("not-managed-by-the-operator") is None
+
+
+def test_orphans_are_confirmed_from_kubernetes() -> None:
+    roles = {
+        name: {"metadata": {MANAGED_BY_KEY: f"{namespace}:ElasticsearchNativeRealmRole/{name}"}}
+        for namespace, name in [("team-a", "deleted"), ("team-b", "unwatched")]
+    }
+    # Resources in namespaces watched by another deployment exist, but are not indexed:
+    existing = {("team-b", "unwatched"): {"metadata": {"namespace": "team-b", "name": "unwatched"}}}
+    security_cache = SimpleNamespace(refresh=mock.AsyncMock(return_value={"role": roles}))
+    read = mock.AsyncMock(side_effect=lambda namespace, name: existing.get((namespace, name)))
+    delete = mock.AsyncMock(side_effect=lambda name, cluster: roles.pop(name))
+    settings = SimpleNamespace(clusters=["default"])
+    scheduler = Scheduler(1, {priority: 1 for priority in Priority})
+    collector = OrphanCollector({ElasticsearchNativeRealmRole: delete}, interval=60, rate=1000)
+
+    async def main():
+        with mock.patch.object(orphans, "get_settings", lambda: settings), mock.patch.object(
+            orphans, "get_security_cache", lambda cluster: security_cache
+        ), mock.patch.object(orphans, "get_scheduler", lambda: scheduler), mock.patch.object(
+            ElasticsearchNativeRealmRole, "read", read
+        ):
+            for _ in range(3):
+                await collector.sweep()
+
+    asyncio.run(main())
+    delete.assert_awaited_once_with("deleted", "default")
+    # The unwatched namespace is read once, then skipped:
+    assert [call.args for call in read.await_args_list] == [("team-a", "deleted"), ("team-b", "unwatched")]
@@ -0,0 +1,21 @@
+from elasticsearch_native_realm_operator.ratelimit import AdaptiveTokenBucket, RateLimiter
+
+
+def test_bucket_adapts_to_overload() -> None:
+    bucket = AdaptiveTokenBucket(rate=10.0, min_rate=1.0, max_rate=11.0, latency_threshold=1.0, cooldown=60.0)
+    bucket.record_success(latency=0.1)
+    assert bucket.rate == 10.1
+    bucket.record_success(latency=2.0)
+    assert bucket.rate == 5.05
+    # Further overload within the cooldown is not counted again:
+    bucket.record_overload()
+    assert bucket.rate == 5.05
+
+
+def test_limiter_separates_reads_from_writes() -> None:
+    read = AdaptiveTokenBucket(rate=10.0, min_rate=1.0, max_rate=100.0)
+    write = AdaptiveTokenBucket(rate=10.0, min_rate=1.0, max_rate=100.0)
+    limiter = RateLimiter(read, write)
+    assert limiter.bucket("GET") is read
+    assert limiter.bucket("PUT") is write
+    assert limiter.bucket("DELETE") is write
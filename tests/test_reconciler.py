@@ -0,0 +1,59 @@
+import asyncio
+import logging
+from collections import defaultdict
+from unittest import mock
+
+from elasticsearch import NotFoundError
+
+from elasticsearch_native_realm_operator.cache import DocumentCache
+from elasticsearch_native_realm_operator.constants import MANAGED_BY_KEY
+from elasticsearch_native_realm_operator.kopf_ext import reconciler
+from elasticsearch_native_realm_operator.resources.role import role_reconciler
+
+OWNER = "default:ElasticsearchNativeRealmRole/reader"
+
+
+def test_remove_reads_the_cluster_rather_than_the_cache() -> None:
+    cache = DocumentCache(ttl=60, maxsize=10)
+    # Cached as absent, though it has since been created:
+    cache.set("reader", None)
+    role = {"cluster": [], "metadata": {MANAGED_BY_KEY: OWNER}}
+    get, delete = mock.AsyncMock(return_value={"reader": role}), mock.AsyncMock()
+
+    async def main():
+        with mock.patch.object(reconciler, "async_elasticsearch_client"), mock.patch.object(
+            role_reconciler, "cache", lambda cluster: cache
+        ), mock.patch.object(role_reconciler, "_get", get), mock.patch.object(role_reconciler, "_delete", delete):
+            await role_reconciler._remove(OWNER, "reader", "default", logging.getLogger(__name__))
+
+    asyncio.run(main())
+    delete.assert_awaited_once()
+    assert cache.get("reader") == (True, None)
+
+
+def _known(names: set[str]):
+    """Replace the objects known to exist in the default cluster, for use as a context manager."""
+    return mock.patch.object(role_reconciler, "known", defaultdict(set, {"default": set(names)}))
+
+
+def test_listing_forgets_objects_which_no_longer_exist() -> None:
+    async def list_roles(client):
+        # Put while the listing was in flight:
+        role_reconciler._mark_known(["created"], "default")
+        return {"reader": {}}
+
+    with _known({"reader", "deleted"}), mock.patch.object(reconciler, "async_elasticsearch_client"), mock.patch.object(
+        role_reconciler, "_list", list_roles
+    ):
+        asyncio.run(role_reconciler.list_all("default"))
+        assert role_reconciler.known["default"] == {"reader", "created"}
+
+
+def test_lookup_forgets_objects_which_are_not_found() -> None:
+    get = mock.AsyncMock(side_effect=NotFoundError(404, "not_found", {}))
+    cache = DocumentCache(ttl=60, maxsize=10)
+    with _known({"reader", "writer"}), mock.patch.object(reconciler, "async_elasticsearch_client"), mock.patch.object(
+        role_reconciler, "cache", lambda cluster: cache
+    ), mock.patch.object(role_reconciler, "_get", get):
+        assert asyncio.run(role_reconciler._fetch({"reader"}, "default")) == {}
+        assert role_reconciler.known["default"] == {"writer"}
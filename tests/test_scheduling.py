@@ -0,0 +1,62 @@
+import asyncio
+
+from elasticsearch_native_realm_operator.scheduling import Priority, Scheduler
+
+
+async def _run(scheduler: Scheduler, work: list[tuple[Priority, str]]) -> list[tuple[Priority, str]]:
+    """Queue all of the work behind a blocker holding the only slot, and return the order it was admitted in."""
+    admitted = []
+    release = asyncio.Event()
+
+    async def blocker():
+        async with scheduler.slot(Priority.INTERACTIVE, "blocker"):
+            await release.wait()
+
+    async def run(priority: Priority, namespace: str):
+        async with scheduler.slot(priority, namespace):
+            admitted.append((priority, namespace))
+            await asyncio.sleep(0)
+
+    blocking = asyncio.create_task(blocker())
+    await asyncio.sleep(0)
+    tasks = [asyncio.create_task(run(priority, namespace)) for priority, namespace in work]
+    await asyncio.sleep(0)
+    release.set()
+    await asyncio.gather(blocking, *tasks)
+    return admitted
+
+
+def _scheduler(concurrency: int = 1, **limits: int) -> Scheduler:
+    return Scheduler(concurrency, {priority: limits.get(priority.name.lower(), concurrency) for priority in Priority})
+
+
+def test_higher_priorities_are_admitted_first() -> None:
+    work = [(Priority.BACKGROUND, "a"), (Priority.REPAIR, "a"), (Priority.INTERACTIVE, "a")]
+    assert asyncio.run(_run(_scheduler(), work)) == sorted(work)
+
+
+def test_namespaces_take_turns() -> None:
+    work = [(Priority.BACKGROUND, "a")] * 3 + [(Priority.BACKGROUND, "b")]
+    assert [namespace for _, namespace in asyncio.run(_run(_scheduler(), work))] == ["a", "b", "a", "a"]
+
+
+def test_each_priority_is_limited() -> None:
+    scheduler = _scheduler(concurrency=3, background=1)
+
+    async def main():
+        running, peak = [0], [0]
+
+        async def run(priority: Priority):
+            async with scheduler.slot(priority, "a"):
+                running[0] += 1
+                peak[0] = max(peak[0], running[0])
+                await asyncio.sleep(0.01)
+                running[0] -= 1
+
+        started = asyncio.get_running_loop().time()
+        await asyncio.gather(*(run(Priority.BACKGROUND) for _ in range(3)), run(Priority.INTERACTIVE))
+        return peak[0], asyncio.get_running_loop().time() - started
+
+    peak, elapsed = asyncio.run(main())
+    assert peak == 2
+    assert elapsed >= 0.03
@@ -0,0 +1,92 @@
+import asyncio
+import json
+from typing import Union
+from unittest import mock
+
+import pytest
+from elasticsearch import Connection, ConnectionError, RequestError, TransportError
+
+from elasticsearch_native_realm_operator import transport
+from elasticsearch_native_realm_operator.ratelimit import AdaptiveTokenBucket, RateLimiter
+from elasticsearch_native_realm_operator.transport import ThrottledAsyncTransport
+
+Response = Union[int, Exception]
+
+
+class FakeConnection(Connection):
+    """Connection which answers each request with the next of the given statuses, or raises the given errors."""
+
+    def __init__(self, responses: list[Response], **kwargs):
+        super().__init__(**kwargs)
+        self.responses = responses
+
+    async def perform_request(self, method, url, params=None, body=None, timeout=None, ignore=(), headers=None):
+        # The client checks that it is talking to Elasticsearch before its first request:
+        if url == "/":
+            info = {"version": {"number": "7.14.1", "build_flavor": "default"}, "tagline": "You Know, for Search"}
+            return 200, {"X-Elastic-Product": "Elasticsearch"}, json.dumps(info)
+        response = self.responses.pop(0)
+        if isinstance(response, Exception):
+            raise response
+        if response >= 300:
+            self._raise_error(response, "{}")
+        return response, {}, "{}"
+
+
+def _bucket() -> AdaptiveTokenBucket:
+    return AdaptiveTokenBucket(rate=100.0, min_rate=1.0, max_rate=1000.0, cooldown=0.0)
+
+
+def _request(method: str, responses: list[Response]) -> tuple[RateLimiter, list[float]]:
+    """Make a request which is answered with the given responses, and return the limiter and backoff delays.
+
+    :raises TransportError: if the request fails once retries are exhausted.
+    """
+    limiter = RateLimiter(read=_bucket(), write=_bucket())
+    throttled = ThrottledAsyncTransport(
+        [{"host": "localhost"}], connection_class=FakeConnection, responses=responses, limiter=limiter
+    )
+    delays: list[float] = []
+
+    async def sleep(delay: float):
+        delays.append(delay)
+
+    async def main():
+        # Only the backoff between retries is skipped, not waits for the rate limit:
+        with mock.patch.object(transport, "asyncio", mock.Mock(wraps=asyncio, sleep=sleep)):
+            await throttled.perform_request(method, "/_security/role/reader")
+
+    try:
+        asyncio.run(main())
+    finally:
+        # Every response was used, so no request was made more or fewer times than expected:
+        assert responses == []
+    return limiter, delays
+
+
+@pytest.mark.parametrize("failure", [429, 503, ConnectionError("N/A", "Connection refused", None)])
+def test_transport_retries_with_backoff(failure: Response) -> None:
+    limiter, delays = _request("PUT", [failure, failure, 200])
+    assert delays == [0.5, 1.0]
+    if isinstance(failure, int):
+        # Overload cuts the rate of writes, without affecting reads:
+        assert limiter.write.rate < 100.0
+        assert limiter.read.rate == 100.0
+
+
+def test_transport_gives_up_after_the_maximum_retries() -> None:
+    with pytest.raises(TransportError) as info:
+        _request("PUT", [429, 429, 429, 429])
+    assert info.value.status_code == 429
+
+
+def test_transport_does_not_retry_client_errors() -> None:
+    with pytest.raises(RequestError):
+        _request("PUT", [400])
+
+
+def test_transport_raises_rate_after_prompt_responses() -> None:
+    limiter, delays = _request("GET", [200])
+    assert delays == []
+    assert limiter.read.rate > 100.0
+    assert limiter.write.rate == 100.0
@@ -0,0 +1,111 @@
+import asyncio
+import base64
+from contextlib import ExitStack
+from types import SimpleNamespace
+from typing import Optional
+from unittest import mock
+
+import kopf
+import pytest
+from kubernetes.client import ApiClient
+from kubernetes.client.exceptions import ApiException
+
+from elasticsearch_native_realm_operator import client, clusters
+from elasticsearch_native_realm_operator.cache import DocumentCache
+from elasticsearch_native_realm_operator.constants import MANAGED_BY_KEY
+from elasticsearch_native_realm_operator.kopf_ext import reconciler
+from elasticsearch_native_realm_operator.resources.user import ElasticsearchNativeRealmUser, user_reconciler
+
+
+def _user(spec: dict) -> ElasticsearchNativeRealmUser:
+    return ElasticsearchNativeRealmUser.parse_obj(
+        {
+            "apiVersion": f"{ElasticsearchNativeRealmUser.group}/v1",
+            "kind": ElasticsearchNativeRealmUser.names.kind,
+            "metadata": {"namespace": "default", "name": "jane", "uid": "1"},
+            "spec": {"user": {"username": "jane", "roles": []}, "clusters": ["default"], **spec},
+        }
+    )
+
+
+def _update(resource: ElasticsearchNativeRealmUser, diff: list[tuple], stored: Optional[dict] = None) -> mock.Mock:
+    """Update a user, which is stored in the cluster as given, and return the client it was written with."""
+    client = mock.Mock()
+    client.security.put_user = mock.AsyncMock()
+    cache = DocumentCache(ttl=60, maxsize=10, compact=user_reconciler.compact)
+    cache.set("jane", stored)
+    settings = SimpleNamespace(clusters={"default": None})
+    with ExitStack() as stack:
+        stack.enter_context(mock.patch.object(clusters, "get_settings", lambda: settings))
+        stack.enter_context(mock.patch.object(reconciler, "async_elasticsearch_client", lambda cluster: client))
+        stack.enter_context(mock.patch.object(user_reconciler, "cache", lambda cluster: cache))
+        update = resource.update(
+            namespace="default", logger=mock.Mock(), diff=diff, body=kopf.Body({}), patch=kopf.Patch()
+        )
+        asyncio.run(update)
+    return client
+
+
+@pytest.mark.parametrize("operation", ["add", "change"])
+def test_password_hash_is_written_when_added_or_changed(operation: str) -> None:
+    stored = {
+        "username": "jane",
+        "roles": [],
+        "metadata": {MANAGED_BY_KEY: "default:ElasticsearchNativeRealmUser/jane"},
+        "enabled": True,
+    }
+    resource = _user({"user": {"username": "jane", "roles": [], "password_hash": "hash"}})
+    client = _update(resource, [(operation, ("spec", "user", "password_hash"), None, "hash")], stored)
+    client.security.put_user.assert_awaited_once()
+    assert client.security.put_user.await_args.kwargs["body"]["password_hash"] == "hash"
+
+
+@pytest.mark.parametrize(
+    "operation, old, new", [("add", None, "jane"), ("change", "jane", "john"), ("remove", "jane", None)]
+)
+def test_secret_name_cannot_be_added_changed_or_removed(operation: str, old: str, new: str) -> None:
+    resource = _user({"secretName": new} if new else {"user": {"username": "jane", "roles": [], "password_hash": "h"}})
+    with pytest.raises(kopf.PermanentError):
+        _update(resource, [(operation, ("spec", "secretName"), old, new)])
+
+
+class FakeSecrets:
+    """Secret API, holding a secret created by a previous attempt to create the credentials."""
+
+    def __init__(self, secret: dict):
+        self.secret = secret
+        self.api_client = ApiClient()
+
+    def create_namespaced_secret(self, namespace: str, body: dict):
+        raise ApiException(status=409, reason="AlreadyExists")
+
+    def read_namespaced_secret(self, name: str, namespace: str):
+        assert (namespace, name) == ("default", self.secret["metadata"]["name"])
+        return self.secret
+
+
+def _encode(value: str) -> str:
+    return base64.b64encode(value.encode()).decode()
+
+
+def _ensure_credentials_secret(owner: str, username: str) -> str:
+    """Ensure the credentials secret of a user, when creating it conflicts with an existing secret."""
+    secrets = FakeSecrets(
+        {
+            "metadata": {"name": "jane", "namespace": "default", "ownerReferences": [{"uid": owner}]},
+            "data": {"username": _encode(username), "password": _encode("existing")},
+        }
+    )
+    resource = _user({"secretName": "jane"})
+    with mock.patch.object(client, "kubernetes_client", lambda: secrets):
+        return asyncio.run(resource._ensure_credentials_secret("default", kopf.Body(resource.dict())))
+
+
+def test_credentials_secret_of_a_previous_attempt_is_reused() -> None:
+    assert _ensure_credentials_secret(owner="1", username="jane") == "existing"
+
+
+@pytest.mark.parametrize("owner, username", [("2", "jane"), ("1", "john")])
+def test_credentials_secret_of_another_resource_or_user_is_not_reused(owner: str, username: str) -> None:
+    with pytest.raises(kopf.PermanentError):
+        _ensure_credentials_secret(owner, username)